@@ -0,0 +1,200 @@
+# lib/batch.py
+
+import inspect
+import io
+import json
+import shlex
+import sqlite3
+import sys
+from contextlib import redirect_stdout
+
+from models.compendium import get_compendium
+from models.database import DEFAULT_DB
+from models.journal import flush_journals
+from models.player import Player
+from models.schema import migrate
+from models.tracing import action
+
+USAGE = {
+    "summon": "summon <player> [xN]",
+    "fuse": "fuse <player> <number> <number>",
+    "preview": "preview <player>",
+    "release": "release <player> <numbers>",
+    "release-below": "release-below <player> <level>",
+    "fuse-chain": "fuse-chain <player> <number> <number> [<number> ...]",
+    "stock": "stock <player>",
+    "level": "level <player>",
+    "plan": "plan <player> <persona id or name>",
+}
+
+
+class BatchError(Exception):
+    """A command in a batch script could not be run."""
+
+
+def parse_selection(text):
+    """
+    Turn a selection of stock numbers such as '2', '1,4' or '1-3,6' into a list of numbers.
+
+    :raise ValueError: If the selection is not made of numbers and ranges.
+    """
+    numbers = []
+    for part in text.replace(" ", "").split(","):
+        first, dash, last = part.partition("-")
+        if not first.isdigit() or (dash and not last.isdigit()):
+            raise ValueError(f"'{text}' is not a selection, use e.g. 2, 1,4 or 1-3,6.")
+        numbers.extend(range(int(first), int(last or first) + 1))
+    return list(dict.fromkeys(numbers))
+
+
+class BatchSession:
+    def __init__(self, db_name=DEFAULT_DB):
+        """
+        Run Velvet Room commands without prompts, on one long-lived DB session.
+
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        """
+        self.db_name = db_name
+        self.players = {}  # Players already loaded in this session, by name
+        migrate(db_name)
+
+    def get_player(self, name):
+        """Return the Player with this name, loading or creating them on first use."""
+        player = self.players.get(name)
+        if player is None:
+            player = self.players[name] = Player.get_or_create_player(name, db_name=self.db_name)
+        return player
+
+    def _persona_by_number(self, player, number):
+        """Private helper to turn a stock number argument into a Persona."""
+        if not number.isdigit():
+            raise BatchError(f"'{number}' is not a stock number.")
+        persona = player.get_persona_by_number(int(number))
+        if persona is None:
+            raise BatchError(f"There is no persona number {number} in {player.name}'s stock.")
+        return persona
+
+    def summon(self, player, count="x1"):
+        """Summon count personas ('xN') at once and return the ones that joined the stock."""
+        if not (count.startswith("x") and count[1:].isdigit()):
+            raise BatchError(f"'{count}' is not a summon count, use e.g. x5.")
+        if int(count[1:]) == 1:
+            persona = player.summon_persona()
+            return [persona.to_dict()] if persona else []
+        return [persona.to_dict() for persona in player.summon_personas(int(count[1:]))]
+
+    def fuse(self, player, number_1, number_2):
+        """Fuse two personas picked by stock number and return the result."""
+        persona_1 = self._persona_by_number(player, number_1)
+        persona_2 = self._persona_by_number(player, number_2)
+        new_persona = player.fuse_personas(persona_1.id, persona_2.id)
+        if new_persona is None:
+            raise BatchError("Fusion failed.")
+        return new_persona.to_dict()
+
+    def preview(self, player):
+        """Return every fusion the player's stock allows and how many personas each can yield."""
+        return [
+            {"numbers": [number_1, number_2], "candidates": count}
+            for number_1, number_2, count in player.preview_fusions()
+        ]
+
+    def release(self, player, numbers):
+        """Release the personas with these stock numbers ('2', '1,4' or '1-3') and return them."""
+        personas = [self._persona_by_number(player, str(number)) for number in parse_selection(numbers)]
+        player.release_personas(personas)
+        return [persona.to_dict() for persona in personas]
+
+    def release_below(self, player, level):
+        """Release every persona below a level and return how many were released."""
+        if not level.isdigit():
+            raise BatchError(f"'{level}' is not a level.")
+        return player.release_where(below_level=int(level))
+
+    def fuse_chain(self, player, *numbers):
+        """Fuse a chain of personas picked by stock number and return the final result."""
+        if len(numbers) < 2:
+            raise BatchError(f"Usage: {USAGE['fuse-chain']}")
+        personas = [self._persona_by_number(player, number) for number in numbers]
+        new_persona = player.fuse_chain([persona.id for persona in personas])
+        if new_persona is None:
+            raise BatchError("Fusion chain failed.")
+        return new_persona.to_dict()
+
+    def stock(self, player):
+        """Return the player's stock."""
+        return [persona.to_dict() for persona in player.stock.get_personas_in_stock()]
+
+    def level(self, player):
+        """Return the player's level."""
+        return player.get_player_level()
+
+    def plan(self, player, target):
+        """Return the shortest route of summons and fusions to a target persona."""
+        compendium = get_compendium(self.db_name)
+        persona = compendium.get(int(target)) if target.isdigit() else compendium.find(target)
+        if persona is None:
+            raise BatchError(f"There is no persona '{target}'.")
+        steps = player.plan_fusion(persona)
+        if steps is None:
+            raise BatchError(f"{persona.name} cannot be reached.")
+        return [step.to_dict() for step in steps]
+
+    def run_command(self, line):
+        """
+        Run one command line and return a result record.
+
+        :param line: A command such as 'summon Yu x3' (str).
+        :return: A dict with the command, whether it succeeded, its result and
+                 anything the models printed while running it.
+        """
+        record = {"command": line, "ok": False}
+        messages = io.StringIO()
+        try:
+            args = shlex.split(line)
+            name = args[0]
+            if name not in USAGE:
+                raise BatchError(f"Unknown command '{name}'.")
+            if len(args) < 2:
+                raise BatchError(f"Usage: {USAGE[name]}")
+            command = getattr(self, name.replace("-", "_"))
+            try:
+                inspect.signature(command).bind(None, *args[2:])
+            except TypeError:
+                raise BatchError(f"Usage: {USAGE[name]}")
+            player = self.get_player(args[1])
+            with action(name), redirect_stdout(messages):
+                record["result"] = command(player, *args[2:])
+            record["ok"] = True
+        except (BatchError, ValueError, sqlite3.Error) as e:
+            record["error"] = str(e)
+        record["messages"] = messages.getvalue().splitlines()
+        return record
+
+    def run(self, lines, out=None, wait_for_input=False):
+        """
+        Run every command in lines, writing one JSON result per line to out.
+
+        Blank lines and lines starting with '#' are skipped. A journal, if
+        enabled, is group-committed between commands once its events are due.
+
+        :param wait_for_input: Set it when reading the next line may block (e.g.
+                               stdin): every command's events are then committed
+                               before reading on (bool).
+
+        :return: The number of commands that failed (int).
+        """
+        out = out or sys.stdout
+        failures = 0
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            record = self.run_command(line)
+            record["line"] = line_number
+            failures += not record["ok"]
+            flush_journals(due_only=not wait_for_input)
+            out.write(json.dumps(record) + "\n")
+            if wait_for_input:
+                out.flush()
+        return failures
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# lib/bench.py
+
+import argparse
+import builtins
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import cli
+import seed
+from models.database import close_all, get_connection, transaction
+from models.player import Player
+from models.stock import Stock
+
+BENCH_PLAYER = "bench"
+
+
+def _reset_bench_player(db_name, stock_ids=()):
+    """Private helper to give the bench player an exact stock and level before an operation."""
+    conn = get_connection(db_name)
+    player_id = conn.execute("SELECT id FROM players WHERE name = ?", (BENCH_PLAYER,)).fetchone()[0]
+    with transaction(db_name):
+        conn.execute("DELETE FROM player_stock WHERE player_id = ?", (player_id,))
+        conn.executemany("INSERT INTO player_stock (player_id, persona_id) VALUES (?, ?)",
+                         [(player_id, persona_id) for persona_id in stock_ids])
+        conn.execute("UPDATE players SET level = 50 WHERE id = ?", (player_id,))
+    return player_id
+
+
+def _fusion_pair(db_name):
+    """Private helper returning two persona ids from different arcanas."""
+    return get_connection(db_name).execute("""
+        SELECT first.id, second.id
+        FROM personas AS first
+        JOIN personas AS second ON second.arcana_id != first.arcana_id
+        LIMIT 1
+    """).fetchone()
+
+
+def _returned_persona(result):
+    """Private helper checking that a timed operation really summoned or fused a persona."""
+    if result is None:
+        raise RuntimeError("the operation returned no persona, so the timing would measure a failure path")
+
+
+def build_operations(db_name):
+    """
+    Return the benchmarked operations as name -> (setup, operation, check) triples.
+
+    setup() runs untimed before every call and returns the arguments that are
+    passed to operation(), which is the only part that is timed. check, if
+    not None, is called with what operation() returned and raises if the call
+    did not do the work it is meant to measure.
+    """
+    player = Player.get_or_create_player(BENCH_PLAYER, db_name=db_name)
+    pair = _fusion_pair(db_name)
+    stock_ids = [persona_id for persona_id, in get_connection(db_name).execute(
+        "SELECT id FROM personas WHERE id NOT IN (?, ?) LIMIT 6", pair)]
+
+    def summon_setup():
+        _reset_bench_player(db_name, stock_ids[:4])
+        return (Stock(db_name=db_name, player_id=player.player_id),)
+
+    def fuse_setup():
+        _reset_bench_player(db_name, list(pair) + stock_ids[:2])
+        # The reset commits on our own connection, which data_version() does not see
+        player.stock.snapshot.invalidate()
+        player.level = 50
+        return pair
+
+    def stock_setup():
+        _reset_bench_player(db_name, stock_ids)
+        return (Stock(db_name=db_name, player_id=player.player_id),)
+
+    def number_setup():
+        _reset_bench_player(db_name, stock_ids)
+        player.stock.snapshot.invalidate()
+        return (len(stock_ids),)
+
+    return {
+        "stock.summon_persona": (summon_setup, lambda stock: stock.summon_persona(), _returned_persona),
+        "player.fuse_personas": (fuse_setup, player.fuse_personas, _returned_persona),
+        "stock.list_stock": (stock_setup, lambda stock: stock.list_stock(), None),
+        "player.get_persona_by_number": (number_setup, player.get_persona_by_number, _returned_persona),
+        "cli.view_all_arcanas": (lambda: (), lambda: cli.view_all_arcanas(db_name), None),
+    }
+
+
+def time_operation(setup, operation, iterations, warmup=3, check=None):
+    """
+    Time one operation and return summary statistics in milliseconds.
+
+    Anything the operation prints is discarded, and prompts are answered with
+    "1" so interactive views can be timed too. check(result), if given, runs
+    untimed after every call, warm-up included.
+    """
+    samples = []
+    real_input = builtins.input
+    builtins.input = lambda prompt="": "1"
+    try:
+        with redirect_stdout(io.StringIO()) as sink:
+            for iteration in range(warmup + iterations):
+                args = setup()
+                started = time.perf_counter()
+                result = operation(*args)
+                elapsed = time.perf_counter() - started
+                if check is not None:
+                    check(result)
+                if iteration >= warmup:
+                    samples.append(elapsed * 1000)
+                sink.seek(0)
+                sink.truncate()
+    finally:
+        builtins.input = real_input
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(samples),
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "ops_per_sec": 1000 / statistics.fmean(samples) if statistics.fmean(samples) else None,
+    }
+
+
+def run(db_name, scale, iterations, only=None):
+    """Generate the database, time every operation and return the report dict."""
+    generated = seed.generate(db_name, **scale)
+    operations = build_operations(db_name)
+    results = {}
+    for name, (setup, operation, check) in operations.items():
+        if only and name not in only:
+            continue
+        results[name] = time_operation(setup, operation, iterations, check=check)
+    return {
+        "meta": {
+            "scale": generated,
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Compare a report with a baseline report.
+
+    :return: A list of (operation, baseline_ms, current_ms) for every operation
+             whose median got slower by more than threshold (a fraction).
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if before and result["median_ms"] > before["median_ms"] * (1 + threshold):
+            regressions.append((name, before["median_ms"], result["median_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Velvet Room hot paths.")
+    seed.add_arguments(parser)
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per operation")
+    parser.add_argument("--only", action="append", help="only run this operation (repeatable)")
+    parser.add_argument("--db", help="database file to generate (default: a temporary file)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown before --compare fails, as a fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    scale = {"personas": args.personas, "arcanas": args.arcanas, "players": args.players,
+             "stock_fill": args.stock_fill, "seed": args.seed}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_name = args.db or os.path.join(workdir, "bench.db")
+        report = run(db_name, scale, args.iterations, args.only)
+        close_all()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# lib/build_compendium.py
+
+import argparse
+import sys
+
+from models.compendium import Compendium
+from models.compendium_file import write_compendium_file
+from models.database import DEFAULT_DB
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Save the persona and arcana catalog to a file that cli.py --compendium can map at startup.")
+    parser.add_argument("output", help="compendium file to write")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database to read the catalog from (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    count = write_compendium_file(Compendium.load(args.db), args.output)
+    print(f"Wrote {count} persona(s) to {args.output}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,57 @@
+import argparse
 import sqlite3
+from batch import BatchSession, parse_selection
+from models.compendium import get_compendium
+from models.compendium_file import use_compendium_file
+from models.database import DEFAULT_DB, close_all, enable_concurrency, format_contention
+from models.journal import close_journals, enable_journal, flush_journals
 from models.player import Player
-from models.stock import Stock
+from models.schema import migrate
+from models.sharding import check_shard_count, enable_sharding, shards_of
+from models.stats import arcana_distribution, leaderboard, player_rank, stock_count, totals
+from models.storage import SNAPSHOT_INTERVAL_SECONDS, close_all_memory, start_snapshots, use_memory
+from models.tracing import action, disable_tracing, enable_tracing
+from server import run_server
 import sys
 sys.path.insert(0, 'lib')
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace or args.trace_json:
+        enable_tracing()
+    try:
+        if args.shards:
+            enable_sharding(args.shards)
+        else:
+            check_shard_count(None)
+    except ValueError as error:
+        sys.exit(f"error: {error}")
+    if args.memory:
+        use_memory()
+        start_snapshots(interval=args.snapshot_every)
+    if args.wal:
+        for db_name in shards_of():
+            enable_concurrency(db_name)
+    if args.compendium:
+        use_compendium_file(args.compendium)
+    if args.journal:
+        enable_journal(args.journal)
+    try:
+        if args.batch:
+            run_batch(args.batch)
+        elif args.serve or args.unix:
+            run_server(args.serve, args.unix)
+        else:
+            play()
+    finally:
+        close_journals()
+        close_all_memory()
+        report_trace(args)
+        if args.wal:
+            print(format_contention(), file=sys.stderr)
+
+def play():
+    """Run the interactive menu loop."""
     print("Welcome to The Velvet Room!")
     print("""
                    -..:--=::-+                 
@@ -34,7 +81,8 @@ def main():
 
     while True:
         # Display player level at the top
-        display_player_level(player)
+        with action("display level"):
+            display_player_level(player)
 
         print("\nMain Menu:")
         print("1. View Stock")
@@ -42,26 +90,134 @@ def main():
         print("3. Summon a Persona")
         print("4. Release a Persona")
         print("5. Fuse Personas")
-        print("6. Exit Game")
+        print("6. Preview Fusions")
+        print("7. Summon Several Personas")
+        print("8. Fuse a Chain of Personas")
+        print("9. View Statistics")
+        print("10. Plan a Route to a Persona")
+        print("11. Exit Game")
 
-        choice = input("Choose an option (1-6): ")
+        # Commit the journaled events of the last action before waiting on the player
+        flush_journals()
+        choice = input("Choose an option (1-11): ")
         
         if choice == "1":
-             view_stock(player)
+            with action("view stock"):
+                view_stock(player)
         elif choice == "2":
-            view_all_arcanas()
+            with action("view arcanas"):
+                view_all_arcanas()
         elif choice == "3":
-            summon_persona(player)
+            with action("summon"):
+                summon_persona(player)
         elif choice == "4":
-            release_persona(player)
+            with action("release"):
+                release_persona(player)
         elif choice == "5":
-            fuse_personas(player)
+            with action("fuse"):
+                fuse_personas(player)
         elif choice == "6":
+            with action("preview fusions"):
+                player.preview_fusions()
+        elif choice == "7":
+            with action("summon several"):
+                summon_several_personas(player)
+        elif choice == "8":
+            with action("fuse chain"):
+                fuse_chain(player)
+        elif choice == "9":
+            with action("view statistics"):
+                view_statistics(player)
+        elif choice == "10":
+            with action("plan route"):
+                plan_route(player)
+        elif choice == "11":
             print("Goodbye! We look forward to your next visit.")
+            close_journals()
+            close_all()
             break
         else:
             print("Invalid option. Please try again.")
 
+def parse_args(argv=None):
+    """Parse the command line options."""
+    parser = argparse.ArgumentParser(description="The Velvet Room")
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="run commands from FILE ('-' for stdin) without prompts and print JSON results",
+    )
+    parser.add_argument(
+        "--serve", metavar="[HOST:]PORT",
+        help="serve the game to many players over a TCP line protocol",
+    )
+    parser.add_argument(
+        "--unix", metavar="PATH",
+        help="serve the game over a Unix socket at PATH instead of TCP",
+    )
+    parser.add_argument(
+        "--wal", action="store_true",
+        help="use WAL journaling, short busy timeouts and lock retries, for several processes sharing the database",
+    )
+    parser.add_argument(
+        "--memory", action="store_true",
+        help="keep the database in memory and write it back with the SQLite backup API periodically and on exit",
+    )
+    parser.add_argument(
+        "--snapshot-every", metavar="SECONDS", type=float, default=SNAPSHOT_INTERVAL_SECONDS,
+        help="seconds between snapshots of an in-memory database (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shards", metavar="N", type=int,
+        help="keep player state in N shard files that attach the catalog read-only, so their writes do not share a lock",
+    )
+    parser.add_argument(
+        "--compendium", metavar="FILE",
+        help="read the persona catalog from FILE (see build_compendium.py) instead of the database",
+    )
+    parser.add_argument(
+        "--journal", metavar="FILE",
+        help="record stock and level changes in the append-only journal FILE and apply them in group commits",
+    )
+    parser.add_argument(
+        "--trace", action="store_true",
+        help="print the queries, rows and commits each action cost when the program exits",
+    )
+    parser.add_argument(
+        "--trace-json", metavar="FILE",
+        help="write the per-action query trace to FILE as JSON when the program exits",
+    )
+    args = parser.parse_args(argv)
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.shards and (args.memory or args.journal):
+        parser.error("--shards cannot be combined with --memory or --journal")
+    if args.wal and args.memory:
+        # An in-memory database has no WAL, so the flag would report a mode that is not in effect
+        parser.error("--wal cannot be combined with --memory")
+    return args
+
+def report_trace(args):
+    """Print and/or export the query trace, if tracing was turned on."""
+    tracer = disable_tracing()
+    if tracer is None:
+        return
+    if args.trace:
+        print(tracer.format_report(), file=sys.stderr)
+    if args.trace_json:
+        tracer.export_json(args.trace_json)
+
+def run_batch(path):
+    """Run a batch script of commands and exit non-zero if any of them failed."""
+    session = BatchSession()
+    if path == "-":
+        failures = session.run(sys.stdin, wait_for_input=True)
+    else:
+        with open(path) as script:
+            failures = session.run(script)
+    close_all()
+    if failures:
+        sys.exit(1)
+
 def display_player_level(player):
     """Display the current player level in the top right corner."""
     level = player.get_player_level()
@@ -69,67 +225,88 @@ def display_player_level(player):
 
 def initialize_player():
     """Initialize the player by getting their ID and name."""
+    # Create or upgrade the schema before the first query touches it
+    migrate()
+
     player_name = input("Enter your player name: ")
 
-    # Check if player already exists
-    conn = sqlite3.connect("velvetRoom.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, stock_limit FROM players WHERE name = ?", (player_name,))
-    player_data = cursor.fetchone()
+    # Load the player if they already exist, otherwise create a new one
+    return Player.get_or_create_player(player_name)
 
-    if player_data:
-        # Player exists, use existing player data
-        player_id, stock_limit = player_data
-        player = Player(player_id=player_id, stock_limit=stock_limit,)
-    else:
-        # Player doesn't exist, create a new one
-        cursor.execute("INSERT INTO players (name, level, stock_limit) VALUES (?, ?, ?)", 
-                       (player_name, 1, 8))  # Default level 1 and stock limit 8
-        player_id = cursor.lastrowid
-        player = Player(player_id=player_id, name=player_name, stock_limit=8)  # New player with default stock_limit
-        conn.commit()
-
-    conn.close()
-    return player
-
-def view_stock(player):
-    """View the player's stock of personas."""
-    stock = Stock(player_id=player.player_id)
-    stock_list = stock.list_stock()
-
-    if stock_list:
-        print("Your Stock:")
-        for persona in stock_list:
-            print(f"Name: {persona[0]}, Level: {persona[1]}, Arcana: {persona[2]}")
-    # else:
-    #     print("Your stock is empty.")
+def browse(fetch, prompt):
+    """
+    Show a listing one page at a time and let the user move between pages.
+
+    :param fetch: Function that lists a page and returns it; called with
+                  after= or before= the key of the page being left.
+    :param prompt: What to ask for once the user stops paging (str).
+    :return: The user's answer to the prompt (str).
+    """
+    page = fetch()
+    while True:
+        moves = []
+        if page and page.has_next:
+            moves.append("'n' next page")
+        if page and page.has_previous:
+            moves.append("'p' previous page")
+        hint = f" ({', '.join(moves)})" if moves else ""
+        answer = input(f"{prompt}{hint}: ").strip()
+        if answer == "n" and page and page.has_next:
+            page = fetch(after=page.last_key)
+        elif answer == "p" and page and page.has_previous:
+            page = fetch(before=page.first_key)
+        else:
+            return answer
+
+def view_stock(player, prompt="Press Enter to go back"):
+    """View the player's stock of personas a page at a time and return the answer to prompt."""
+    return browse(player.list_stock, prompt)
 def summon_persona(player):
     """Summon a random persona."""
     print("\nSummoning a persona...")
     player.summon_persona()
 
+def summon_several_personas(player):
+    """Summon several personas at once."""
+    count = input("How many personas do you want to summon? ").strip()
+    if not count.isdigit() or int(count) < 1:
+        print("Please enter a valid number.")
+        return
+    print(f"\nSummoning {count} personas...")
+    player.summon_personas(int(count))
+
 def release_persona(self):
-    """Release a persona from the player's stock."""
-    self.list_stock()  # Display the personas in a numbered list
-    selection = input("Enter the number of the persona you want to release: ")
-
-    if selection.isdigit():
-        selection = int(selection)
-        persona = self.get_persona_by_number(selection)  # Fetch persona by number
-        if persona:
-            self.remove_persona_from_stock(persona)  # Remove the selected persona from stock
-            print(f"You have released {persona.name}!")
+    """Release one or more personas from the player's stock."""
+    # Display the personas in a numbered list, a page at a time
+    selection = browse(self.list_stock, "Enter the number(s) of the persona(s) to release (e.g. 2, 1,4 or 1-3), "
+                                        "or 'below <level>'")
+
+    if selection.startswith("below"):
+        level = selection[len("below"):].strip()
+        if level.isdigit():
+            self.release_where(below_level=int(level))
         else:
-            print("Invalid selection.")
-    else:
+            print("Please enter a valid level.")
+        return
+
+    try:
+        numbers = parse_selection(selection)
+    except ValueError:
         print("Please enter a valid number.")
+        return
+    personas = [self.get_persona_by_number(number) for number in numbers]  # Fetch personas by number
+    if personas and all(personas):
+        self.release_personas(personas)  # Remove the selected personas from stock with one write
+    else:
+        print("Invalid selection.")
 
 def fuse_personas(player):
     """Fuse two personas in the player's stock."""
     print("\nFusing personas...")
-    view_stock(player)  # Show stock to help the user choose
+    # Show stock to help the user choose
+    first = view_stock(player, "Enter the number of the first persona")
     try:
-        persona_num_1 = int(input("Enter the number of the first persona: ").strip())
+        persona_num_1 = int(first)
         persona_num_2 = int(input("Enter the number of the second persona: ").strip())
     except ValueError:
         print("Invalid input. Please enter a valid number.")
@@ -149,14 +326,57 @@ def fuse_personas(player):
         print("Fusion successful!")
     else:
         print("Fusion failed. Ensure the conditions are met.")
-def view_all_arcanas():
+def fuse_chain(player):
+    """Fuse a chain of personas in the player's stock."""
+    print("\nFusing a chain of personas...")
+    # Show stock to help the user choose
+    numbers = view_stock(player, "Enter the numbers of the personas to fuse, in order (e.g. 1 3 2)")
+    numbers = numbers.replace(",", " ").split()
+    if len(numbers) < 2 or not all(number.isdigit() for number in numbers):
+        print("Invalid input. Please enter at least two valid numbers.")
+        return
+
+    personas = [player.get_persona_by_number(int(number)) for number in numbers]
+    if not all(personas):
+        print("Invalid selection. Please try again.")
+        return
+
+    if player.fuse_chain([persona.id for persona in personas]):
+        print("Fusion successful!")
+    else:
+        print("Fusion failed. Ensure the conditions are met.")
+
+def plan_route(player):
+    """Plan the fewest summons and fusions that can bring a chosen persona into the stock."""
+    target = input("Enter the name or id of the persona you want: ").strip()
+    compendium = get_compendium(player.db_name)
+    persona = compendium.get(int(target)) if target.isdigit() else compendium.find(target)
+    if persona is None:
+        print("There is no persona with that name or id.")
+        return
+    player.plan_fusion(persona)
+
+def view_statistics(player, limit=10):
+    """Show the level leaderboard, the player's own standing and the arcana distribution."""
+    players, owned = totals(player.db_name)
+    print(f"\n--- Leaderboard ({players} players) ---")
+    for rank, name, level, personas in leaderboard(limit, player.db_name):
+        print(f"{rank}. {name} (Level: {level}, Stock: {personas})")
+
+    level = player.get_player_level()
+    print(f"You are ranked {player_rank(level, player.db_name)} at level {level}, "
+          f"with {stock_count(player.player_id, player.db_name)} persona(s) in your stock.")
+
+    print(f"\n--- Arcanas in all stocks ({owned} personas) ---")
+    for _, arcana_name, personas in arcana_distribution(player.db_name):
+        print(f"{arcana_name}: {personas} ({personas / owned:.0%})")
+
+def view_all_arcanas(db_name=DEFAULT_DB):
     """List all arcanas and allow the user to view associated personas."""
-    conn = sqlite3.connect('velvetRoom.db')
-    cursor = conn.cursor()
+    compendium = get_compendium(db_name)
 
     try:
-        cursor.execute("SELECT id, name FROM arcanas")
-        arcanas = cursor.fetchall()
+        arcanas = sorted(compendium.arcanas.items())
 
         if not arcanas:
             print("No arcanas available.")
@@ -172,20 +392,20 @@ def view_all_arcanas():
             print("Invalid input. Please enter a valid number.")
             return
 
-        cursor.execute("SELECT name, level FROM personas WHERE arcana_id = ?", (arcana_id,))
-        personas = cursor.fetchall()
-
-        if personas:
+        def list_personas(after=None, before=None):
+            page = compendium.page_in_arcana(arcana_id, after=after, before=before)
             print(f"\n--- Personas of Arcana {arcana_id} ---")
-            for persona in personas:
-                print(f"- {persona[0]} (Level: {persona[1]})")
+            for number, persona in page.numbered():
+                print(f"{number}. {persona.name} (Level: {persona.level})")
+            return page
+
+        if compendium.page_in_arcana(arcana_id, limit=1):
+            browse(list_personas, "Press Enter to go back")
         else:
             print("No personas available for the selected arcana.")
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-    finally:
-        conn.close()
 
 
 if __name__ == "__main__":
@@ -1,4 +0,0 @@
-import sqlite3
-
-CONN = sqlite3.connect('velvetRoom.db')
-CURSOR = CONN.cursor()
@@ -1,36 +1,39 @@
-import sqlite3
+from models.catalog import bump_generation, cached
+from models.database import DEFAULT_DB, get_connection, transaction
 
 class Arcana:
-    def __init__(self, db_name='velvetRoom.db'):
+    def __init__(self, db_name=DEFAULT_DB):
         """Initialize with the database name (default is 'game.db')."""
         self.db_name = db_name
 
     def _connect(self):
-        """Private method to establish a connection to the SQLite database."""
-        return sqlite3.connect(self.db_name)
+        """Private method to get the shared connection to the SQLite database."""
+        return get_connection(self.db_name)
 
     def get_all_arcanas(self):
-        """Retrieve all arcanas from the database."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM arcanas")
-        arcanas = cursor.fetchall()  # Fetch all rows
-        conn.close()
-        return arcanas
+        """Retrieve all arcanas, from the catalog cache or the database on a miss."""
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM arcanas")
+            return cursor.fetchall()  # Fetch all rows
+
+        return list(cached(self.db_name, ("arcanas",), load))
 
     def get_arcana_by_id(self, arcana_id):
-        """Retrieve an arcana by its ID."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM arcanas WHERE id = ?", (arcana_id,))
-        arcana = cursor.fetchone()  # Fetch the first matching row
-        conn.close()
-        return arcana
+        """Retrieve an arcana by its ID, from the catalog cache or the database on a miss."""
+        def load():
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM arcanas WHERE id = ?", (arcana_id,))
+            return cursor.fetchone()  # Fetch the first matching row
+
+        return cached(self.db_name, ("arcana", arcana_id), load)
 
     def update_arcana_name(self, arcana_id, new_name):
         """Update the name of an arcana by its ID."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE arcanas SET name = ? WHERE id = ?", (new_name, arcana_id))
-        conn.commit()  # Commit the transaction
-        conn.close()
+        with transaction(self.db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE arcanas SET name = ? WHERE id = ?", (new_name, arcana_id))
+            # Cached lookups and the compendium index are rebuilt once this commits
+            bump_generation(self.db_name)
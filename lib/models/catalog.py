@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+from models.database import DEFAULT_DB, after_commit
+from models.sharding import catalog_of
+
+# Most catalog lookups kept by the process-wide LRU cache
+CACHE_SIZE = 4096
+
+# db_name -> catalog generation. Anything derived from the arcanas and
+# personas tables (the LRU entries below, the compendium index) remembers the
+# generation it was built at and is rebuilt once the generation moves on.
+# Shards share their catalog's generation and cache entries.
+_generations = {}
+_lock = threading.Lock()
+
+
+def generation(db_name=DEFAULT_DB):
+    """Return the current catalog generation of db_name (int)."""
+    return _generations.get(catalog_of(db_name), 0)
+
+
+def bump_generation(db_name=DEFAULT_DB):
+    """
+    Mark every cached copy of db_name's catalog as stale.
+
+    Call it after writing to the arcanas or personas tables (other than
+    ownership). Inside a transaction the bump waits for the commit, so no
+    other thread can cache the old rows under the new generation.
+    """
+    catalog = catalog_of(db_name)
+
+    def bump():
+        with _lock:
+            _generations[catalog] = _generations.get(catalog, 0) + 1
+    after_commit(db_name, bump)
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        """
+        Least-recently-used cache of catalog lookups, checked against the catalog generation.
+
+        :param maxsize: Most entries kept before the least recently used is evicted (int).
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (db_name, key) -> (generation, value)
+        self._lock = threading.Lock()
+
+    def get(self, db_name, key, loader):
+        """
+        Return the cached value for key, calling loader() to fill it on a miss.
+
+        :param db_name: Database the value was read from (str).
+        :param key: Hashable key, e.g. ("arcana", 3).
+        :param loader: Function with no arguments that reads the value.
+        """
+        db_name = catalog_of(db_name)
+        current = generation(db_name)
+        with self._lock:
+            entry = self._entries.get((db_name, key))
+            if entry is not None and entry[0] == current:
+                self._entries.move_to_end((db_name, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[(db_name, key)] = (current, value)
+            self._entries.move_to_end((db_name, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Return the hit, miss and size counters as a dict."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+# The process-wide cache used by the Arcana and Persona catalog lookups
+CACHE = LRUCache()
+
+
+def cached(db_name, key, loader):
+    """Return a catalog value from the process-wide cache, loading it on a miss."""
+    return CACHE.get(db_name, key, loader)
@@ -0,0 +1,276 @@
+import heapq
+import math
+import random
+from bisect import bisect_left, bisect_right
+
+from models.catalog import bump_generation, generation
+from models.database import DEFAULT_DB, get_connection
+from models.paging import PAGE_SIZE, Page, page_bounds
+from models.persona import Persona
+from models.sharding import catalog_of
+
+# How many random draws pick() makes before it falls back to scanning the band
+MAX_PICK_ATTEMPTS = 16
+
+
+class Compendium:
+    def __init__(self, rows=(), arcanas=()):
+        """
+        Build an in-memory index of the persona catalog.
+
+        :param rows: Iterable of (id, name, level, arcana_id) tuples.
+        :param arcanas: Iterable of (id, name) arcana tuples.
+        """
+        self.arcanas = dict(arcanas)
+        self.personas = {}
+        self.version = 0  # Bumped on every add/remove, so derived tables know to rebuild
+        self._band_cache = {}  # (min_level, max_level) -> (version, non-empty arcana bands)
+        # arcana_id -> parallel lists sorted by (level, id), so a level band is
+        # a contiguous slice that bisect can find in O(log n)
+        self._levels = {}
+        self._ids = {}
+        for row in sorted(rows, key=lambda row: (row[2], row[0])):
+            persona_id, _, level, arcana_id = row
+            self.personas[persona_id] = tuple(row)
+            self._levels.setdefault(arcana_id, []).append(level)
+            self._ids.setdefault(arcana_id, []).append(persona_id)
+
+    @classmethod
+    def load(cls, db_name=DEFAULT_DB):
+        """Build the index from the personas and arcanas tables."""
+        conn = get_connection(db_name)
+        arcanas = conn.execute("SELECT id, name FROM arcanas ORDER BY id")
+        return cls(conn.execute("SELECT id, name, level, arcana_id FROM personas"), arcanas)
+
+    def __len__(self):
+        return len(self.personas)
+
+    def add(self, persona_id, name, level, arcana_id):
+        """Add a persona to the index, replacing any existing entry with the same id."""
+        if persona_id in self.personas:
+            self.remove(persona_id)
+        self.personas[persona_id] = (persona_id, name, level, arcana_id)
+        self.version += 1
+        levels = self._levels.setdefault(arcana_id, [])
+        ids = self._ids.setdefault(arcana_id, [])
+        # Entries with the same level are ordered by id
+        position = bisect_left(ids, persona_id, bisect_left(levels, level), bisect_right(levels, level))
+        levels.insert(position, level)
+        ids.insert(position, persona_id)
+
+    def remove(self, persona_id):
+        """Drop a persona from the index."""
+        row = self.personas.pop(persona_id, None)
+        if row is None:
+            return
+        self.version += 1
+        _, _, level, arcana_id = row
+        levels = self._levels[arcana_id]
+        ids = self._ids[arcana_id]
+        position = bisect_left(ids, persona_id, bisect_left(levels, level), bisect_right(levels, level))
+        del levels[position]
+        del ids[position]
+
+    def get(self, persona_id):
+        """Return the Persona with this id, or None."""
+        row = self.personas.get(persona_id)
+        return Persona(*row) if row else None
+
+    def in_arcana(self, arcana_id):
+        """Return the Personas of an arcana, ordered by level."""
+        return [self.get(persona_id) for persona_id in self._ids.get(arcana_id, ())]
+
+    def page_in_arcana(self, arcana_id, after=None, before=None, limit=PAGE_SIZE):
+        """
+        Return one page of an arcana's personas, ordered by (level, id).
+
+        Pages are found by key with bisect, so any page costs O(log n + limit)
+        and only its own Personas are built.
+
+        :param arcana_id: The arcana to list (int).
+        :param after: (level, id) key of the last persona shown; the page starts after it.
+        :param before: (level, id) key of the first persona shown; the page ends before it.
+        :param limit: Most personas per page (int).
+        :return: A Page of Persona objects, keyed by (level, id).
+        """
+        levels = self._levels.get(arcana_id, [])
+        ids = self._ids.get(arcana_id, [])
+
+        def position(key, side):
+            level, persona_id = key
+            return side(ids, persona_id, bisect_left(levels, level), bisect_right(levels, level))
+
+        start, stop = page_bounds(
+            len(ids),
+            start=position(after, bisect_right) if after else None,
+            stop=position(before, bisect_left) if before else None,
+            limit=limit,
+        )
+        return Page(
+            [self.get(persona_id) for persona_id in ids[start:stop]],
+            key=lambda persona: (persona.level, persona.id),
+            number=start + 1,
+            has_previous=start > 0,
+            has_next=stop < len(ids),
+        )
+
+    def close(self):
+        """Release what the index holds outside the Python heap. Nothing, for an index built in memory."""
+
+    def arcana_ids(self):
+        """Return the arcana ids that have at least one persona."""
+        return [arcana_id for arcana_id, levels in self._levels.items() if levels]
+
+    def _band(self, arcana_id, min_level, max_level):
+        """Private helper returning the (start, stop) slice of an arcana's level band."""
+        levels = self._levels.get(arcana_id, [])
+        return bisect_left(levels, min_level), bisect_right(levels, max_level)
+
+    def band(self, arcana_id, min_level, max_level):
+        """Return the ids of an arcana's personas in a level band, ordered by (level, id)."""
+        start, stop = self._band(arcana_id, min_level, max_level)
+        return self._ids.get(arcana_id, [])[start:stop]
+
+    def _nonempty_bands(self, min_level, max_level):
+        """Private helper returning (arcana_id, start, stop) for every arcana with personas in a band."""
+        # Players sit in a handful of bands, so they are cached until the index changes
+        key = (min_level, max_level)
+        cached = self._band_cache.get(key)
+        if cached is None or cached[0] != self.version:
+            bands = []
+            for arcana_id in self._levels:
+                start, stop = self._band(arcana_id, min_level, max_level)
+                if stop > start:
+                    bands.append((arcana_id, start, stop))
+            cached = self._band_cache[key] = (self.version, bands)
+        return cached[1]
+
+    def band_counts(self, min_level, max_level):
+        """Return {arcana_id: number of personas} for the arcanas with personas in a level band."""
+        return {arcana_id: stop - start for arcana_id, start, stop in self._nonempty_bands(min_level, max_level)}
+
+    def find(self, name):
+        """Return the first Persona with this name (case-insensitive), or None. Scans the whole index."""
+        name = name.casefold()
+        for row in self.personas.values():
+            if row[1].casefold() == name:
+                return Persona(*row)
+        return None
+
+    def count(self, min_level, max_level, exclude_arcanas=()):
+        """Count the personas in a level band, skipping some arcanas."""
+        total = 0
+        for arcana_id in self._levels:
+            if arcana_id not in exclude_arcanas:
+                start, stop = self._band(arcana_id, min_level, max_level)
+                total += stop - start
+        return total
+
+    def candidates(self, min_level, max_level, exclude_arcanas=(), exclude_ids=()):
+        """Yield the ids of every persona in a level band, minus the exclusions."""
+        for arcana_id, ids in self._ids.items():
+            if arcana_id in exclude_arcanas:
+                continue
+            start, stop = self._band(arcana_id, min_level, max_level)
+            for persona_id in ids[start:stop]:
+                if persona_id not in exclude_ids:
+                    yield persona_id
+
+    def pick(self, min_level, max_level, exclude_arcanas=(), exclude_ids=(), rng=random):
+        """
+        Pick a random persona in a level band without building the candidate list.
+
+        :param min_level: Lowest level in the band (int).
+        :param max_level: Highest level in the band (int).
+        :param exclude_arcanas: Arcana ids that must not be picked.
+        :param exclude_ids: Persona ids that must not be picked, e.g. the player's stock.
+        :param rng: Source of randomness (default is the random module).
+        :return: A Persona object or None if the band has no candidate.
+        """
+        bands = [band for band in self._nonempty_bands(min_level, max_level) if band[0] not in exclude_arcanas]
+        total = sum(stop - start for _, start, stop in bands)
+        if not total:
+            return None
+
+        # The exclusions are a player's stock, so they are small next to the band
+        # and a few rejected draws are far cheaper than materialising every candidate
+        for _ in range(MAX_PICK_ATTEMPTS):
+            offset = rng.randrange(total)
+            for arcana_id, start, stop in bands:
+                if offset < stop - start:
+                    persona_id = self._ids[arcana_id][start + offset]
+                    break
+                offset -= stop - start
+            if persona_id not in exclude_ids:
+                return self.get(persona_id)
+
+        remaining = list(self.candidates(min_level, max_level, exclude_arcanas, exclude_ids))
+        return self.get(rng.choice(remaining)) if remaining else None
+
+    def sample(self, min_level, max_level, count, weight=None, exclude_ids=(), rng=random):
+        """
+        Draw up to count distinct personas from a level band, weighted.
+
+        Uses Efraimidis-Spirakis sampling: every candidate gets the key
+        -log(u) / weight for a uniform u, and the count smallest keys win.
+        That is one pass over the band and keeps only count entries in
+        memory, and it matches drawing one at a time without replacement.
+
+        :param min_level: Lowest level in the band (int).
+        :param max_level: Highest level in the band (int).
+        :param count: Number of personas wanted (int).
+        :param weight: Function (level, arcana_id) -> weight >= 0; None for uniform.
+                       Candidates with weight 0 are never drawn.
+        :param exclude_ids: Persona ids that must not be drawn, e.g. the player's stock.
+        :param rng: Source of randomness (default is the random module).
+        :return: A list of Persona objects, in draw order; shorter than count
+                 if the band runs out of candidates.
+        """
+        def keyed_candidates():
+            for arcana_id, start, stop in self._nonempty_bands(min_level, max_level):
+                levels = self._levels[arcana_id][start:stop]
+                ids = self._ids[arcana_id][start:stop]
+                for level, persona_id in zip(levels, ids):
+                    if persona_id in exclude_ids:
+                        continue
+                    persona_weight = 1.0 if weight is None else weight(level, arcana_id)
+                    if persona_weight > 0:
+                        yield -math.log(1.0 - rng.random()) / persona_weight, persona_id
+
+        return [self.get(persona_id) for _, persona_id in heapq.nsmallest(count, keyed_candidates())]
+
+_compendiums = {}  # db_name -> (catalog generation, Compendium)
+_loaders = {}  # db_name -> function building its index, when not Compendium.load
+
+
+def get_compendium(db_name=DEFAULT_DB):
+    """Return the process-wide compendium index for db_name, (re)building it when the catalog changed."""
+    db_name = catalog_of(db_name)  # Shards share their catalog's index
+    current = generation(db_name)
+    entry = _compendiums.get(db_name)
+    if entry is None or entry[0] != current:
+        if entry is not None:
+            # The fusion chart and planner check is_current() and drop the old index too
+            entry[1].close()
+        entry = _compendiums[db_name] = (current, _loaders.get(db_name, Compendium.load)(db_name))
+    return entry[1]
+
+
+def set_loader(db_name, loader):
+    """
+    Build db_name's index with loader(db_name) instead of reading the tables.
+
+    :param loader: A function returning a Compendium, or None to go back to Compendium.load.
+    """
+    if loader is None:
+        _loaders.pop(db_name, None)
+    else:
+        _loaders[db_name] = loader
+    entry = _compendiums.pop(db_name, None)
+    if entry is not None:
+        entry[1].close()
+
+
+def invalidate_compendium(db_name=DEFAULT_DB):
+    """Record a catalog change, so the index and the cached catalog lookups are rebuilt."""
+    bump_generation(db_name)
@@ -0,0 +1,204 @@
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from models.compendium import Compendium, set_loader
+from models.database import DEFAULT_DB
+
+# File layout: a header, then int32 sections, then UTF-8 names.
+#
+#   header    magic, format version, byte order, arcana/persona/group counts, name bytes
+#   arcanas   ids[A], name offsets[A + 1]
+#   personas  ids[N] (sorted), levels[N], arcana ids[N], name offsets[N + 1]
+#   groups    arcana ids[G], starts[G + 1], then levels[N] and ids[N] sorted by
+#             (arcana, level, id), so each arcana's slice is what Compendium
+#             keeps in _levels and _ids
+#   names     every arcana name, then every persona name
+#
+# The int32 sections are cast straight from the mapped file, so opening it
+# costs the same whatever the size of the compendium; pages are only read
+# when a lookup touches them.
+MAGIC = b"VRCF"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH4I")
+NO_ARCANA = -1  # Stored for personas whose arcana_id is NULL
+
+
+class _PersonaRows(Mapping):
+    """Read-only id -> (id, name, level, arcana_id) view of a mapped compendium file."""
+
+    def __init__(self, ids, levels, arcana_ids, name_offsets, names):
+        self._ids = ids
+        self._levels = levels
+        self._arcana_ids = arcana_ids
+        self._name_offsets = name_offsets
+        self._names = names
+
+    def _position(self, persona_id):
+        """Private helper returning the index of a persona id, or None."""
+        position = bisect_left(self._ids, persona_id)
+        if position < len(self._ids) and self._ids[position] == persona_id:
+            return position
+        return None
+
+    def _row(self, position):
+        """Private helper decoding the row at an index."""
+        name = bytes(self._names[self._name_offsets[position]:self._name_offsets[position + 1]]).decode()
+        arcana_id = self._arcana_ids[position]
+        return (self._ids[position], name, self._levels[position], None if arcana_id == NO_ARCANA else arcana_id)
+
+    def __getitem__(self, persona_id):
+        position = self._position(persona_id) if isinstance(persona_id, int) else None
+        if position is None:
+            raise KeyError(persona_id)
+        return self._row(position)
+
+    def __contains__(self, persona_id):
+        return isinstance(persona_id, int) and self._position(persona_id) is not None
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def values(self):
+        return (self._row(position) for position in range(len(self._ids)))
+
+
+class MappedCompendium(Compendium):
+    def __init__(self, path):
+        """
+        Open a compendium file written by write_compendium_file() without reading it in.
+
+        It behaves like a Compendium built from the tables. The first add() or
+        remove() copies it into ordinary in-memory structures.
+
+        :param path: Path of the compendium file (str).
+        """
+        with open(path, "rb") as compendium_file:
+            self._mmap = mmap.mmap(compendium_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._views = [view]  # Every view of the mapping, released by close()
+        magic, version, little_endian, arcana_count, persona_count, group_count, _ = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} compendium file, rebuild it.")
+        if little_endian != (sys.byteorder == "little"):
+            raise ValueError(f"{path} was built on a machine with a different byte order, rebuild it.")
+
+        sizes = [arcana_count, arcana_count + 1,
+                 persona_count, persona_count, persona_count, persona_count + 1,
+                 group_count, group_count + 1, persona_count, persona_count]
+        ints = view[HEADER.size:HEADER.size + 4 * sum(sizes)].cast("i")
+        sections = []
+        start = 0
+        for size in sizes:
+            sections.append(ints[start:start + size])
+            start += size
+        names = view[HEADER.size + 4 * sum(sizes):]
+        self._views += [ints, names, *sections]
+        (arcana_ids, arcana_name_offsets, persona_ids, levels, persona_arcana_ids, persona_name_offsets,
+         group_arcana_ids, group_starts, group_levels, group_ids) = sections
+
+        self.path = path
+        self.version = 0
+        self._band_cache = {}
+        self.arcanas = {
+            arcana_ids[i]: bytes(names[arcana_name_offsets[i]:arcana_name_offsets[i + 1]]).decode()
+            for i in range(arcana_count)
+        }
+        self.personas = _PersonaRows(persona_ids, levels, persona_arcana_ids, persona_name_offsets, names)
+        self._levels = {}
+        self._ids = {}
+        for i in range(group_count):
+            arcana_id = None if group_arcana_ids[i] == NO_ARCANA else group_arcana_ids[i]
+            self._levels[arcana_id] = group_levels[group_starts[i]:group_starts[i + 1]]
+            self._ids[arcana_id] = group_ids[group_starts[i]:group_starts[i + 1]]
+        self._views += [*self._levels.values(), *self._ids.values()]
+
+    @classmethod
+    def load(cls, db_name=DEFAULT_DB):
+        raise TypeError("A MappedCompendium is opened from a file, see use_compendium_file().")
+
+    def _thaw(self):
+        """Private helper copying the mapped data into lists and a dict so it can change."""
+        if isinstance(self.personas, _PersonaRows):
+            self.personas = dict(self.personas.items())
+            self._levels = {arcana_id: list(levels) for arcana_id, levels in self._levels.items()}
+            self._ids = {arcana_id: list(ids) for arcana_id, ids in self._ids.items()}
+
+    def add(self, persona_id, name, level, arcana_id):
+        self._thaw()
+        super().add(persona_id, name, level, arcana_id)
+
+    def remove(self, persona_id):
+        self._thaw()
+        super().remove(persona_id)
+
+    def close(self):
+        """
+        Unmap the file. Lookups fail afterwards, unless add() or remove() already copied the data.
+
+        get_compendium() calls this when it replaces the index after a catalog change.
+        """
+        for view in self._views:
+            view.release()
+        self._views = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a slice from band(); the mapping goes when that slice does
+            pass
+
+
+def write_compendium_file(compendium, path):
+    """
+    Write a compendium to a file that MappedCompendium can map.
+
+    :param compendium: The Compendium to save, e.g. Compendium.load(db_name).
+    :param path: Path of the file to (over)write (str).
+    :return: The number of personas written (int).
+    """
+    names = bytearray()
+
+    def add_name(name, offsets):
+        offsets.append(len(names))
+        names.extend(name.encode())
+
+    arcana_ids, arcana_name_offsets = array("i"), array("i")
+    for arcana_id, name in sorted(compendium.arcanas.items()):
+        arcana_ids.append(arcana_id)
+        add_name(name, arcana_name_offsets)
+    arcana_name_offsets.append(len(names))
+
+    persona_ids, levels, persona_arcana_ids, persona_name_offsets = array("i"), array("i"), array("i"), array("i")
+    for persona_id, name, level, arcana_id in sorted(compendium.personas.values()):
+        persona_ids.append(persona_id)
+        levels.append(level)
+        persona_arcana_ids.append(NO_ARCANA if arcana_id is None else arcana_id)
+        add_name(name, persona_name_offsets)
+    persona_name_offsets.append(len(names))
+
+    group_arcana_ids, group_starts, group_levels, group_ids = array("i"), array("i", [0]), array("i"), array("i")
+    for arcana_id in sorted(compendium._ids, key=lambda arcana_id: NO_ARCANA if arcana_id is None else arcana_id):
+        group_arcana_ids.append(NO_ARCANA if arcana_id is None else arcana_id)
+        group_levels.extend(compendium._levels[arcana_id])
+        group_ids.extend(compendium._ids[arcana_id])
+        group_starts.append(len(group_ids))
+
+    with open(path, "wb") as compendium_file:
+        compendium_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, sys.byteorder == "little", len(arcana_ids),
+                                          len(persona_ids), len(group_arcana_ids), len(names)))
+        for section in (arcana_ids, arcana_name_offsets, persona_ids, levels, persona_arcana_ids,
+                        persona_name_offsets, group_arcana_ids, group_starts, group_levels, group_ids):
+            section.tofile(compendium_file)
+        compendium_file.write(names)
+    return len(persona_ids)
+
+
+def use_compendium_file(path, db_name=DEFAULT_DB):
+    """Read db_name's catalog from a compendium file from now on, instead of its tables."""
+    set_loader(db_name, lambda _: MappedCompendium(path))
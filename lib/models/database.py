@@ -0,0 +1,292 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from models import tracing
+from models.tracing import TracedConnection
+
+DEFAULT_DB = os.environ.get("VELVET_DB", 'velvetRoom.db')
+
+# db_name -> SQLite URI to open instead of the file of that name, e.g. an
+# in-memory database (see models/storage.py). Set it before the first query,
+# or call close_all() after changing it.
+TARGETS = {}
+
+# db_name -> SQL script run on every new connection to it, e.g. the ATTACH
+# and TEMP triggers of a shard (see models/sharding.py)
+ON_OPEN = {}
+
+# Pragmas applied to every connection the manager opens. Change them with
+# configure() before the first query, or at runtime to re-apply them to the
+# connections that are already open.
+PRAGMAS = {
+    "temp_store": "MEMORY",
+    "cache_size": -8000,  # Negative values are KiB, so roughly 8 MB of page cache
+}
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_open_connections = []
+_epoch = 0  # Bumped by close_all() so other threads drop their stale handles
+_rollbacks = {}  # db_name -> number of units of work rolled back in this process
+
+# Lock retry policy for BEGIN and COMMIT, the only two points where a unit of
+# work started with BEGIN IMMEDIATE waits for another connection's lock
+LOCK_RETRIES = 8
+LOCK_BACKOFF_SECONDS = 0.01  # First wait; doubles on every retry
+LOCK_BACKOFF_CAP_SECONDS = 1.0
+
+# How often this process ran into another connection's lock
+CONTENTION = {
+    "lock_retries": 0,  # Retries after a "database is locked" error
+    "lock_failures": 0,  # Units of work that gave up after LOCK_RETRIES
+    "backoff_seconds": 0.0,  # Time spent sleeping between retries
+}
+_contention_lock = threading.Lock()
+
+
+def configure(**pragmas):
+    """
+    Update the pragmas used by the connection manager.
+
+    :param pragmas: Pragma names and values, e.g. configure(cache_size=-16000).
+    """
+    PRAGMAS.update(pragmas)
+    with _registry_lock:
+        connections = list(_open_connections)
+    for conn in connections:
+        _apply_pragmas(conn, pragmas)
+
+
+def enable_concurrency(db_name=DEFAULT_DB, busy_timeout_ms=20):
+    """
+    Switch to the settings for many CLI processes sharing one database.
+
+    WAL lets readers keep reading while one writer commits, and synchronous
+    NORMAL is safe in WAL mode. The busy timeout is kept short so that lock
+    waits go through the retry loop in transaction(), which backs off with
+    jitter and counts the contention, instead of SQLite's fixed busy handler.
+
+    :param db_name: Name of the database file to switch to WAL (default 'velvetRoom.db').
+    :param busy_timeout_ms: How long SQLite itself waits on a lock before reporting it (int).
+    :return: The journal mode now in effect (str).
+    """
+    configure(busy_timeout=busy_timeout_ms, synchronous="NORMAL")
+    # journal_mode=WAL is stored in the database file, so it only needs setting once.
+    # main. keeps it off attached databases, like the read-only catalog of a shard
+    mode = _retry_on_lock(
+        lambda: get_connection(db_name).execute("PRAGMA main.journal_mode = WAL").fetchone()[0]
+    )
+    return mode
+
+
+def is_lock_error(error):
+    """Return True if error means another connection is holding a lock we need."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _retry_on_lock(operation):
+    """Private helper to run operation, retrying lock errors with jittered exponential backoff."""
+    delay = LOCK_BACKOFF_SECONDS
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            if attempt == LOCK_RETRIES:
+                with _contention_lock:
+                    CONTENTION["lock_failures"] += 1
+                raise
+        wait = random.uniform(0, delay)
+        with _contention_lock:
+            CONTENTION["lock_retries"] += 1
+            CONTENTION["backoff_seconds"] += wait
+        time.sleep(wait)
+        delay = min(delay * 2, LOCK_BACKOFF_CAP_SECONDS)
+
+
+def format_contention():
+    """Return the lock contention counters as readable text."""
+    return (
+        f"Lock contention: {CONTENTION['lock_retries']} retries, "
+        f"{CONTENTION['lock_failures']} failure(s), "
+        f"{CONTENTION['backoff_seconds'] * 1000:.1f} ms backing off"
+    )
+
+
+def _apply_pragmas(conn, pragmas):
+    """Private helper to run a set of PRAGMA statements on a connection."""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _open(db_name):
+    """Private helper to open and configure a new connection."""
+    # Autocommit mode: transactions are opened explicitly by transaction(), so
+    # the driver never starts one behind our back
+    target = TARGETS.get(db_name)
+    # URIs are also what lets ON_OPEN scripts ATTACH databases read-only
+    conn = sqlite3.connect(target or db_name, check_same_thread=False, isolation_level=None,
+                           factory=TracedConnection, uri=True)
+    _apply_pragmas(conn, PRAGMAS)
+    if db_name in ON_OPEN:
+        conn.executescript(ON_OPEN[db_name])
+    with _registry_lock:
+        _open_connections.append(conn)
+    return conn
+
+
+def get_connection(db_name=DEFAULT_DB):
+    """
+    Return the long-lived connection for db_name owned by the calling thread.
+
+    The first call from a thread opens the connection; every later call from
+    the same thread reuses it, so models should never close it themselves.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :return: A sqlite3.Connection.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.epoch != _epoch:
+        connections = _local.connections = {}
+        _local.epoch = _epoch
+    conn = connections.get(db_name)
+    if conn is None:
+        conn = connections[db_name] = _open(db_name)
+    if tracing.ACTIVE is not None:
+        tracing.ACTIVE.record_connection()
+    return conn
+
+
+@contextmanager
+def transaction(db_name=DEFAULT_DB):
+    """
+    Run a block of database work as one unit of work with a single commit.
+
+    Nested use joins the enclosing transaction instead of starting a new one,
+    so a model method can wrap its own writes and still be composed into a
+    bigger game action. Any exception rolls the whole unit of work back.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :return: The shared connection, for use in a with statement.
+    """
+    conn = get_connection(db_name)
+    if conn.in_transaction:
+        yield conn
+        return
+
+    # IMMEDIATE takes the write lock up front, so a read-then-write action
+    # cannot fail halfway through trying to upgrade its lock. That leaves
+    # BEGIN and COMMIT as the only places to wait for other connections, and
+    # both can be retried without re-running the body.
+    _retry_on_lock(lambda: conn.execute("BEGIN IMMEDIATE"))
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        _rollbacks[db_name] = _rollbacks.get(db_name, 0) + 1
+        _run_hooks(db_name, committed=False)
+        raise
+    finally:
+        _transaction_stamps(create=False).pop(db_name, None)
+    try:
+        _retry_on_lock(conn.commit)
+    except sqlite3.Error:
+        conn.rollback()
+        _rollbacks[db_name] = _rollbacks.get(db_name, 0) + 1
+        _run_hooks(db_name, committed=False)
+        raise
+    _run_hooks(db_name, committed=True)
+
+
+def after_commit(db_name, callback, on_rollback=None):
+    """
+    Run callback when the calling thread's unit of work on db_name commits.
+
+    Outside a transaction the callback runs straight away.
+
+    :param callback: Function called with no arguments after the commit.
+    :param on_rollback: Function called instead if the unit of work rolls back, optional.
+    """
+    if not get_connection(db_name).in_transaction:
+        callback()
+        return
+    hooks = getattr(_local, "commit_hooks", None)
+    if hooks is None:
+        hooks = _local.commit_hooks = {}
+    hooks.setdefault(db_name, []).append((callback, on_rollback))
+
+
+def _run_hooks(db_name, committed):
+    """Private helper running the after_commit() hooks of the unit of work that just ended."""
+    hooks = getattr(_local, "commit_hooks", {}).pop(db_name, ())
+    for callback, on_rollback in hooks:
+        if committed:
+            callback()
+        elif on_rollback is not None:
+            on_rollback()
+
+
+def _transaction_stamps(create=True):
+    """Private helper returning the calling thread's data_version stamps for open write transactions."""
+    stamps = getattr(_local, "transaction_stamps", None)
+    if stamps is None:
+        stamps = {}
+        if create:
+            _local.transaction_stamps = stamps
+    return stamps
+
+
+def data_version(db_name=DEFAULT_DB):
+    """
+    Return a stamp that changes whenever cached rows from db_name may be stale.
+
+    PRAGMA data_version changes when another connection (usually another
+    process) commits. Our own commits do not change it, which is exactly what
+    write-through caches want; the rollback count covers the one case where
+    our own cached writes have to be thrown away.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :return: A hashable stamp to compare with an earlier one.
+    """
+    conn = get_connection(db_name)
+    if conn.in_transaction:
+        # No other connection can commit while we hold the write lock, so the
+        # stamp read at the start of the transaction stays valid until it ends
+        stamp = _transaction_stamps().get(db_name)
+        if stamp is None:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            stamp = _transaction_stamps()[db_name] = (version, _rollbacks.get(db_name, 0))
+        return stamp
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    return version, _rollbacks.get(db_name, 0)
+
+
+def close_connection(db_name=DEFAULT_DB):
+    """Close the calling thread's connection to db_name, if it has one."""
+    connections = getattr(_local, "connections", {})
+    conn = connections.pop(db_name, None)
+    if conn is not None:
+        with _registry_lock:
+            _open_connections.remove(conn)
+        conn.close()
+
+
+def close_all():
+    """Close every connection opened by the manager, in any thread."""
+    global _epoch
+    with _registry_lock:
+        _epoch += 1
+        connections = list(_open_connections)
+        _open_connections.clear()
+    for conn in connections:
+        conn.close()
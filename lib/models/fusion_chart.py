@@ -0,0 +1,126 @@
+import random
+from itertools import combinations
+
+from models.compendium import MAX_PICK_ATTEMPTS, get_compendium
+from models.database import DEFAULT_DB
+from models.rules import MAX_LEVEL, MIN_LEVEL, can_fuse, fusion_band
+from models.sharding import catalog_of
+
+
+class FusionChart:
+    def __init__(self, compendium):
+        """
+        Precomputed fusion results, keyed by arcana pair and level band.
+
+        A fusion of two personas with different arcanas yields a persona of a
+        third arcana within FUSION_LEVEL_BAND levels of the player's level, so
+        the result only depends on the (unordered) arcana pair and the band.
+        Every band's personas are grouped by arcana up front; the candidate
+        set of a pair in a band is built on first use and kept.
+
+        :param compendium: The Compendium index the chart is built from.
+        """
+        self.compendium = compendium
+        self.version = compendium.version
+        # (min_level, max_level) -> {arcana_id: ids in the band}
+        self._bands = {}
+        for player_level in range(MIN_LEVEL, MAX_LEVEL + 1):
+            band = fusion_band(player_level)
+            if band not in self._bands:
+                self._bands[band] = {
+                    arcana_id: ids
+                    for arcana_id in compendium.arcana_ids()
+                    if (ids := tuple(compendium.band(arcana_id, *band)))
+                }
+        self._candidates = {}  # (arcana_id, arcana_id, band) -> tuple of persona ids
+
+    def is_current(self, compendium):
+        """Return True if the chart was built from this compendium as it is now."""
+        return compendium is self.compendium and compendium.version == self.version
+
+    def candidates(self, arcana_id_1, arcana_id_2, player_level):
+        """
+        Return the ids of every persona a fusion of two arcanas can yield.
+
+        :param arcana_id_1: Arcana of the first persona (int).
+        :param arcana_id_2: Arcana of the second persona (int).
+        :param player_level: Level of the player fusing (int).
+        :return: A tuple of persona ids, empty if the arcanas are the same.
+        """
+        if arcana_id_1 == arcana_id_2:
+            return ()
+        band = fusion_band(player_level)
+        key = (min(arcana_id_1, arcana_id_2), max(arcana_id_1, arcana_id_2), band)
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            candidates = self._candidates[key] = tuple(
+                persona_id
+                for arcana_id, ids in self._bands[band].items()
+                if arcana_id not in (arcana_id_1, arcana_id_2)
+                for persona_id in ids
+            )
+        return candidates
+
+    def pick(self, arcana_id_1, arcana_id_2, player_level, exclude_ids=(), rng=random):
+        """
+        Pick a random fusion result for two arcanas.
+
+        :param arcana_id_1: Arcana of the first persona (int).
+        :param arcana_id_2: Arcana of the second persona (int).
+        :param player_level: Level of the player fusing (int).
+        :param exclude_ids: Persona ids that must not be picked, e.g. the player's stock.
+        :param rng: Source of randomness (default is the random module).
+        :return: A Persona object or None if there is no candidate.
+        """
+        candidates = self.candidates(arcana_id_1, arcana_id_2, player_level)
+        if not candidates:
+            return None
+        for _ in range(MAX_PICK_ATTEMPTS):
+            persona_id = rng.choice(candidates)
+            if persona_id not in exclude_ids:
+                return self.compendium.get(persona_id)
+        remaining = [persona_id for persona_id in candidates if persona_id not in exclude_ids]
+        return self.compendium.get(rng.choice(remaining)) if remaining else None
+
+    def preview(self, personas, player_level, exclude_ids=()):
+        """
+        Evaluate every fusion of two personas from a list in one pass.
+
+        :param personas: Persona objects, e.g. a stock in listing order.
+        :param player_level: Level of the player fusing (int).
+        :param exclude_ids: Persona ids that cannot be a result, e.g. the player's stock.
+        :return: A list of (number_1, number_2, candidate count) tuples, where
+                 the numbers are 1-based positions in personas. Pairs with the
+                 same arcana are left out.
+        """
+        band = fusion_band(player_level)
+        # Excluded personas in the band, counted per arcana, so each pair's
+        # count is a subtraction instead of a scan of its candidates
+        excluded = {}
+        for persona_id in exclude_ids:
+            row = self.compendium.personas.get(persona_id)
+            if row and band[0] <= row[2] <= band[1]:
+                excluded[row[3]] = excluded.get(row[3], 0) + 1
+        total_excluded = sum(excluded.values())
+
+        previews = []
+        for (number_1, persona_1), (number_2, persona_2) in combinations(enumerate(personas, start=1), 2):
+            if not can_fuse(persona_1, persona_2):
+                continue
+            count = len(self.candidates(persona_1.arcana_id, persona_2.arcana_id, player_level))
+            count -= total_excluded - excluded.get(persona_1.arcana_id, 0) - excluded.get(persona_2.arcana_id, 0)
+            previews.append((number_1, number_2, count))
+        return previews
+
+
+_charts = {}
+
+
+def get_fusion_chart(db_name=DEFAULT_DB):
+    """Return the fusion chart for db_name, rebuilding it whenever its compendium changed."""
+    db_name = catalog_of(db_name)
+    compendium = get_compendium(db_name)
+    chart = _charts.get(db_name)
+    if chart is None or not chart.is_current(compendium):
+        chart = _charts[db_name] = FusionChart(compendium)
+    return chart
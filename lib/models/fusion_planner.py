@@ -0,0 +1,245 @@
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from itertools import combinations, count
+
+from models.compendium import get_compendium
+from models.database import DEFAULT_DB
+from models.rules import (DEFAULT_STOCK_LIMIT, FUSION_LEVEL_BAND, FUSION_LEVEL_GAIN, MAX_LEVEL, MIN_LEVEL,
+                          SUMMON_LEVEL_BAND, SUMMON_LEVEL_GAIN, fusion_band, gain_levels, summon_band)
+from models.sharding import catalog_of
+
+# Most search states one plan may expand before the planner gives up
+MAX_EXPANSIONS = 20000
+
+# Most plans memoised per planner; the least recently used is evicted first
+PLAN_CACHE_SIZE = 1024
+
+
+class PlanStep:
+    def __init__(self, kind, level, chance, inputs=(), result=None, stock_full=False):
+        """
+        One action of a fusion plan.
+
+        :param kind: "summon" or "fuse" (str).
+        :param level: Player level when the action is taken (int).
+        :param chance: Probability that the random outcome suits the rest of the plan (float).
+        :param inputs: The two personas a fusion uses: Persona objects from the stock,
+                       or the number of the earlier step whose result is meant (int).
+        :param result: The target Persona on the last step, None on the steps before it.
+        :param stock_full: True for a summon made only for its level gain (bool).
+        """
+        self.kind = kind
+        self.level = level
+        self.chance = chance
+        self.inputs = inputs
+        self.result = result
+        self.stock_full = stock_full
+
+    def describe(self):
+        """Return the step as a sentence for the player."""
+        names = [f"the result of step {source}" if isinstance(source, int) else source.name
+                 for source in self.inputs]
+        action = "Fuse " + " + ".join(names) if self.inputs else "Summon"
+        if self.result is not None:
+            outcome = f"{self.result.name} is a possible result"
+        elif self.stock_full:
+            outcome = "your stock is full, so this only raises your level"
+        else:
+            outcome = "keep a persona of an arcana the plan can still fuse"
+        odds = f"{self.chance:.0%}" if self.chance >= 0.01 else f"1 in {round(1 / self.chance)}"
+        return f"{action} at level {self.level}: {outcome} ({odds})"
+
+    def to_dict(self):
+        """Return a dictionary representation of the step."""
+        return {
+            "kind": self.kind,
+            "level": self.level,
+            "chance": self.chance,
+            "inputs": [source if isinstance(source, int) else source.id for source in self.inputs],
+            "result": self.result.to_dict() if self.result else None,
+            "stock_full": self.stock_full,
+        }
+
+
+class FusionPlanner:
+    def __init__(self, compendium):
+        """
+        Plans the fewest summons and fusions that can bring a target persona into the stock.
+
+        What a summon or fusion can yield only depends on the player's level,
+        and for a fusion on the two arcanas fused. So the number of personas of
+        each arcana in every level's summon and fusion band is counted up front,
+        and the search never touches the index or the database afterwards.
+
+        Results are random, so a plan is the shortest route along which the
+        target can appear, with the chance of each step going the planned way.
+        The search is A* over (player level, arcanas in the stock). Levels
+        only rise, so the heuristic is the fewest actions that can close the
+        gap to the target's band. The last PLAN_CACHE_SIZE plans are memoised;
+        get_fusion_planner() builds a new planner, with an empty memo, once
+        the compendium changes.
+
+        :param compendium: The Compendium index to plan with.
+        """
+        self.compendium = compendium
+        self.version = compendium.version
+        self._summons = {}  # player level -> {arcana_id: personas a summon can draw}
+        self._fusions = {}  # player level -> {arcana_id: personas a fusion can yield}
+        for player_level in range(MIN_LEVEL, MAX_LEVEL + 1):
+            self._summons[player_level] = compendium.band_counts(*summon_band(player_level))
+            self._fusions[player_level] = compendium.band_counts(*fusion_band(player_level))
+        self._plans = OrderedDict()  # (level, stock ids, target id, stock limit) -> steps
+        self._plans_lock = threading.Lock()
+
+    def is_current(self, compendium):
+        """Return True if the planner was built from this compendium as it is now."""
+        return compendium is self.compendium and compendium.version == self.version
+
+    def plan(self, stock, player_level, target, stock_limit=DEFAULT_STOCK_LIMIT):
+        """
+        Find the shortest route from a stock to a target persona.
+
+        :param stock: Persona objects in the player's stock.
+        :param player_level: The player's current level (int).
+        :param target: The Persona to reach.
+        :param stock_limit: The player's stock limit (int).
+        :return: A list of PlanStep objects (empty if the target is already in
+                 the stock), or None if the target cannot be reached.
+        """
+        key = (player_level, tuple(sorted(persona.id for persona in stock)), target.id, stock_limit)
+        with self._plans_lock:
+            if key in self._plans:
+                self._plans.move_to_end(key)
+                return self._plans[key]
+        steps = self._search(stock, player_level, target, stock_limit)
+        with self._plans_lock:
+            self._plans[key] = steps
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return steps
+
+    def _search(self, stock, player_level, target, stock_limit):
+        """Private helper running the best-first search behind plan()."""
+        if any(persona.id == target.id for persona in stock):
+            return []
+        reach = max(SUMMON_LEVEL_BAND, FUSION_LEVEL_BAND)
+        lowest, highest = target.level - reach, target.level + reach
+
+        @lru_cache(maxsize=None)
+        def estimate(level, size):
+            # Fewest actions that get within reach, plus the one that yields the target,
+            # counting only levels and stock size: each fusion needs the stock
+            # to keep a persona beyond the two it uses, which summons can add
+            gap = max(0, lowest - level)
+            return 1 + min(
+                fusions + max(0, math.ceil((gap - fusions * FUSION_LEVEL_GAIN) / SUMMON_LEVEL_GAIN), fusions - size + 1)
+                for fusions in range(math.ceil(gap / FUSION_LEVEL_GAIN) + 1)
+            )
+
+        def state(level, items):
+            # Arcanas other than the target's are interchangeable to the rules,
+            # so stocks with the same counts are the same state
+            arcanas = Counter(arcana_id for arcana_id, _ in items)
+            return level, arcanas.pop(target.arcana_id, 0), tuple(sorted(arcanas.values()))
+
+        tiebreak = count()
+        start = tuple((persona.arcana_id, persona) for persona in stock)
+        # (estimated total, -steps taken, -chance so far, tiebreak, level, stock, steps, done).
+        # Ties go to the deepest state, then the likeliest, which reaches a goal soonest.
+        frontier = [(estimate(player_level, len(start)), 0, -1.0, next(tiebreak), player_level, start, (), False)]
+        seen = set()
+        while frontier and len(seen) < MAX_EXPANSIONS:
+            _, taken, chance, _, level, items, steps, done = heapq.heappop(frontier)
+            if done:
+                return list(steps)
+            key = state(level, items)
+            if key in seen or level > highest:
+                continue
+            seen.add(key)
+            taken = -taken
+            pushed = set()
+
+            def push(step, next_level, next_items, done=False):
+                if not done:
+                    # Fusing other arcanas with the same counts leads to the same state
+                    next_key = state(next_level, next_items)
+                    if next_key in seen or next_key in pushed:
+                        return
+                    pushed.add(next_key)
+                heapq.heappush(frontier, (
+                    taken + 1 + (0 if done else estimate(next_level, len(next_items))), -(taken + 1), chance * step.chance,
+                    next(tiebreak), next_level, next_items, steps + (step,), done,
+                ))
+
+            owned = Counter(arcana_id for arcana_id, _ in items)
+            room = len(items) < stock_limit
+            number = len(steps) + 1
+
+            # Summon
+            draws = self._summons[level]
+            min_level, max_level = summon_band(level)
+            if room and min_level <= target.level <= max_level:
+                push(PlanStep("summon", level, 1 / sum(draws.values()), result=target), level, items, done=True)
+            if room:
+                for arcana_id, odds in self._outcomes(draws, (), owned, target.arcana_id):
+                    push(PlanStep("summon", level, odds), gain_levels(level, SUMMON_LEVEL_GAIN),
+                         items + ((arcana_id, number),))
+            else:
+                push(PlanStep("summon", level, 1.0, stock_full=True), gain_levels(level, SUMMON_LEVEL_GAIN), items)
+
+            # Fuse one persona of each of two different arcanas
+            first_of = {}
+            for position, (arcana_id, _) in enumerate(items):
+                first_of.setdefault(arcana_id, position)
+            yields = self._fusions[level]
+            min_level, max_level = fusion_band(level)
+            in_band = min_level <= target.level <= max_level
+            for arcana_1, arcana_2 in combinations(first_of, 2):
+                position_1, position_2 = first_of[arcana_1], first_of[arcana_2]
+                inputs = (items[position_1][1], items[position_2][1])
+                rest = tuple(item for position, item in enumerate(items) if position not in (position_1, position_2))
+                if in_band and target.arcana_id not in (arcana_1, arcana_2):
+                    total = sum(n for arcana_id, n in yields.items() if arcana_id not in (arcana_1, arcana_2))
+                    push(PlanStep("fuse", level, 1 / total, inputs, result=target), level, rest, done=True)
+                remaining = owned.copy()
+                remaining.subtract((arcana_1, arcana_2))
+                for arcana_id, odds in self._outcomes(yields, (arcana_1, arcana_2), remaining, target.arcana_id):
+                    push(PlanStep("fuse", level, odds, inputs), gain_levels(level, FUSION_LEVEL_GAIN),
+                         rest + ((arcana_id, number),))
+        return None
+
+    @staticmethod
+    def _outcomes(band_counts, exclude_arcanas, owned, target_arcana):
+        """
+        Private helper grouping the results a draw can give by how they serve the plan.
+
+        Any arcana the stock lacks (other than the target's) can be fused with
+        every persona the stock holds, so those results are one outcome. Only
+        when there is none does the plan branch on the individual arcanas.
+
+        :return: A list of (arcana_id to plan with, chance) pairs.
+        """
+        allowed = {arcana_id: n for arcana_id, n in band_counts.items() if arcana_id not in exclude_arcanas}
+        total = sum(allowed.values())
+        if not total:
+            return []
+        fresh = [arcana_id for arcana_id in allowed if arcana_id != target_arcana and owned[arcana_id] <= 0]
+        if fresh:
+            return [(max(fresh, key=allowed.get), sum(allowed[arcana_id] for arcana_id in fresh) / total)]
+        return [(arcana_id, n / total) for arcana_id, n in allowed.items()]
+
+
+_planners = {}
+
+
+def get_fusion_planner(db_name=DEFAULT_DB):
+    """Return the fusion planner for db_name, rebuilding it whenever its compendium changed."""
+    db_name = catalog_of(db_name)
+    compendium = get_compendium(db_name)
+    planner = _planners.get(db_name)
+    if planner is None or not planner.is_current(compendium):
+        planner = _planners[db_name] = FusionPlanner(compendium)
+    return planner
@@ -0,0 +1,240 @@
+import json
+import os
+import threading
+import time
+from itertools import groupby, islice
+
+from models.database import DEFAULT_DB, after_commit, get_connection, transaction
+from models.rules import MIN_LEVEL
+from models.schema import migrate
+
+# Group commit: committed events are written and fsynced together once this
+# many are waiting, or once the oldest has waited this long
+BATCH_SIZE = 256
+MAX_DELAY_SECONDS = 0.05
+
+# How each event type is applied to the tables. Every statement is
+# idempotent, so applying an event twice is harmless and replay can simply
+# start from the last applied sequence number.
+EVENTS = {
+    "stock_add": ("INSERT OR IGNORE INTO player_stock (player_id, persona_id) VALUES (?, ?)",
+                  ("player_id", "persona_id")),
+    "stock_remove": ("DELETE FROM player_stock WHERE player_id = ? AND persona_id = ?",
+                     ("player_id", "persona_id")),
+    "level": ("UPDATE players SET level = ? WHERE id = ?", ("level", "player_id")),
+}
+
+
+class Journal:
+    def __init__(self, path, db_name=DEFAULT_DB, batch_size=BATCH_SIZE, max_delay=MAX_DELAY_SECONDS):
+        """
+        Append-only journal of player actions, applied to the tables in groups.
+
+        While a journal is enabled, the stock and level writes of the models
+        become events. The events of a unit of work are queued when it
+        commits and dropped if it rolls back. A group commit appends the
+        queued events to the journal file with one fsync, then applies them to
+        the tables in one transaction that also records the last applied
+        sequence number. Opening a journal replays events the tables missed,
+        e.g. after a crash between the fsync and the apply.
+
+        Reads keep coming from the models' in-memory caches, so only one
+        process should write to a journaled database.
+
+        :param path: Path of the journal file, created if missing (str).
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        :param batch_size: Events that trigger a group commit (int).
+        :param max_delay: Seconds an event may wait for its group commit (float).
+        """
+        self.path = path
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.group_commits = 0
+        self.events_written = 0
+        self._lock = threading.RLock()
+        self._local = threading.local()  # Events staged by the calling thread's open unit of work
+        self._queue = []  # Committed events waiting for the next group commit
+        self._oldest = None  # When the oldest queued event was committed
+
+        migrate(db_name)
+        self.last_seq = self._repair()
+        self.replay()
+        self._file = open(path, "ab")
+
+    def record(self, event_type, **fields):
+        """
+        Record one event, e.g. record("level", player_id=1, level=5).
+
+        Inside a transaction the event waits for it to commit; outside one it
+        is queued at once.
+        """
+        staged = getattr(self._local, "staged", None)
+        if staged is None:
+            staged = self._local.staged = [(event_type, fields)]
+            after_commit(self.db_name, self._commit_staged, on_rollback=self._discard_staged)
+        else:
+            staged.append((event_type, fields))
+
+    def _commit_staged(self):
+        """Private helper queueing the events of a unit of work that committed."""
+        staged = self._local.__dict__.pop("staged", [])
+        with self._lock:
+            if not self._queue:
+                self._oldest = time.monotonic()
+            for event_type, fields in staged:
+                self.last_seq += 1
+                self._queue.append({"seq": self.last_seq, "type": event_type, **fields})
+            if self.due():
+                self.flush()
+
+    def _discard_staged(self):
+        """Private helper dropping the events of a unit of work that rolled back."""
+        self._local.__dict__.pop("staged", None)
+        # The rollback makes the caches re-read the tables, so they must
+        # already hold every event that did commit
+        self.flush()
+
+    def due(self):
+        """Return True if the queued events should be group-committed now."""
+        return len(self._queue) >= self.batch_size or (
+            bool(self._queue) and time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def flush(self):
+        """
+        Group-commit the queued events: append them with one fsync, then apply them.
+
+        :return: The number of events written (int).
+        """
+        with self._lock:
+            if not self._queue:
+                return 0
+            events, self._queue = self._queue, []
+            self._file.write("".join(json.dumps(event) + "\n" for event in events).encode())
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(events)
+            self.group_commits += 1
+            self.events_written += len(events)
+            return len(events)
+
+    def flush_if_due(self):
+        """Group-commit the queued events if the batch is full or the oldest has waited long enough."""
+        with self._lock:
+            return self.flush() if self.due() else 0
+
+    def _apply(self, events):
+        """Private helper applying events to the tables in one transaction."""
+        with transaction(self.db_name) as conn:
+            for event_type, group in groupby(events, key=lambda event: event["type"]):
+                sql, names = EVENTS[event_type]
+                conn.executemany(sql, [tuple(event[name] for name in names) for event in group])
+            conn.execute("UPDATE journal_state SET applied_seq = ?", (events[-1]["seq"],))
+
+    def _read(self):
+        """Private helper yielding every complete event in the journal file."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    return  # Torn write from a crash; it was never acknowledged
+                yield json.loads(line)
+
+    def _repair(self):
+        """Private helper cutting off a torn last line and returning the last sequence number."""
+        if not os.path.exists(self.path):
+            return 0
+        last_seq = 0
+        complete = 0
+        with open(self.path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    break
+                complete += len(line)
+                last_seq = json.loads(line)["seq"]
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
+        return last_seq
+
+    def applied_seq(self):
+        """Return the sequence number of the last event applied to the tables."""
+        return get_connection(self.db_name).execute("SELECT applied_seq FROM journal_state").fetchone()[0]
+
+    def replay(self, from_seq=None):
+        """
+        Apply the journalled events the tables have not seen yet.
+
+        :param from_seq: Replay events after this sequence number instead of
+                         after the last applied one (int).
+        :return: The number of events applied (int).
+        """
+        start = self.applied_seq() if from_seq is None else from_seq
+        events = (event for event in self._read() if event["seq"] > start)
+        count = 0
+        while chunk := list(islice(events, 10000)):
+            self._apply(chunk)
+            count += len(chunk)
+        return count
+
+    def rebuild(self):
+        """
+        Rebuild every stock and level from the journal alone, in one transaction.
+
+        Only meaningful when the journal has been on since the players were
+        created. Run it before loading any Player, since their caches are not
+        told about it.
+
+        :return: The number of events applied (int).
+        """
+        self.flush()
+        with transaction(self.db_name) as conn:
+            conn.execute("DELETE FROM player_stock")
+            conn.execute("UPDATE players SET level = ?", (MIN_LEVEL,))
+            conn.execute("UPDATE journal_state SET applied_seq = 0")
+            return self.replay(from_seq=0)
+
+    def close(self):
+        """Group-commit whatever is queued and close the journal file."""
+        self.flush()
+        self._file.close()
+
+
+_journals = {}
+
+
+def enable_journal(path, db_name=DEFAULT_DB, **options):
+    """Route db_name's player writes through a journal at path and return it."""
+    journal = _journals[db_name] = Journal(path, db_name, **options)
+    return journal
+
+
+def get_journal(db_name=DEFAULT_DB):
+    """Return the journal enabled for db_name, or None."""
+    return _journals.get(db_name)
+
+
+def flush_journals(due_only=False):
+    """
+    Group-commit the queued events of every enabled journal.
+
+    Only the server flushes on a timer, so the CLI calls this between actions
+    to keep events from waiting longer than max_delay, e.g. while it waits
+    for input.
+
+    :param due_only: Only flush journals whose batch is full or whose oldest event
+                     has waited max_delay (bool).
+    """
+    for journal in list(_journals.values()):
+        if due_only:
+            journal.flush_if_due()
+        else:
+            journal.flush()
+
+
+def close_journals():
+    """Flush and close every enabled journal."""
+    while _journals:
+        _, journal = _journals.popitem()
+        journal.close()
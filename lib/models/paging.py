@@ -0,0 +1,59 @@
+# Keyset pagination shared by the stock and compendium listings. A page is
+# found from the key of the row it follows (or precedes), never from an
+# offset, so turning a page costs the same at the start and the end of a
+# listing, and a page stays put when rows are added or removed before it.
+
+PAGE_SIZE = 20
+
+
+class Page:
+    def __init__(self, items, key, number=1, has_previous=False, has_next=False):
+        """
+        One page of a listing.
+
+        :param items: The rows on this page, in listing order (list).
+        :param key: Function returning a row's sort key, used to ask for the neighbouring pages.
+        :param number: Listing number of the first row (1-based int).
+        :param has_previous: Whether rows come before this page (bool).
+        :param has_next: Whether rows come after this page (bool).
+        """
+        self.items = items
+        self.key = key
+        self.number = number
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def numbered(self):
+        """Yield (listing number, row) pairs."""
+        return enumerate(self.items, start=self.number)
+
+    @property
+    def first_key(self):
+        """Key to pass as before= for the previous page, or None if the page is empty."""
+        return self.key(self.items[0]) if self.items else None
+
+    @property
+    def last_key(self):
+        """Key to pass as after= for the next page, or None if the page is empty."""
+        return self.key(self.items[-1]) if self.items else None
+
+
+def page_bounds(size, start=None, stop=None, limit=PAGE_SIZE):
+    """
+    Return the (start, stop) slice of a page in a sorted listing of size rows.
+
+    :param size: Number of rows in the listing (int).
+    :param start: Position of the first row after the after= key, if paging forward (int).
+    :param stop: Position of the before= key, if paging back (int).
+    :param limit: Most rows per page (int).
+    """
+    if stop is not None:
+        return max(0, stop - limit), stop
+    start = start or 0
+    return start, min(size, start + limit)
@@ -1,75 +1,89 @@
-import sqlite3
+from models.catalog import cached
+from models.database import DEFAULT_DB, get_connection
 
 class Persona:
-    def __init__(self, id, name, level, arcana_id, player_id=None):
+    def __init__(self, id, name, level, arcana_id, player_id=None, db_name=DEFAULT_DB):
         """
         Initialize a Persona object.
 
-        :param persona_id: Unique identifier for the persona (int).
+        :param id: Unique identifier for the persona (int).
         :param name: Name of the persona (str).
         :param level: Level of the persona (int).
-        :param arcana: Arcana to which the persona belongs (str).
+        :param arcana_id: ID of the arcana the persona belongs to (int).
         :param player_id: ID of the player who owns this persona, optional (int).
+        :param db_name: Name of the database the persona belongs to (default 'velvetRoom.db').
         """
         self.id = id
         self.name = name
         self.level = level
         self.arcana_id = arcana_id
         self.player_id = player_id
+        self.db_name = db_name
     def _connect(self):
-        """Private method to establish a connection to the SQLite database."""
-        return sqlite3.connect(self.db_name)
+        """Private method to get the shared connection to the SQLite database."""
+        return get_connection(self.db_name)
 
     @classmethod
-    def from_db_row(cls, row):
+    def from_db_row(cls, row, db_name=DEFAULT_DB):
         """
         Create a Persona object from a row fetched from the database.
 
-        :param row: A tuple containing persona data from the database.
+        :param row: A tuple of (id, name, level, arcana_id) and optionally player_id.
+        :param db_name: Name of the database the row was read from.
         :return: A Persona object.
         """
-        return cls(persona_id=row[0], name=row[1], level=row[2], arcana=row[3], player_id=row[4])
+        return cls(*row, db_name=db_name)
 
     @staticmethod
     def get_persona_by_id(db_name, persona_id):
         """
-        Retrieve a persona by its ID from the database.
+        Retrieve a persona by its ID from the catalog cache, or the database on a miss.
+
+        Only the catalog columns are cached, so the returned persona has no
+        player_id; ownership lives in the player's Stock.
 
         :param db_name: The database name (str).
         :param persona_id: The ID of the persona (int).
         :return: A Persona object or None if not found.
         """
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM personas WHERE id = ?", (persona_id,))
-        row = cursor.fetchone()
-        conn.close()
+        def load():
+            conn = get_connection(db_name)
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name, level, arcana_id FROM personas WHERE id = ?", (persona_id,))
+            return cursor.fetchone()
 
+        row = cached(db_name, ("persona", persona_id), load)
         if row:
-            return Persona.from_db_row(row)
+            return Persona.from_db_row(row, db_name)
         return None
 
     @staticmethod
     def get_personas_by_level_range(db_name, min_level, max_level):
         """
-        Retrieve personas by level range from the database.
+        Retrieve personas by level range from the catalog cache, or the database on a miss.
 
         :param db_name: The database name (str).
         :param min_level: The minimum level for filtering personas (int).
         :param max_level: The maximum level for filtering personas (int).
-        :return: A list of Persona objects.
+        :return: A list of Persona objects (without player_id), ordered by level.
         """
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM personas 
-            WHERE level BETWEEN ? AND ?
-        """, (min_level, max_level))
-        rows = cursor.fetchall()
-        conn.close()
+        def load():
+            conn = get_connection(db_name)
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, name, level, arcana_id FROM personas
+                WHERE level BETWEEN ? AND ?
+                ORDER BY level, id
+            """, (min_level, max_level))
+            return tuple(cursor)
+
+        rows = cached(db_name, ("personas_by_level", min_level, max_level), load)
+        return [Persona.from_db_row(row, db_name) for row in rows]
 
-        return [Persona.from_db_row(row) for row in rows]
+    def to_dict(self):
+        """Return the persona as a plain dict, e.g. for JSON output."""
+        return {"id": self.id, "name": self.name, "level": self.level, "arcana_id": self.arcana_id}
 
     def __str__(self):
         """Return a string representation of the persona."""
-        return f"{self.name} (Level {self.level}, Arcana: {self.arcana})"
\ No newline at end of file
+        return f"{self.name} (Level {self.level}, Arcana: {self.arcana_id})"
\ No newline at end of file
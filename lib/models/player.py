@@ -1,10 +1,16 @@
 import sqlite3
-import random
+from models.database import DEFAULT_DB, data_version, get_connection, transaction
+from models.fusion_chart import get_fusion_chart
+from models.fusion_planner import get_fusion_planner
+from models.journal import get_journal
+from models.rules import (DEFAULT_STOCK_LIMIT, FUSION_LEVEL_GAIN, MIN_LEVEL, SUMMON_LEVEL_GAIN, can_fuse,
+                          fusion_band, gain_levels)
+from models.sharding import new_player_id, shard_for_name, shard_for_player
 from models.stock import Stock
 from models.persona import Persona
 
 class Player:
-    def __init__(self, db_name='velvetRoom.db', level=1, player_id=None, name=None, stock_limit=None):
+    def __init__(self, db_name=DEFAULT_DB, level=1, player_id=None, name=None, stock_limit=None):
         """
         Initialize a Player object.
 
@@ -12,22 +18,33 @@ class Player:
         :param player_id: Unique identifier for the player (int).
         :param name: Name of the player (str).
         :param stock_limit: The stock limit for the player (int). If not provided, it will be fetched from the database.
+
+        name, level and stock_limit are a write-through cache of the players row:
+        writes go to the database and the attributes together, and reads only go
+        back to the database when PRAGMA data_version says another connection
+        has committed since the attributes were loaded.
+
+        When sharding is enabled (models/sharding.py), db_name may be the
+        catalog or any shard: the player is always read from their own shard.
         """
-        self.db_name = db_name
+        self.db_name = db_name = shard_for_player(db_name, player_id)
         self.player_id = player_id
         self.name = name
         self.level = level
         self.in_memory_stock = []
+        self.stock = Stock(db_name=db_name, player_id=player_id, player=self)
+        self._stamp = None  # data_version stamp of the cached attributes, None if never loaded
         # If stock_limit is not provided, fetch it from the database
         if stock_limit is not None:
             self.stock_limit = stock_limit
         else:
             self.stock_limit = self.get_stock_limit()
     def _connect(self):
-        return sqlite3.connect(self.db_name)
+        """Private method to get the shared connection to the SQLite database."""
+        return get_connection(self.db_name)
 
     @staticmethod
-    def create_player(name, db_name='velvetRoom.db'):
+    def create_player(name, db_name=DEFAULT_DB):
         """
         Create a new player in the database.
 
@@ -35,52 +52,110 @@ class Player:
         :param db_name: Name of the database file (default 'velvetRoom.db').
         :return: A Player object.
         """
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO players (name, level) VALUES (?, ?)", (name, 1))
-        player_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        db_name = shard_for_name(db_name, name)
+        with transaction(db_name) as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO players (id, name, level) VALUES (?, ?, ?)",
+                           (new_player_id(db_name), name, MIN_LEVEL))
+            player_id = cursor.lastrowid
         return Player(db_name=db_name, player_id=player_id, name=name)
 
+    def refresh(self):
+        """Reload name, level and stock limit if the cached copy may be stale."""
+        stamp = data_version(self.db_name)
+        if stamp != self._stamp:
+            self._fetch_player_data()
+            self._stamp = stamp
+
     def get_player_level(self):
         """Get the current level of the player."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT level FROM players WHERE id = ?", (self.player_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        self.refresh()
+        return self.level
 
     def summon_persona(self):
-        """Summon a random persona and increase the player's level by 1."""
-        stock = Stock(player_id=self.player_id)
+        """Summon a random persona, increase the player's level by SUMMON_LEVEL_GAIN and return the persona (or None)."""
+        with transaction(self.db_name):
+            # Perform the summoning
+            persona = self.stock.summon_persona()
+
+            # Increase the player's level after summoning
+            self.increase_player_level(SUMMON_LEVEL_GAIN)
 
-        # Perform the summoning
-        stock.summon_persona()
+        print(f"Your level has increased by {SUMMON_LEVEL_GAIN} to {self.get_player_level()}.")
+        return persona
 
-        # Increase the player's level by 1 after summoning
-        self.increase_player_level(1)
+    def summon_personas(self, count, level_decay=None, arcana_weights=None):
+        """
+        Summon up to count personas in one go and return the ones that joined the stock.
+
+        The player gains SUMMON_LEVEL_GAIN levels per persona that joined the
+        stock, so asking for more than the stock has room for (or than the band
+        holds) gains nothing extra. Every persona is drawn from the band of the
+        starting level. The draw, the stock writes and the level update commit
+        together.
+
+        :param count: Number of personas to summon (int).
+        :param level_decay: Weight factor per level of distance, see rules.summon_weight().
+        :param arcana_weights: Dict of arcana_id -> weight, see rules.summon_weight().
+        :return: A list of Persona objects.
+        """
+        with transaction(self.db_name):
+            personas = self.stock.summon_personas(count, level_decay, arcana_weights)
+            if personas:
+                self.increase_player_level(SUMMON_LEVEL_GAIN * len(personas))
 
-        print(f"Your level has increased by 1 to {self.get_player_level()}.")
+        if personas:
+            print(f"Your level has increased by {SUMMON_LEVEL_GAIN * len(personas)} to {self.get_player_level()}.")
+        return personas
 
     def increase_player_level(self, increment=1):
         """Increase the player's level."""
-        new_level = self.get_player_level() + increment
-        if new_level > 99:
-            new_level = 99  # Enforce level cap of 99
+        new_level = gain_levels(self.get_player_level(), increment)  # Enforces the level cap
         self.update_player_level(new_level)
 
     def update_player_level(self, new_level):
-        """Update the player's level in the database."""
-        conn = self._connect()
+        """Update the player's level in the database (or the journal) and in the cached copy."""
+        # Load the cache first: a journaled level only reaches the table at the
+        # next group commit, so a first load after this write would undo it
+        self.refresh()
+        journal = get_journal(self.db_name)
+        if journal:
+            journal.record("level", player_id=self.player_id, level=new_level)
+        else:
+            with transaction(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE players SET level = ? WHERE id = ?", (new_level, self.player_id))
+        # If an enclosing unit of work rolls back, data_version() changes and
+        # the next read reloads the real level
+        self.level = new_level
+
+    @staticmethod
+    def get_or_create_player(name, db_name=DEFAULT_DB):
+        """
+        Load the player with this name, creating them if they do not exist yet.
+
+        :param name: Name of the player (str).
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        :return: A Player object.
+        """
+        db_name = shard_for_name(db_name, name)
+        conn = get_connection(db_name)
         cursor = conn.cursor()
-        cursor.execute("UPDATE players SET level = ? WHERE id = ?", (new_level, self.player_id))
-        conn.commit()
-        conn.close()
+        cursor.execute("SELECT id, level, stock_limit FROM players WHERE name = ?", (name,))
+        player_data = cursor.fetchone()
+
+        if player_data:
+            player_id, level, stock_limit = player_data
+            return Player(db_name=db_name, level=level, player_id=player_id, name=name, stock_limit=stock_limit)
+
+        with transaction(db_name):
+            cursor.execute("INSERT INTO players (id, name, level, stock_limit) VALUES (?, ?, ?, ?)",
+                           (new_player_id(db_name), name, MIN_LEVEL, DEFAULT_STOCK_LIMIT))
+            player_id = cursor.lastrowid
+        return Player(db_name=db_name, player_id=player_id, name=name, stock_limit=DEFAULT_STOCK_LIMIT)
 
     @staticmethod
-    def get_player_by_id(player_id, db_name='velvetRoom.db'):
+    def get_player_by_id(player_id, db_name=DEFAULT_DB):
         """
         Retrieve a player by their ID.
 
@@ -88,11 +163,11 @@ class Player:
         :param db_name: Name of the database file (default 'velvetRoom.db').
         :return: A Player object or None if not found.
         """
-        conn = sqlite3.connect(db_name)
+        db_name = shard_for_player(db_name, player_id)
+        conn = get_connection(db_name)
         cursor = conn.cursor()
         cursor.execute("SELECT id, name, level FROM players WHERE id = ?", (player_id,))
         result = cursor.fetchone()
-        conn.close()
         if result:
             return Player(db_name=db_name, player_id=result[0], name=result[1])
         return None
@@ -105,18 +180,16 @@ class Player:
         player_data = cursor.fetchone()
         if player_data:
             self.name, self.level, self.stock_limit = player_data
-        conn.close()
     def get_stock_limit(self):
         """Fetch the player's stock limit from the database."""
-        conn = sqlite3.connect("velvetRoom.db")
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("SELECT stock_limit FROM players WHERE id = ?", (self.player_id,))
         stock_limit = cursor.fetchone()
-        conn.close()
 
         if stock_limit:
             return stock_limit[0]
-        return 8  # Default if no stock_limit is found
+        return DEFAULT_STOCK_LIMIT  # Default if no stock_limit is found
     
     def release_persona(self):
         """Release a persona from the player's stock."""
@@ -136,60 +209,57 @@ class Player:
         else:
             print("Please enter a valid number.")
             
-    def list_stock(self):
-        """List all personas in the player's stock with a number next to each name."""
-        conn = self._connect()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-            SELECT personas.id, personas.name, personas.level, arcanas.name
-            FROM personas 
-            JOIN arcanas ON personas.arcana_id = arcanas.id               
-            WHERE personas.player_id = ?
-            """, (self.player_id,))
-            personas = cursor.fetchall()
-            conn.close()
-
-            if personas:
-                print("Your personas:")
-                for index, persona in enumerate(personas, start=1):
-                    persona, name, level, arcana_name = persona
-                    print(f"{index}. {name} (Level: {level}, Arcana: {arcana_name})")
-            else:
-                print("You have no personas in your stock.")
-        except sqlite3.Error as e:
-            print(f"An error occurred: {e}")
-            conn.close()
+    def list_stock(self, after=None, before=None):
+        """List one page of the player's stock with a number next to each name, see Stock.list_stock()."""
+        return self.stock.list_stock(after=after, before=before)
     def get_persona_by_number(self, selection_number):
         """Fetch a persona by its number in the list."""
-        conn = self._connect()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id, name, level, arcana_id FROM personas WHERE player_id = ?", (self.player_id,))
-        personas = cursor.fetchall()
-        conn.close()
-
-        if 0 < selection_number <= len(personas):
-            persona_data = personas[selection_number - 1]
-            return Persona(*persona_data)
-        else:
-            return None
+        return self.stock.get_persona_by_number(selection_number)
     def remove_persona_from_stock(self, persona):
         """Remove a persona from the player's stock."""
         conn = self._connect()
-        cursor = conn.cursor()
         try:
-           cursor.execute("UPDATE personas SET player_id = NULL WHERE id = ?", (persona.id,))
-           conn.commit()
+           self.stock.remove_persona_from_stock(persona)
         #    self.increase_player_level(2)
         #    print(f"Your level has increased by 2 to {self.get_player_level()}.")
            print(f"Persona {persona.name} has been removed from your stock.")
         except sqlite3.Error as e:
+           if conn.in_transaction:
+               raise  # Part of a bigger unit of work (e.g. fusion), let it roll back
            print(f"An error occurred while removing the persona: {e}")
-        finally:
-          conn.close()
     
+    def release_personas(self, personas):
+        """
+        Release several personas from the player's stock at once.
+
+        :param personas: Persona objects to release.
+        :return: The number of personas released (int).
+        """
+        try:
+            released = self.stock.release_personas(personas)
+        except sqlite3.Error as e:
+            if self._connect().in_transaction:
+                raise
+            print(f"An error occurred while releasing the personas: {e}")
+            return 0
+        for persona in personas:
+            print(f"You have released {persona.name}!")
+        return released
+
+    def release_where(self, below_level=None, arcana_id=None):
+        """
+        Release every persona in the stock that matches the filters, e.g. all below a level.
+
+        :param below_level: Release personas with a lower level than this (int).
+        :param arcana_id: Release personas of this arcana (int).
+        :return: The number of personas released (int).
+        """
+        personas = self.stock.find_personas(below_level=below_level, arcana_id=arcana_id)
+        if not personas:
+            print("No personas in your stock match.")
+            return 0
+        return self.release_personas(personas)
+
     def add_persona_to_stock(self, name, level, arcana_id):
         """Add a new persona to the player's in-memory stock (not persisted in database)."""
         try:
@@ -201,103 +271,172 @@ class Player:
             print(f"An error occurred while adding the persona: {e}")
     
     def fuse_personas(self, persona_id_1, persona_id_2):
-        """Fuse two personas and return success."""
-        conn = self._connect()
-        cursor = conn.cursor()
-
+        """Fuse two personas and return the new Persona, or None if the fusion failed."""
         try:
-            # Fetch the first persona details
-            cursor.execute("SELECT id, name, level, arcana_id FROM personas WHERE id = ? AND player_id = ?", (persona_id_1, self.player_id))
-            persona_1_data = cursor.fetchone()
-
-            # Fetch the second persona details
-            cursor.execute("SELECT id, name, level, arcana_id FROM personas WHERE id = ? AND player_id = ?", (persona_id_2, self.player_id))
-            persona_2_data = cursor.fetchone()
+            # One transaction for the whole fusion, so it commits once and a
+            # failure at any step leaves the stock untouched
+            with transaction(self.db_name):
+                # Look both personas up in the stock snapshot
+                persona_1 = self.stock.snapshot.get_by_id(persona_id_1)
+                persona_2 = self.stock.snapshot.get_by_id(persona_id_2)
 
-            if not persona_1_data or not persona_2_data:
-                print("One or both of the personas do not exist in your stock.")
-                return False
-            
-            # Convert data to Persona objects
-            persona_1 = Persona(*persona_1_data)
-            persona_2 = Persona(*persona_2_data)
+                if not persona_1 or not persona_2:
+                    print("One or both of the personas do not exist in your stock.")
+                    return None
 
-            # Ensure the personas have different arcanas
-            if persona_1.arcana_id == persona_2.arcana_id:
-                print("The personas have the same arcana. Fusion failed.")
-                return False
+                # Ensure the personas have different arcanas
+                if not can_fuse(persona_1, persona_2):
+                    print("The personas have the same arcana. Fusion failed.")
+                    return None
 
-            # Select a new persona in-memory, generated based on the fusion logic
-            new_persona = self.get_random_fused_persona(persona_1.arcana_id, persona_2.arcana_id)
+                # Select a new persona in-memory, generated based on the fusion logic
+                new_persona = self.get_random_fused_persona(persona_1.arcana_id, persona_2.arcana_id)
 
-            if not new_persona:
-                print("No valid persona found to fuse.")
-                return False
+                if not new_persona:
+                    print("No valid persona found to fuse.")
+                    return None
 
-            # Create the new persona details
-            new_persona_id, new_persona_name, new_persona_level, new_persona_arcana = new_persona
+                # Create the new persona details
+                new_persona_id, new_persona_name, new_persona_level, new_persona_arcana = new_persona
 
-            new_persona_object = Persona(new_persona_id, new_persona_name, new_persona_level, new_persona_arcana)
-            # Add the new persona to the player's in-memory stock
-            self.in_memory_stock.append(new_persona_object) 
-            print(self.in_memory_stock)
+                new_persona_object = Persona(new_persona_id, new_persona_name, new_persona_level, new_persona_arcana)
+                # Add the new persona to the player's in-memory stock
+                self.in_memory_stock.append(new_persona_object) 
 
-            # Remove the fused personas from the stock
-            self.remove_persona_from_stock(persona_1)
-            self.remove_persona_from_stock(persona_2)
+                # Remove the fused personas from the stock
+                self.remove_persona_from_stock(persona_1)
+                self.remove_persona_from_stock(persona_2)
 
-            self.increase_player_level(3)
-            print(f"Your level has increased by 3 to {self.get_player_level()}.")
+                self.increase_player_level(FUSION_LEVEL_GAIN)
+                print(f"Your level has increased by {FUSION_LEVEL_GAIN} to {self.get_player_level()}.")
 
-            print(f"Fusion successful! {new_persona_name} (Level: {new_persona_level}, Arcana: {new_persona_arcana}) has been added to your stock.")
-            return True
+                print(f"Fusion successful! {new_persona_name} (Level: {new_persona_level}, Arcana: {new_persona_arcana}) has been added to your stock.")
+                return new_persona_object
 
         except sqlite3.Error as e:
                 print(f"An error occurred: {e}")
-                return False
-        finally:
-         conn.close()
+                return None
+    def fuse_chain(self, persona_ids):
+        """
+        Fuse a chain of personas: the first two, then the result with the third, and so on.
+
+        Every step follows the normal fusion rules, using the player's level as
+        raised by the steps before it. The whole chain is worked out before
+        anything is written. Then the used personas are released with one
+        statement, the final result is added, and the level is updated, all
+        in one transaction. The intermediate results never reach the stock.
+
+        :param persona_ids: Ids of at least two personas in the stock, in fusion order.
+        :return: The final Persona, or None if any step failed (nothing is changed then).
+        """
+        if len(persona_ids) < 2 or len(set(persona_ids)) != len(persona_ids):
+            print("A fusion chain needs at least two different personas.")
+            return None
+        try:
+            with transaction(self.db_name):
+                personas = [self.stock.snapshot.get_by_id(persona_id) for persona_id in persona_ids]
+                if not all(personas):
+                    print("One or more of the personas do not exist in your stock.")
+                    return None
+
+                chart = get_fusion_chart(self.db_name)
+                level = self.get_player_level()
+                taken = self.stock.snapshot.ids()
+                result = personas[0]
+                for step, persona in enumerate(personas[1:], start=1):
+                    if not can_fuse(result, persona):
+                        print(f"Step {step}: {result.name} and {persona.name} have the same arcana. Fusion failed.")
+                        return None
+                    fused = chart.pick(result.arcana_id, persona.arcana_id, level, exclude_ids=taken)
+                    if fused is None:
+                        print(f"Step {step}: no valid persona found to fuse.")
+                        return None
+                    print(f"Step {step}: {result.name} + {persona.name} -> {fused.name} (Level: {fused.level})")
+                    taken.add(fused.id)
+                    result = fused
+                    level = gain_levels(level, FUSION_LEVEL_GAIN)
+
+                self.stock.release_personas(personas)
+                result.player_id = self.player_id
+                self.stock.add_persona_to_stock(result)
+                self.update_player_level(level)
+
+            print(f"Your level has increased to {self.get_player_level()}.")
+            print(f"Fusion chain successful! {result.name} (Level: {result.level}) has been added to your stock.")
+            return result
+
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            return None
+
     def get_random_fused_persona(self, arcana_id_1, arcana_id_2):
-        """Get a random persona from the database with:
+        """Get a random persona from the fusion chart with:
            - A different arcana from persona_1 and persona_2.
-           - A level ~3 higher than the player's level."""
+           - A level within FUSION_LEVEL_BAND of the player's level."""
         conn = self._connect()
-        cursor = conn.cursor()
 
+        level = self.get_player_level()
         try:
-            # Find all personas with a different arcana from both persona_1 and persona_2
-            cursor.execute("""
-                SELECT id, name, level, arcana_id 
-                FROM personas 
-                WHERE arcana_id NOT IN (?, ?) 
-                AND level BETWEEN ? AND ?
-                ORDER BY RANDOM()
-                 LIMIT 1
-            """, (arcana_id_1, arcana_id_2,self.level - 3, self.level + 3))
-
-            new_persona = cursor.fetchone()
-            new_persona_obj = Persona(*new_persona)
+            # Find a persona with a different arcana from both persona_1 and persona_2
+            new_persona_obj = get_fusion_chart(self.db_name).pick(
+                arcana_id_1, arcana_id_2, level, exclude_ids=self.stock.snapshot.ids()
+            )
+            if new_persona_obj is None:
+                return None
+            new_persona = (new_persona_obj.id, new_persona_obj.name, new_persona_obj.level, new_persona_obj.arcana_id)
             new_persona_obj.player_id = self.player_id
             
-            cursor.execute("""
-            UPDATE personas 
-            SET player_id =? 
-            WHERE id =?
-            """, (new_persona_obj.player_id, new_persona_obj.id)             
-                           )
-            conn.commit()
+            self.stock.add_persona_to_stock(new_persona_obj)
             
             return new_persona  # Returns a tuple: (id, name, level, arcana_id)
         
         except sqlite3.Error as e:
+            if conn.in_transaction:
+                raise  # Part of a fusion, let the whole unit of work roll back
             print(f"An error occurred while fetching a new persona: {e}")
             return None
-        finally:
-            conn.close()
-    
-   
-    
-    
-   
 
-                          
\ No newline at end of file
+    def plan_fusion(self, target):
+        """
+        Show the fewest summons and fusions that can bring a target persona into the stock.
+
+        Results are random, so the plan is the shortest route along which the
+        target can appear; plan again after each step to follow it.
+
+        :param target: The Persona to reach, e.g. from Compendium.find().
+        :return: A list of PlanStep objects, or None if the target cannot be reached.
+        """
+        steps = get_fusion_planner(self.db_name).plan(
+            self.stock.snapshot.personas(), self.get_player_level(), target, self.stock_limit
+        )
+        if steps is None:
+            print(f"{target.name} (Level {target.level}) cannot be reached from your level and stock.")
+        elif not steps:
+            print(f"{target.name} is already in your stock.")
+        else:
+            print(f"Route to {target.name} (Level {target.level}) in {len(steps)} step(s):")
+            for number, step in enumerate(steps, start=1):
+                print(f"{number}. {step.describe()}")
+        return steps
+
+    def preview_fusions(self):
+        """
+        Show what fusing each pair of personas in the stock could yield, without fusing.
+
+        :return: A list of (number_1, number_2, candidate count) tuples using the
+                 stock listing numbers; same-arcana pairs are left out.
+        """
+        personas = self.stock.snapshot.personas()
+        level = self.get_player_level()
+        previews = get_fusion_chart(self.db_name).preview(personas, level, exclude_ids=self.stock.snapshot.ids())
+
+        if not previews:
+            print("There are no personas in your stock that can be fused.")
+            return previews
+
+        min_level, max_level = fusion_band(level)
+        print(f"Possible fusions (results between level {min_level} and {max_level}):")
+        for number_1, number_2, count in previews:
+            persona_1, persona_2 = personas[number_1 - 1], personas[number_2 - 1]
+            print(f"{number_1} + {number_2}: {persona_1.name} + {persona_2.name} -> {count} possible persona(s)")
+        return previews
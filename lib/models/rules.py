@@ -0,0 +1,73 @@
+# The game's selection and levelling rules. The models and the simulator
+# (lib/simulate.py) both read them from here, so tuning a number here changes
+# the game and its simulation together.
+
+MIN_LEVEL = 1
+MAX_LEVEL = 99
+DEFAULT_STOCK_LIMIT = 8
+
+SUMMON_LEVEL_GAIN = 1  # Levels gained per single summon, whether or not a persona joined the stock,
+#                        and per persona a multi-summon (Player.summon_personas) adds
+FUSION_LEVEL_GAIN = 3  # Levels gained per successful fusion
+
+SUMMON_LEVEL_BAND = 3  # A summon draws personas within this many levels of the player
+FUSION_LEVEL_BAND = 3  # A fusion result is within this many levels of the player
+
+# Weights for multi-summons (Stock.summon_personas). A candidate's weight is
+# SUMMON_LEVEL_DECAY ** (levels away from the player) times its arcana's
+# weight (1 if not listed). The defaults weigh every candidate the same, like
+# a single summon.
+SUMMON_LEVEL_DECAY = 1.0
+SUMMON_ARCANA_WEIGHTS = {}  # arcana_id -> weight
+
+
+def clamp_level(level):
+    """Return level limited to MIN_LEVEL..MAX_LEVEL."""
+    return max(MIN_LEVEL, min(MAX_LEVEL, level))
+
+
+def gain_levels(level, gain):
+    """Return the level after gaining some levels, respecting the level cap."""
+    return clamp_level(level + gain)
+
+
+def summon_band(player_level):
+    """Return the (min_level, max_level) band a summon draws from."""
+    # A level 1 player always gets a level 1 persona
+    if player_level == MIN_LEVEL:
+        return MIN_LEVEL, MIN_LEVEL
+    return clamp_level(player_level - SUMMON_LEVEL_BAND), clamp_level(player_level + SUMMON_LEVEL_BAND)
+
+
+def fusion_band(player_level):
+    """Return the (min_level, max_level) band a fusion result is drawn from."""
+    return clamp_level(player_level - FUSION_LEVEL_BAND), clamp_level(player_level + FUSION_LEVEL_BAND)
+
+
+def can_fuse(persona_1, persona_2):
+    """Return True if two personas may be fused (they must have different arcanas)."""
+    return persona_1.arcana_id != persona_2.arcana_id
+
+
+def is_stock_full(stock_count, stock_limit=DEFAULT_STOCK_LIMIT):
+    """Return True if a stock with stock_count personas has no room left."""
+    return stock_count >= stock_limit
+
+
+def summon_weight(player_level, level_decay=None, arcana_weights=None):
+    """
+    Return the weight function multi-summons draw with, for Compendium.sample().
+
+    :param player_level: Level of the player summoning (int).
+    :param level_decay: Weight factor per level of distance (default SUMMON_LEVEL_DECAY).
+    :param arcana_weights: Dict of arcana_id -> weight (default SUMMON_ARCANA_WEIGHTS).
+    :return: A function (level, arcana_id) -> weight, or None if every weight is 1.
+    """
+    level_decay = SUMMON_LEVEL_DECAY if level_decay is None else level_decay
+    arcana_weights = SUMMON_ARCANA_WEIGHTS if arcana_weights is None else arcana_weights
+    if level_decay == 1 and not arcana_weights:
+        return None
+
+    def weight(level, arcana_id):
+        return level_decay ** abs(level - player_level) * arcana_weights.get(arcana_id, 1.0)
+    return weight
@@ -0,0 +1,228 @@
+import sqlite3
+
+from models.database import DEFAULT_DB, get_connection
+
+# Ordered list of migrations. Migration N (1-based) upgrades a database whose
+# PRAGMA user_version is N - 1. Only ever append to this list; never edit a
+# migration that has already shipped.
+MIGRATIONS = [
+    # 1: base tables, for databases that predate the schema being tracked here
+    """
+    CREATE TABLE IF NOT EXISTS arcanas (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        level INTEGER NOT NULL DEFAULT 1,
+        stock_limit INTEGER NOT NULL DEFAULT 8
+    );
+    CREATE TABLE IF NOT EXISTS personas (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        level INTEGER NOT NULL,
+        arcana_id INTEGER REFERENCES arcanas (id),
+        player_id INTEGER REFERENCES players (id)
+    );
+    """,
+    # 2: indexes on the columns every stock and catalog query filters on
+    """
+    -- Stock lookups: covers SELECT id, name, level, arcana_id ... WHERE player_id = ?
+    CREATE INDEX IF NOT EXISTS idx_personas_player
+        ON personas (player_id, level, arcana_id, name);
+    -- Summon and fusion bands: WHERE level BETWEEN ? AND ? [AND arcana_id ...]
+    CREATE INDEX IF NOT EXISTS idx_personas_level_arcana
+        ON personas (level, arcana_id);
+    -- Arcana listings: WHERE arcana_id = ?, returning name and level
+    CREATE INDEX IF NOT EXISTS idx_personas_arcana_level
+        ON personas (arcana_id, level, name);
+    -- Player login: WHERE name = ?
+    CREATE INDEX IF NOT EXISTS idx_players_name
+        ON players (name);
+    """,
+    # 3: how far the event journal (models/journal.py) has been applied
+    """
+    CREATE TABLE IF NOT EXISTS journal_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        applied_seq INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO journal_state (id, applied_seq) VALUES (1, 0);
+    """,
+    # 4: aggregates read by models/stats.py, kept up to date by triggers so
+    # every write path (models, journal, seed, transfer) maintains them
+    """
+    -- Personas owned per player
+    CREATE TABLE IF NOT EXISTS stock_counts (
+        player_id INTEGER PRIMARY KEY,
+        personas INTEGER NOT NULL
+    );
+    -- Owned personas per arcana; personas without an arcana count under 0
+    CREATE TABLE IF NOT EXISTS arcana_counts (
+        arcana_id INTEGER PRIMARY KEY,
+        personas INTEGER NOT NULL
+    );
+    -- Players per level, so a player's rank sums at most MAX_LEVEL rows
+    CREATE TABLE IF NOT EXISTS level_counts (
+        level INTEGER PRIMARY KEY,
+        players INTEGER NOT NULL
+    );
+    -- Leaderboard: ORDER BY level DESC, id LIMIT ?
+    CREATE INDEX IF NOT EXISTS idx_players_level
+        ON players (level DESC, id);
+
+    INSERT OR REPLACE INTO stock_counts (player_id, personas)
+        SELECT player_id, COUNT(*) FROM personas WHERE player_id IS NOT NULL GROUP BY player_id;
+    INSERT OR REPLACE INTO arcana_counts (arcana_id, personas)
+        SELECT IFNULL(arcana_id, 0), COUNT(*) FROM personas WHERE player_id IS NOT NULL GROUP BY 1;
+    INSERT OR REPLACE INTO level_counts (level, players)
+        SELECT level, COUNT(*) FROM players GROUP BY level;
+
+    CREATE TRIGGER IF NOT EXISTS stats_persona_insert AFTER INSERT ON personas
+    WHEN NEW.player_id IS NOT NULL
+    BEGIN
+        INSERT INTO stock_counts (player_id, personas) VALUES (NEW.player_id, 1)
+            ON CONFLICT (player_id) DO UPDATE SET personas = personas + 1;
+        INSERT INTO arcana_counts (arcana_id, personas) VALUES (IFNULL(NEW.arcana_id, 0), 1)
+            ON CONFLICT (arcana_id) DO UPDATE SET personas = personas + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_persona_delete AFTER DELETE ON personas
+    WHEN OLD.player_id IS NOT NULL
+    BEGIN
+        UPDATE stock_counts SET personas = personas - 1 WHERE player_id = OLD.player_id;
+        UPDATE arcana_counts SET personas = personas - 1 WHERE arcana_id = IFNULL(OLD.arcana_id, 0);
+    END;
+    -- An ownership or arcana change counts as leaving the old stock and
+    -- joining the new one; rewriting the same values (journal replay) is ignored
+    CREATE TRIGGER IF NOT EXISTS stats_persona_leave AFTER UPDATE OF player_id, arcana_id ON personas
+    WHEN OLD.player_id IS NOT NULL
+        AND (NEW.player_id IS NOT OLD.player_id OR NEW.arcana_id IS NOT OLD.arcana_id)
+    BEGIN
+        UPDATE stock_counts SET personas = personas - 1 WHERE player_id = OLD.player_id;
+        UPDATE arcana_counts SET personas = personas - 1 WHERE arcana_id = IFNULL(OLD.arcana_id, 0);
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_persona_join AFTER UPDATE OF player_id, arcana_id ON personas
+    WHEN NEW.player_id IS NOT NULL
+        AND (NEW.player_id IS NOT OLD.player_id OR NEW.arcana_id IS NOT OLD.arcana_id)
+    BEGIN
+        INSERT INTO stock_counts (player_id, personas) VALUES (NEW.player_id, 1)
+            ON CONFLICT (player_id) DO UPDATE SET personas = personas + 1;
+        INSERT INTO arcana_counts (arcana_id, personas) VALUES (IFNULL(NEW.arcana_id, 0), 1)
+            ON CONFLICT (arcana_id) DO UPDATE SET personas = personas + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_player_insert AFTER INSERT ON players
+    BEGIN
+        INSERT INTO level_counts (level, players) VALUES (NEW.level, 1)
+            ON CONFLICT (level) DO UPDATE SET players = players + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_player_level AFTER UPDATE OF level ON players
+    WHEN NEW.level IS NOT OLD.level
+    BEGIN
+        UPDATE level_counts SET players = players - 1 WHERE level = OLD.level;
+        INSERT INTO level_counts (level, players) VALUES (NEW.level, 1)
+            ON CONFLICT (level) DO UPDATE SET players = players + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_player_delete AFTER DELETE ON players
+    BEGIN
+        UPDATE level_counts SET players = players - 1 WHERE level = OLD.level;
+    END;
+    """,
+    # 5: ownership moves out of personas.player_id into its own table, so any
+    # number of players can own the same persona and personas is read-only catalog
+    """
+    CREATE TABLE IF NOT EXISTS player_stock (
+        player_id INTEGER NOT NULL REFERENCES players (id),
+        persona_id INTEGER NOT NULL REFERENCES personas (id),
+        PRIMARY KEY (player_id, persona_id)
+    ) WITHOUT ROWID;
+    -- Catalog changes that reach the owners: WHERE persona_id = ?
+    CREATE INDEX IF NOT EXISTS idx_player_stock_persona
+        ON player_stock (persona_id);
+
+    -- The aggregates already count the current owners, so the old triggers
+    -- go before the column is cleared
+    DROP TRIGGER IF EXISTS stats_persona_insert;
+    DROP TRIGGER IF EXISTS stats_persona_delete;
+    DROP TRIGGER IF EXISTS stats_persona_leave;
+    DROP TRIGGER IF EXISTS stats_persona_join;
+    INSERT OR IGNORE INTO player_stock (player_id, persona_id)
+        SELECT player_id, id FROM personas WHERE player_id IS NOT NULL;
+    UPDATE personas SET player_id = NULL WHERE player_id IS NOT NULL;
+    DROP INDEX IF EXISTS idx_personas_player;
+
+    CREATE TRIGGER IF NOT EXISTS stats_stock_add AFTER INSERT ON player_stock
+    BEGIN
+        INSERT INTO stock_counts (player_id, personas) VALUES (NEW.player_id, 1)
+            ON CONFLICT (player_id) DO UPDATE SET personas = personas + 1;
+        INSERT INTO arcana_counts (arcana_id, personas)
+            SELECT IFNULL(arcana_id, 0), 1 FROM personas WHERE id = NEW.persona_id
+            ON CONFLICT (arcana_id) DO UPDATE SET personas = personas + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_stock_remove AFTER DELETE ON player_stock
+    BEGIN
+        UPDATE stock_counts SET personas = personas - 1 WHERE player_id = OLD.player_id;
+        UPDATE arcana_counts SET personas = personas - 1
+            WHERE arcana_id = (SELECT IFNULL(arcana_id, 0) FROM personas WHERE id = OLD.persona_id);
+    END;
+    -- Before the delete, so stats_stock_remove can still look up the arcana
+    CREATE TRIGGER IF NOT EXISTS stock_persona_delete BEFORE DELETE ON personas
+    BEGIN
+        DELETE FROM player_stock WHERE persona_id = OLD.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS stats_persona_arcana AFTER UPDATE OF arcana_id ON personas
+    WHEN NEW.arcana_id IS NOT OLD.arcana_id
+    BEGIN
+        UPDATE arcana_counts
+            SET personas = personas - (SELECT COUNT(*) FROM player_stock WHERE persona_id = OLD.id)
+            WHERE arcana_id = IFNULL(OLD.arcana_id, 0);
+        INSERT INTO arcana_counts (arcana_id, personas)
+            SELECT IFNULL(NEW.arcana_id, 0), COUNT(*) FROM player_stock WHERE persona_id = NEW.id
+            ON CONFLICT (arcana_id) DO UPDATE SET personas = personas + excluded.personas;
+    END;
+    """,
+    # 6: how many shards (models/sharding.py) hold a catalog's players, since
+    # players can only be found again with the count they were placed with
+    """
+    CREATE TABLE IF NOT EXISTS shard_config (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        shard_count INTEGER NOT NULL
+    );
+    """,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(db_name=DEFAULT_DB):
+    """Return the migration version the database is currently at."""
+    return get_connection(db_name).execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_name=DEFAULT_DB, target=SCHEMA_VERSION):
+    """
+    Bring the database schema up to the target version.
+
+    Each migration runs in its own transaction together with the
+    user_version bump, so an interrupted upgrade can simply be re-run.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :param target: Version to migrate to (default is the latest).
+    :return: The schema version after migrating (int).
+    """
+    conn = get_connection(db_name)
+    version = get_schema_version(db_name)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code supports ({SCHEMA_VERSION})."
+        )
+
+    while version < target:
+        script = MIGRATIONS[version]
+        version += 1
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return version
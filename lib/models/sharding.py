@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import zlib
+from urllib.parse import quote
+
+from models.database import DEFAULT_DB, ON_OPEN, close_all, get_connection, transaction
+from models.schema import migrate
+
+# Sharding splits player state (players, stocks, their aggregates) over
+# several database files so that writes for different players take different
+# SQLite write locks. The catalog (arcanas, personas) stays in the original
+# file, which every shard ATTACHes read-only as "catalog". Players live in
+# shard (id - 1) % count, and a new player's shard is picked from a hash of
+# their name, so logging in by name or loading by id both find them. Both
+# depend on the count, so the catalog records it and a different one is refused.
+
+SHARDS = {}  # catalog db_name -> [shard db_name, ...]
+_shard_of = {}  # shard db_name -> (catalog db_name, index)
+
+# The stock triggers of migration 5 look arcanas up in personas, which a
+# shard does not have. Triggers stored in a database cannot read attached
+# ones, so each shard connection gets TEMP copies that read the catalog.
+SHARD_TRIGGERS = """
+    CREATE TEMP TRIGGER IF NOT EXISTS stats_stock_add AFTER INSERT ON main.player_stock
+    BEGIN
+        INSERT INTO stock_counts (player_id, personas) VALUES (NEW.player_id, 1)
+            ON CONFLICT (player_id) DO UPDATE SET personas = personas + 1;
+        INSERT INTO arcana_counts (arcana_id, personas)
+            SELECT IFNULL(arcana_id, 0), 1 FROM catalog.personas WHERE id = NEW.persona_id
+            ON CONFLICT (arcana_id) DO UPDATE SET personas = personas + 1;
+    END;
+    CREATE TEMP TRIGGER IF NOT EXISTS stats_stock_remove AFTER DELETE ON main.player_stock
+    BEGIN
+        UPDATE stock_counts SET personas = personas - 1 WHERE player_id = OLD.player_id;
+        UPDATE arcana_counts SET personas = personas - 1
+            WHERE arcana_id = (SELECT IFNULL(arcana_id, 0) FROM catalog.personas WHERE id = OLD.persona_id);
+    END;
+"""
+
+
+def shard_names(count, db_name=DEFAULT_DB):
+    """Return the file names of db_name's shards, e.g. velvetRoom.shard0.db."""
+    stem, extension = os.path.splitext(db_name)
+    return [f"{stem}.shard{index}{extension or '.db'}" for index in range(count)]
+
+
+def recorded_shard_count(db_name=DEFAULT_DB):
+    """
+    Return how many shards db_name's players are kept in, or None if it was never sharded.
+
+    Catalogs sharded before the count was recorded are recognised by their
+    shard files.
+    """
+    try:
+        row = get_connection(db_name).execute("SELECT shard_count FROM shard_config").fetchone()
+    except sqlite3.OperationalError:  # Schema older than migration 6
+        row = None
+    if row:
+        return row[0]
+    count = 0
+    while os.path.exists(shard_names(count + 1, db_name)[-1]):
+        count += 1
+    return count or None
+
+
+def check_shard_count(count, db_name=DEFAULT_DB):
+    """
+    Make sure db_name is used with the shard count its players were placed with.
+
+    :param count: Number of shards about to be used, or None when unsharded.
+    :raise ValueError: If the catalog records another count.
+    """
+    recorded = recorded_shard_count(db_name)
+    if recorded is not None and recorded != count:
+        raise ValueError(
+            f"{db_name} keeps its players in {recorded} shard(s); run with --shards {recorded}, "
+            "since players placed with one count are not found with another."
+        )
+
+
+def enable_sharding(count, db_name=DEFAULT_DB):
+    """
+    Keep player state in count shard files next to db_name, which keeps the catalog.
+
+    Shards are created and migrated if needed. Call it before the first
+    Player or Stock is loaded. Players already in db_name itself are not
+    moved and are no longer seen.
+
+    :param count: Number of shards (int).
+    :param db_name: Name of the catalog database file (default 'velvetRoom.db').
+    :return: The list of shard file names.
+    :raise ValueError: If db_name was sharded with another count.
+    """
+    migrate(db_name)
+    check_shard_count(count, db_name)
+    with transaction(db_name) as conn:
+        conn.execute("INSERT OR IGNORE INTO shard_config (id, shard_count) VALUES (1, ?)", (count,))
+    catalog_uri = f"file:{quote(os.path.abspath(db_name))}?mode=ro"
+    shards = shard_names(count, db_name)
+    for index, shard in enumerate(shards):
+        migrate(shard)
+        # Catalog tables would hide the attached ones, and their stored
+        # triggers are replaced by SHARD_TRIGGERS. main. matters when the
+        # catalog is already attached, as it is when called a second time.
+        get_connection(shard).executescript("""
+            DROP TRIGGER IF EXISTS main.stats_stock_add;
+            DROP TRIGGER IF EXISTS main.stats_stock_remove;
+            DROP TABLE IF EXISTS main.personas;
+            DROP TABLE IF EXISTS main.arcanas;
+        """)
+        ON_OPEN[shard] = f"ATTACH DATABASE '{catalog_uri}' AS catalog;\n{SHARD_TRIGGERS}"
+        _shard_of[shard] = (db_name, index)
+    SHARDS[db_name] = shards
+    # Reconnect with the catalog attached
+    close_all()
+    return shards
+
+
+def catalog_of(db_name=DEFAULT_DB):
+    """Return the database holding db_name's catalog: its own name unless it is a shard."""
+    return _shard_of.get(db_name, (db_name,))[0]
+
+
+def shards_of(db_name=DEFAULT_DB):
+    """Return every database holding player state for db_name's catalog (just db_name when unsharded)."""
+    catalog = catalog_of(db_name)
+    return SHARDS.get(catalog, [catalog])
+
+
+def shard_for_player(db_name, player_id):
+    """Return the database that holds a player's state, given their id."""
+    shards = SHARDS.get(catalog_of(db_name))
+    if not shards or player_id is None:
+        return db_name
+    return shards[(player_id - 1) % len(shards)]
+
+
+def shard_for_name(db_name, name):
+    """Return the database that holds (or will hold) the player with this name."""
+    shards = SHARDS.get(catalog_of(db_name))
+    if not shards:
+        return db_name
+    return shards[zlib.crc32(name.encode()) % len(shards)]
+
+
+def new_player_id(db_name):
+    """
+    Return the id to give a player created in db_name, or None to let SQLite choose.
+
+    Shard i hands out i + 1, i + 1 + count, ... so shard_for_player() can find
+    the player again. Call it inside the transaction that inserts the player.
+    """
+    if db_name not in _shard_of:
+        return None
+    catalog, index = _shard_of[db_name]
+    count = len(SHARDS[catalog])
+    return get_connection(db_name).execute(
+        "SELECT IFNULL(MAX(id), ?) + ? FROM players", (index + 1 - count, count)
+    ).fetchone()[0]
@@ -0,0 +1,99 @@
+import heapq
+from collections import Counter
+from itertools import islice
+
+from models.database import DEFAULT_DB, get_connection
+from models.journal import get_journal
+from models.sharding import shard_for_player, shards_of
+
+# Game-wide statistics. Every query reads the aggregate tables of migration 4,
+# which triggers keep up to date on each write, so none of them scans the
+# personas or players tables and each costs the same however big those get.
+# When sharding is enabled, game-wide figures add up the aggregates of every
+# shard (a handful of small queries) instead of reading one file.
+
+NO_ARCANA = 0  # arcana_counts key of owned personas without an arcana
+
+
+def _connect(db_name):
+    """Private helper returning a connection whose aggregates include every committed action."""
+    journal = get_journal(db_name)
+    if journal:
+        journal.flush()  # Journaled actions only reach the tables, and so the triggers, when applied
+    return get_connection(db_name)
+
+
+def stock_count(player_id, db_name=DEFAULT_DB):
+    """Return the number of personas in a player's stock (int)."""
+    row = _connect(shard_for_player(db_name, player_id)).execute(
+        "SELECT personas FROM stock_counts WHERE player_id = ?", (player_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def player_rank(level, db_name=DEFAULT_DB):
+    """Return the leaderboard rank of a player at this level; players on the same level share it."""
+    above = sum(
+        _connect(shard).execute(
+            "SELECT IFNULL(SUM(players), 0) FROM level_counts WHERE level > ?", (level,)
+        ).fetchone()[0]
+        for shard in shards_of(db_name)
+    )
+    return above + 1
+
+
+def leaderboard(limit=10, db_name=DEFAULT_DB):
+    """
+    Return the highest-level players.
+
+    :param limit: Number of players to return (int).
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :return: A list of (rank, name, level, stock count) tuples, best first.
+    """
+    # The best players overall are among the best of each shard
+    rows = heapq.merge(*(
+        _connect(shard).execute("""
+            SELECT -players.level, players.id, players.name, IFNULL(stock_counts.personas, 0)
+            FROM players LEFT JOIN stock_counts ON stock_counts.player_id = players.id
+            ORDER BY players.level DESC, players.id
+            LIMIT ?
+        """, (limit,)).fetchall()
+        for shard in shards_of(db_name)
+    ))
+    board = []
+    for position, (level, _, name, personas) in enumerate(islice(rows, limit), start=1):
+        level = -level
+        # Competition ranking: ties share the rank of the first of them
+        rank = board[-1][0] if board and board[-1][2] == level else position
+        board.append((rank, name, level, personas))
+    return board
+
+
+def arcana_distribution(db_name=DEFAULT_DB):
+    """
+    Return how the personas in all stocks are spread over the arcanas.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :return: A list of (arcana_id, arcana name, owned personas) tuples, most owned first.
+             Personas without an arcana are listed under NO_ARCANA.
+    """
+    owned = Counter()
+    for shard in shards_of(db_name):
+        for arcana_id, name, personas in _connect(shard).execute("""
+            SELECT arcana_counts.arcana_id, IFNULL(arcanas.name, '(none)'), arcana_counts.personas
+            FROM arcana_counts LEFT JOIN arcanas ON arcanas.id = arcana_counts.arcana_id
+            WHERE arcana_counts.personas > 0
+        """):
+            owned[arcana_id, name] += personas
+    return sorted(((arcana_id, name, personas) for (arcana_id, name), personas in owned.items()),
+                  key=lambda row: (-row[2], row[0]))
+
+
+def totals(db_name=DEFAULT_DB):
+    """Return (number of players, number of personas in stocks)."""
+    players = owned = 0
+    for shard in shards_of(db_name):
+        conn = _connect(shard)
+        players += conn.execute("SELECT IFNULL(SUM(players), 0) FROM level_counts").fetchone()[0]
+        owned += conn.execute("SELECT IFNULL(SUM(personas), 0) FROM arcana_counts").fetchone()[0]
+    return players, owned
@@ -1,172 +1,187 @@
 import sqlite3
-import random
-from models.persona import Persona
+from models.compendium import get_compendium
+from models.database import DEFAULT_DB, get_connection, transaction
+from models.journal import get_journal
+from models.paging import PAGE_SIZE
+from models.rules import DEFAULT_STOCK_LIMIT, is_stock_full, summon_band, summon_weight
+from models.sharding import shard_for_player
+from models.stock_snapshot import StockSnapshot
+
+# Most ids bound to one bulk release statement
+RELEASE_CHUNK_SIZE = 500
 
 class Stock:
-    def __init__(self, db_name='velvetRoom.db', player_id=None):
-        self.db_name = db_name
+    def __init__(self, db_name=DEFAULT_DB, player_id=None, player=None):
+        """
+        Initialize a Stock object.
+
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        :param player_id: ID of the player who owns the stock (int).
+        :param player: The owning Player, optional. When given, its cached level
+                       and stock limit are used instead of querying the players table.
+        """
+        self.db_name = db_name = shard_for_player(db_name, player_id)  # The player's shard, if sharded
         self.player_id = player_id
+        self.player = player
+        # In-memory copy of the stock that listings, numbered lookups and the
+        # summon exclusions all read from
+        self.snapshot = StockSnapshot(db_name=db_name, player_id=player_id)
 
     def _connect(self):
-        """Private method to establish a connection to the SQLite database."""
-        return sqlite3.connect(self.db_name)
+        """Private method to get the shared connection to the SQLite database."""
+        return get_connection(self.db_name)
 
     def get_personas_in_stock(self):
         """Retrieve all personas in the player's stock."""
         if not self.player_id:
             raise ValueError("Player ID is not set. Cannot retrieve stock data.")
-        
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM personas WHERE player_id = ?", (self.player_id,))
-        personas = cursor.fetchall()  # Fetch all personas in the stock
-        conn.close()
 
-        # Return persona objects
-        return [Persona(*persona) for persona in personas]
+        return self.snapshot.personas()
     def get_stock_count(self):
         """Returns the number of personas in the player's stock."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM personas WHERE player_id = ?", (self.player_id,))
-        stock_count = cursor.fetchone()[0]
-        conn.close()
-        return stock_count
-    def is_stock_full(self, max_stock=8):
-        """Check if the player's stock is full (default is 8)."""
-        stock_count = self.get_stock_count()
-        return stock_count >= max_stock
+        return len(self.snapshot)
+    def is_stock_full(self, max_stock=None):
+        """Check if the player's stock is full (default is the player's stock limit, or DEFAULT_STOCK_LIMIT)."""
+        if max_stock is None:
+            max_stock = self.player.stock_limit if self.player else DEFAULT_STOCK_LIMIT
+        return is_stock_full(self.get_stock_count(), max_stock)
 
     def summon_persona(self):
-        """Summon a random persona based on the player's level."""
-        player_level = self.get_player_level()
-
-        # Get personas within ±3 levels of the player's level
-        persona = self.get_random_persona_from_db(player_level)
-
-        if persona:
-            # Check if stock is full before adding
-            if not self.is_stock_full():
-                if not self.is_persona_in_stock(persona.id):
-                    self.add_persona_to_stock(persona)
-                    print(f"You have summoned {persona.name}!")
+        """Summon a random persona based on the player's level and return it, or None."""
+        # Read the level, pick and store the persona as one unit of work
+        with transaction(self.db_name):
+            player_level = self.get_player_level()
+
+            # Get personas within the summon band around the player's level
+            persona = self.get_random_persona_from_db(player_level)
+
+            if persona:
+                # Check if stock is full before adding
+                if not self.is_stock_full():
+                    if not self.is_persona_in_stock(persona.id):
+                        self.add_persona_to_stock(persona)
+                        print(f"You have summoned {persona.name}!")
+                        return persona
+                    else:
+                        print(f"You already have {persona.name} in your stock.")  
                 else:
-                    print(f"You already have {persona.name} in your stock.")  
+                    print("Your stock is full. Cannot summon more personas.")
             else:
+                print("No personas found matching your level range.")
+
+    def summon_personas(self, count, level_decay=None, arcana_weights=None):
+        """
+        Summon up to count distinct personas at once and return them.
+
+        The personas are drawn together from the summon band of the player's
+        current level, weighted by rules.summon_weight(), and never include
+        personas already in the stock. Only as many as the stock has room for
+        are drawn, and they are all stored with one statement.
+
+        :param count: Number of personas to summon (int).
+        :param level_decay: Weight factor per level of distance, see rules.summon_weight().
+        :param arcana_weights: Dict of arcana_id -> weight, see rules.summon_weight().
+        :return: A list of the Persona objects that joined the stock.
+        """
+        with transaction(self.db_name) as conn:
+            player_level = self.get_player_level()
+            max_stock = self.player.stock_limit if self.player else DEFAULT_STOCK_LIMIT
+            room = max(0, max_stock - self.get_stock_count())
+            if room == 0:
                 print("Your stock is full. Cannot summon more personas.")
-        else:
-            print("No personas found matching your level range.")
+                return []
+            if count > room:
+                print(f"Your stock only has room for {room} more persona(s).")
+
+            personas = get_compendium(self.db_name).sample(
+                *summon_band(player_level), min(count, room),
+                weight=summon_weight(player_level, level_decay, arcana_weights),
+                exclude_ids=self.snapshot.ids(),
+            )
+            if not personas:
+                print("No personas found matching your level range.")
+                return []
+
+            journal = get_journal(self.db_name)
+            if journal:
+                for persona in personas:
+                    journal.record("stock_add", player_id=self.player_id, persona_id=persona.id)
+            else:
+                conn.executemany("INSERT OR IGNORE INTO player_stock (player_id, persona_id) VALUES (?, ?)",
+                                 [(self.player_id, persona.id) for persona in personas])
+            for persona in personas:
+                persona.player_id = self.player_id
+                self.snapshot.add(persona)
+                print(f"You have summoned {persona.name}!")
+            if len(personas) < min(count, room):
+                print(f"Only {len(personas)} persona(s) matched your level range.")
+            return personas
 
     def get_random_persona_from_db(self, player_level):
-        """Get a random persona from the database based on the player's level."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        
+        """Get a random persona from the compendium based on the player's level."""
         # Get a list of persona IDS already in the player's stock
-        cursor.execute("SELECT id FROM personas WHERE player_id = ?", (self.player_id,))
-        stock_persona_ids = {row[0] for row in cursor.fetchall()}
-        # Reconnect to filter out personas already in stock
-        conn = self._connect()
-        cursor = conn.cursor()
-        #initialize min_level and max_level
-        min_level = 1
-        max_level = 99  
-        
-        
-        # If the player is level 1, ensure they always get a level 1 persona
-        if player_level == 1:
-         cursor.execute("""
-            SELECT * FROM personas WHERE level = 1
-        """)
-        else:
-        # Calculate level range (±3 of player level) for players above level 1
-         min_level = max(1, player_level - 3)  # Ensure level is at least 1
-        max_level = min(99, player_level + 3)  # Cap level at 99
-        cursor.execute("""
-            SELECT * FROM personas 
-            WHERE level BETWEEN ? AND ? AND id NOT IN ({})
-        """.format(','.join('?' for _ in stock_persona_ids)), [min_level, max_level] + list(stock_persona_ids))
-        
-        matching_personas = cursor.fetchall()
-        conn.close()
-
-        if matching_personas:
-            # Randomly select one persona from the matching ones
-            random_persona_data = random.choice(matching_personas)
-            return Persona(*random_persona_data)
-        else:
-            return None
+        stock_persona_ids = self.snapshot.ids()
+
+        # Level 1 players only get level 1 personas, everyone else ±SUMMON_LEVEL_BAND
+        min_level, max_level = summon_band(player_level)
+
+        # Randomly select one persona from the matching ones
+        return get_compendium(self.db_name).pick(min_level, max_level, exclude_ids=stock_persona_ids)
 
     def add_persona_to_stock(self, persona):
         """Add a persona to the player's stock."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE personas SET player_id = ? WHERE id = ?
-        """, (self.player_id, persona.id))
-        conn.commit()
-        conn.close()
+        journal = get_journal(self.db_name)
+        if journal:
+            journal.record("stock_add", player_id=self.player_id, persona_id=persona.id)
+        else:
+            with transaction(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT OR IGNORE INTO player_stock (player_id, persona_id) VALUES (?, ?)
+                """, (self.player_id, persona.id))
+        self.snapshot.add(persona)
 
     def is_persona_in_stock(self, persona_id):
         """Check if a persona is already in the player's stock."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM personas WHERE player_id = ? AND id = ?", (self.player_id, persona_id))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        return self.snapshot.get_by_id(persona_id) is not None
 
     def get_player_level(self):
         """Get the current level of the player."""
+        if self.player:
+            return self.player.get_player_level()
         conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("SELECT level FROM players WHERE id = ?", (self.player_id,))
         player_level = cursor.fetchone()[0]
-        conn.close()
         return player_level
 
-    def list_stock(self):
-        """List all personas in the player's stock with a number next to each name."""
-        conn = self._connect()
-        cursor = conn.cursor()
+    def list_stock(self, after=None, before=None, limit=PAGE_SIZE):
+        """
+        List one page of the player's stock with a number next to each name.
 
+        :param after: Id of the last persona shown; list the page after it.
+        :param before: Id of the first persona shown; list the page before it.
+        :param limit: Most personas per page (int).
+        :return: The Page that was listed, or None if the stock could not be read.
+        """
         try:
-            cursor.execute("""
-            SELECT personas.id, personas.name, personas.level, arcanas.name 
-            FROM personas 
-            JOIN arcanas ON personas.arcana_id = arcanas.id               
-            WHERE personas.player_id = ?
-            """, (self.player_id,))
-            
-            
-            personas = cursor.fetchall()
-            conn.close()
-
-            if personas:
+            page = self.snapshot.page(after=after, before=before, limit=limit)
+
+            if page:
                 print("Your personas:")
-                for index, persona in enumerate(personas, start=1):
-                    persona, name, level, arcana_name = persona
-                    print(f"{index}. {name} (Level: {level}, Arcana: {arcana_name})")
+                for index, (persona, arcana_name) in page.numbered():
+                    print(f"{index}. {persona.name} (Level: {persona.level}, Arcana: {arcana_name})")
+                if page.has_previous or page.has_next:
+                    print(f"(Personas {page.number}-{page.number + len(page) - 1} of {len(self.snapshot)})")
             else:
                 print("You have no personas in your stock.")
+            return page
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
-            conn.close()
 
     def get_persona_by_number(self, selection_number):
         """Fetch a persona by its number in the list."""
-        conn = self._connect()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id, name, level, arcana_id FROM personas WHERE player_id = ?", (self.player_id,))
-        personas = cursor.fetchall()
-        conn.close()
-
-        if 0 < selection_number <= len(personas):
-            persona_data = personas[selection_number - 1]
-            return Persona(*persona_data)
-        else:
-            return None
+        return self.snapshot.get_by_number(selection_number)
     def release_persona(self):
         """Release a persona from the player's stock."""
         self.list_stock()  # Display the personas in a numbered list
@@ -182,10 +197,59 @@ class Stock:
                 print("Invalid selection.")
         else:
             print("Please enter a valid number.")
+    def release_personas(self, personas):
+        """
+        Remove several personas from the player's stock with one statement.
+
+        :param personas: Persona objects to release.
+        :return: The number of personas released (int).
+        """
+        persona_ids = sorted({persona.id for persona in personas})
+        if not persona_ids:
+            return 0
+        released = 0
+        journal = get_journal(self.db_name)
+        with transaction(self.db_name) as conn:
+            if journal:
+                for persona_id in persona_ids:
+                    journal.record("stock_remove", player_id=self.player_id, persona_id=persona_id)
+                released = len(persona_ids)
+            else:
+                # Stay well under SQLite's limit on bound parameters for huge lists
+                for start in range(0, len(persona_ids), RELEASE_CHUNK_SIZE):
+                    chunk = persona_ids[start:start + RELEASE_CHUNK_SIZE]
+                    released += conn.execute(
+                        f"DELETE FROM player_stock WHERE player_id = ? AND persona_id IN ({', '.join('?' * len(chunk))})",
+                        (self.player_id, *chunk),
+                    ).rowcount
+            # Inside the transaction so the snapshot refreshes once; a rollback
+            # changes data_version() and makes it re-read the stock
+            for persona_id in persona_ids:
+                self.snapshot.remove(persona_id)
+        return released
+
+    def find_personas(self, below_level=None, arcana_id=None):
+        """
+        Return the personas in the stock that match every filter given.
+
+        :param below_level: Only personas with a lower level than this (int).
+        :param arcana_id: Only personas of this arcana (int).
+        :return: A list of Persona objects in listing order.
+        """
+        return [
+            persona for persona in self.snapshot.personas()
+            if (below_level is None or persona.level < below_level)
+            and (arcana_id is None or persona.arcana_id == arcana_id)
+        ]
+
     def remove_persona_from_stock(self, persona):
         """Remove a persona from the player's stock."""
-        conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE personas SET player_id = NULL WHERE id = ?", (persona.id,))
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        journal = get_journal(self.db_name)
+        if journal:
+            journal.record("stock_remove", player_id=self.player_id, persona_id=persona.id)
+        else:
+            with transaction(self.db_name) as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM player_stock WHERE player_id = ? AND persona_id = ?",
+                               (self.player_id, persona.id))
+        self.snapshot.remove(persona.id)
@@ -0,0 +1,154 @@
+import weakref
+from bisect import bisect_left, bisect_right
+
+from models.compendium import get_compendium
+from models.database import DEFAULT_DB, data_version, get_connection
+from models.paging import PAGE_SIZE, Page, page_bounds
+from models.persona import Persona
+
+# Every live snapshot, so a stock change can be applied to all in-memory
+# copies of the affected stocks instead of making them re-read the table
+_snapshots = weakref.WeakSet()
+
+
+class StockSnapshot:
+    def __init__(self, db_name=DEFAULT_DB, player_id=None):
+        """
+        In-memory copy of one player's stock, in a stable order (by persona id).
+
+        The stock is read from the database once and then kept up to date by
+        add() and remove(), so numbered selections made from a listing always
+        refer to the personas the player was shown. It is only re-read when
+        data_version() says another connection changed the database.
+
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        :param player_id: ID of the player who owns the stock (int).
+        """
+        self.db_name = db_name
+        self.player_id = player_id
+        self._ids = []  # Sorted persona ids, parallel to _entries
+        self._entries = []  # (Persona, arcana name) pairs
+        self._stamp = None
+        _snapshots.add(self)
+
+    def refresh(self):
+        """Re-read the stock if it was never loaded or may be stale."""
+        stamp = data_version(self.db_name)
+        if stamp == self._stamp:
+            return
+        # Only ownership comes from the table; the catalog columns come from the
+        # compendium index (or its mapped file), like add() does
+        compendium = get_compendium(self.db_name)
+        cursor = get_connection(self.db_name).cursor()
+        cursor.execute(
+            "SELECT persona_id FROM player_stock WHERE player_id = ? ORDER BY persona_id", (self.player_id,)
+        )
+        self._entries = []
+        for persona_id, in cursor:
+            persona = compendium.get(persona_id)
+            if persona is None:
+                continue  # Not in the catalog the index was built from
+            persona = Persona(persona.id, persona.name, persona.level, persona.arcana_id, self.player_id, self.db_name)
+            self._entries.append((persona, compendium.arcanas.get(persona.arcana_id)))
+        self._ids = [persona.id for persona, _ in self._entries]
+        self._stamp = stamp
+
+    def invalidate(self):
+        """
+        Make the next read re-load the stock.
+
+        Call it after writing player_stock on this process's own connection
+        without going through add() and remove(): data_version() only notices
+        commits made by other connections.
+        """
+        self._stamp = None
+
+    def __len__(self):
+        self.refresh()
+        return len(self._entries)
+
+    def __iter__(self):
+        """Iterate over (Persona, arcana name) pairs in listing order."""
+        self.refresh()
+        return iter(list(self._entries))
+
+    def personas(self):
+        """Return the personas in listing order."""
+        self.refresh()
+        return [persona for persona, _ in self._entries]
+
+    def ids(self):
+        """Return the set of persona ids in the stock."""
+        self.refresh()
+        return set(self._ids)
+
+    def page(self, after=None, before=None, limit=PAGE_SIZE):
+        """
+        Return one page of the listing, keyed by persona id.
+
+        :param after: Id of the last persona shown; the page starts after it.
+        :param before: Id of the first persona shown; the page ends before it.
+        :param limit: Most personas per page (int).
+        :return: A Page of (Persona, arcana name) pairs, numbered like get_by_number().
+        """
+        self.refresh()
+        start, stop = page_bounds(
+            len(self._ids),
+            start=bisect_right(self._ids, after) if after is not None else None,
+            stop=bisect_left(self._ids, before) if before is not None else None,
+            limit=limit,
+        )
+        return Page(
+            self._entries[start:stop],
+            key=lambda entry: entry[0].id,
+            number=start + 1,
+            has_previous=start > 0,
+            has_next=stop < len(self._ids),
+        )
+
+    def get_by_number(self, selection_number):
+        """Return the persona shown as number selection_number (1-based), or None."""
+        self.refresh()
+        if 0 < selection_number <= len(self._entries):
+            return self._entries[selection_number - 1][0]
+        return None
+
+    def get_by_id(self, persona_id):
+        """Return the persona with this id if it is in the stock, or None."""
+        self.refresh()
+        position = bisect_left(self._ids, persona_id)
+        if position < len(self._ids) and self._ids[position] == persona_id:
+            return self._entries[position][0]
+        return None
+
+    def add(self, persona, arcana_name=None):
+        """Record that persona joined the stock, keeping the listing order."""
+        self.refresh()
+        if arcana_name is None:
+            arcana_name = get_compendium(self.db_name).arcanas.get(persona.arcana_id)
+        for snapshot in list(_snapshots):
+            if snapshot.db_name == self.db_name and snapshot.player_id == self.player_id and snapshot._stamp is not None:
+                snapshot._insert(persona, arcana_name)
+
+    def remove(self, persona_id):
+        """Record that the persona with this id left the stock."""
+        self.refresh()
+        for snapshot in list(_snapshots):
+            if snapshot.db_name == self.db_name and snapshot.player_id == self.player_id:
+                snapshot._discard(persona_id)
+
+    def _insert(self, persona, arcana_name):
+        """Private helper to insert a persona in listing order, without refreshing."""
+        position = bisect_left(self._ids, persona.id)
+        if position < len(self._ids) and self._ids[position] == persona.id:
+            return
+        persona = Persona(persona.id, persona.name, persona.level, persona.arcana_id, self.player_id, self.db_name)
+        self._ids.insert(position, persona.id)
+        self._entries.insert(position, (persona, arcana_name))
+
+    def _discard(self, persona_id):
+        """Private helper to drop a persona if present, without refreshing."""
+        position = bisect_left(self._ids, persona_id)
+        if position < len(self._ids) and self._ids[position] == persona_id:
+            del self._ids[position]
+            del self._entries[position]
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from urllib.parse import quote
+
+from models.database import DEFAULT_DB, TARGETS, close_all
+
+# How often a database kept in memory is copied back to its file
+SNAPSHOT_INTERVAL_SECONDS = 60
+
+# db_name -> connection that keeps the in-memory copy alive and that
+# snapshots are taken from
+_memory = {}
+_snapshotters = {}  # db_name -> (thread, stop event)
+_snapshot_lock = threading.Lock()
+SNAPSHOTS = {"count": 0, "seconds": 0.0}
+
+
+def memory_uri(db_name=DEFAULT_DB):
+    """
+    Return the URI of the in-memory database that stands in for db_name.
+
+    Every connection in the process that opens it shares one copy. The memdb
+    VFS (SQLite 3.36+) locks like a file; older SQLite falls back to a
+    shared-cache in-memory database.
+    """
+    name = quote(os.path.abspath(db_name))
+    if sqlite3.sqlite_version_info >= (3, 36):
+        return f"file:{name}?vfs=memdb"
+    return f"file:{name}?mode=memory&cache=shared"
+
+
+def use_memory(db_name=DEFAULT_DB, load=True):
+    """
+    Keep db_name in memory from now on, so queries and commits never wait on the disk.
+
+    Changes only reach the file through snapshot() (or start_snapshots() and
+    close_memory()). Anything after the last snapshot is lost if the process
+    dies, unless a journal (models/journal.py) is enabled: its file is
+    fsynced on every group commit and replays what the snapshot missed.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :param load: Copy the file's current contents into memory first (bool).
+    """
+    if db_name in _memory:
+        return
+    keeper = sqlite3.connect(memory_uri(db_name), uri=True, check_same_thread=False, isolation_level=None)
+    if load and os.path.exists(db_name):
+        with closing(sqlite3.connect(db_name)) as source:
+            source.backup(keeper)
+    _memory[db_name] = keeper
+    TARGETS[db_name] = memory_uri(db_name)
+    # Connections opened earlier still point at the file
+    close_all()
+
+
+def is_in_memory(db_name=DEFAULT_DB):
+    """Return True if db_name is kept in memory."""
+    return db_name in _memory
+
+
+def snapshot(db_name=DEFAULT_DB, path=None):
+    """
+    Copy an in-memory database to disk with SQLite's online backup API.
+
+    The copy is consistent: it waits for any write in progress and holds
+    writers off only while pages are copied from memory. The target file is
+    replaced in one transaction, so a crash mid-snapshot leaves the previous
+    snapshot intact.
+
+    :param db_name: Name of a database kept in memory (default 'velvetRoom.db').
+    :param path: File to write (default is db_name's own file).
+    :return: Seconds the snapshot took (float).
+    """
+    keeper = _memory.get(db_name)
+    if keeper is None:
+        raise ValueError(f"{db_name} is not kept in memory.")
+    started = time.perf_counter()
+    with _snapshot_lock, closing(sqlite3.connect(path or db_name)) as target:
+        keeper.backup(target)
+    elapsed = time.perf_counter() - started
+    SNAPSHOTS["count"] += 1
+    SNAPSHOTS["seconds"] += elapsed
+    return elapsed
+
+
+def start_snapshots(db_name=DEFAULT_DB, interval=SNAPSHOT_INTERVAL_SECONDS, path=None):
+    """
+    Snapshot an in-memory database every interval seconds on a background thread.
+
+    :param db_name: Name of a database kept in memory (default 'velvetRoom.db').
+    :param interval: Seconds between snapshots (float).
+    :param path: File to write (default is db_name's own file).
+    """
+    stop_snapshots(db_name)
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                snapshot(db_name, path)
+            except sqlite3.Error as e:
+                print(f"Snapshot of {db_name} failed: {e}", file=sys.stderr)
+
+    thread = threading.Thread(target=run, name=f"snapshot-{db_name}", daemon=True)
+    _snapshotters[db_name] = (thread, stop)
+    thread.start()
+
+
+def stop_snapshots(db_name=DEFAULT_DB):
+    """Stop the periodic snapshots of db_name, if they are running."""
+    thread, stop = _snapshotters.pop(db_name, (None, None))
+    if thread is not None:
+        stop.set()
+        thread.join()
+
+
+def close_memory(db_name=DEFAULT_DB, save=True):
+    """
+    Stop keeping db_name in memory, snapshotting it a last time first.
+
+    :param db_name: Name of a database kept in memory (default 'velvetRoom.db').
+    :param save: Write a final snapshot to the file (bool).
+    """
+    if db_name not in _memory:
+        return
+    stop_snapshots(db_name)
+    if save:
+        snapshot(db_name)
+    close_all()
+    TARGETS.pop(db_name, None)
+    _memory.pop(db_name).close()
+
+
+def close_all_memory(save=True):
+    """Snapshot and release every database kept in memory."""
+    for db_name in list(_memory):
+        close_memory(db_name, save)
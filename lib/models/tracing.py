@@ -0,0 +1,246 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# The tracer that is currently recording, or None. Every connection opened by
+# models.database uses TracedConnection, which only does bookkeeping while a
+# tracer is active, so leaving tracing off costs almost nothing. Connections
+# are long-lived and opened before any action, so get_connection() reports
+# each checkout instead of each connection opened.
+ACTIVE = None
+
+UNGROUPED = "(no action)"
+
+
+class ActionStats:
+    def __init__(self, name):
+        """Counters for one high-level action, summed over all of its calls."""
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.commits = 0
+        self.connections = 0  # Connections checked out of the manager
+        self.statements = {}  # SQL text -> [count, seconds]
+
+    def to_dict(self):
+        """Return the counters as a JSON-friendly dict; per-call averages are None without calls."""
+        def per_call(total):
+            return total / self.calls if self.calls else None
+
+        return {
+            "calls": self.calls,
+            "total_ms": self.seconds * 1000,
+            "avg_ms": per_call(self.seconds * 1000),
+            "queries": self.queries,
+            "queries_per_call": per_call(self.queries),
+            "query_ms": self.query_seconds * 1000,
+            "rows": self.rows,
+            "commits": self.commits,
+            "commits_per_call": per_call(self.commits),
+            "connections": self.connections,
+            "statements": [
+                {"sql": sql, "count": count, "total_ms": seconds * 1000}
+                for sql, (count, seconds) in sorted(
+                    self.statements.items(), key=lambda item: item[1][1], reverse=True
+                )
+            ],
+        }
+
+
+class Tracer:
+    def __init__(self):
+        """Collect query, row, commit and connection counts grouped by action."""
+        self.actions = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stats(self, name):
+        """Private helper returning the stats for an action, creating them on first use."""
+        stats = self.actions.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.actions.setdefault(name, ActionStats(name))
+        return stats
+
+    def _current(self):
+        """Private helper returning the stats of the calling thread's innermost action."""
+        stack = getattr(self._local, "stack", None)
+        return self._stats(stack[-1] if stack else UNGROUPED)
+
+    @contextmanager
+    def action(self, name):
+        """Attribute all DB work done inside the block to the action called name."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            stats = self._stats(name)
+            with self._lock:
+                stats.calls += 1
+                stats.seconds += elapsed
+
+    def record_statement(self, sql, seconds):
+        """Count one executed statement and how long it took."""
+        stats = self._current()
+        sql = " ".join(sql.split())
+        with self._lock:
+            stats.queries += 1
+            stats.query_seconds += seconds
+            entry = stats.statements.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            if sql.upper().startswith(("COMMIT", "END")):
+                stats.commits += 1
+
+    def record_rows(self, count):
+        """Count rows fetched from a cursor."""
+        stats = self._current()
+        with self._lock:
+            stats.rows += count
+
+    def record_connection(self):
+        """Count a connection checked out of the manager (models.database.get_connection)."""
+        stats = self._current()
+        with self._lock:
+            stats.connections += 1
+
+    def report(self):
+        """Return every action's counters as a dict keyed by action name."""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in sorted(self.actions.items())}
+
+    def format_report(self, top_statements=3):
+        """Return the report as readable text."""
+        def average(value, spec):
+            return "-" if value is None else format(value, spec)
+
+        lines = ["--- Query trace ---"]
+        for name, stats in self.report().items():
+            lines.append(
+                f"{name}: {stats['calls']} call(s), {average(stats['avg_ms'], '.2f')} ms avg, "
+                f"{average(stats['queries_per_call'], '.1f')} queries/call, {stats['rows']} rows, "
+                f"{stats['commits']} commit(s), {stats['connections']} connection checkout(s)"
+            )
+            for statement in stats["statements"][:top_statements]:
+                lines.append(f"    {statement['count']:>6} x {statement['total_ms']:8.2f} ms  {statement['sql'][:80]}")
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        """Write the report to path as JSON."""
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """A cursor that reports statements and fetched rows to the active tracer."""
+
+    def execute(self, sql, parameters=()):
+        if ACTIVE is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            ACTIVE.record_statement(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if ACTIVE is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            ACTIVE.record_statement(sql, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        if ACTIVE is None:
+            return super().executescript(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            ACTIVE.record_statement(sql_script, time.perf_counter() - started)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if ACTIVE is not None and row is not None:
+            ACTIVE.record_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if ACTIVE is not None:
+            ACTIVE.record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if ACTIVE is not None:
+            ACTIVE.record_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        if ACTIVE is not None:
+            ACTIVE.record_rows(1)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """A connection whose statements and commits go through the active tracer."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        if ACTIVE is None or not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            ACTIVE.record_statement("COMMIT", time.perf_counter() - started)
+
+
+def enable_tracing():
+    """Start recording with a fresh tracer and return it."""
+    global ACTIVE
+    ACTIVE = Tracer()
+    return ACTIVE
+
+
+def disable_tracing():
+    """Stop recording and return the tracer that was active, if any."""
+    global ACTIVE
+    tracer, ACTIVE = ACTIVE, None
+    return tracer
+
+
+@contextmanager
+def action(name):
+    """Group the DB work in the block under name when tracing is on; a no-op otherwise."""
+    if ACTIVE is None:
+        yield
+        return
+    with ACTIVE.action(name):
+        yield
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# lib/seed.py
+
+import argparse
+import random
+
+from models.compendium import invalidate_compendium
+from models.database import DEFAULT_DB, get_connection, transaction
+from models.schema import migrate
+
+ARCANA_NAMES = [
+    "Fool", "Magician", "Priestess", "Empress", "Emperor", "Hierophant",
+    "Lovers", "Chariot", "Justice", "Hermit", "Fortune", "Strength",
+    "Hanged Man", "Death", "Temperance", "Devil", "Tower", "Star",
+    "Moon", "Sun", "Judgement", "World",
+]
+
+
+def generate(db_name=DEFAULT_DB, personas=500, arcanas=22, players=10, stock_fill=0.5,
+             stock_limit=8, seed=0):
+    """
+    Fill a database with a synthetic compendium and players.
+
+    The tables are emptied first, so only point this at a scratch database.
+
+    :param db_name: Name of the database file (default 'velvetRoom.db').
+    :param personas: Number of personas in the compendium (int).
+    :param arcanas: Number of arcanas (int).
+    :param players: Number of players (int).
+    :param stock_fill: Fraction of each player's stock limit to fill, 0 to 1 (float).
+    :param stock_limit: Stock limit given to every player (int).
+    :param seed: Seed for the random generator, so runs are repeatable (int).
+    :return: A dict describing what was generated.
+    """
+    rng = random.Random(seed)
+    migrate(db_name)
+
+    arcana_rows = []
+    for arcana_id in range(1, arcanas + 1):
+        name = ARCANA_NAMES[(arcana_id - 1) % len(ARCANA_NAMES)]
+        if arcana_id > len(ARCANA_NAMES):
+            name = f"{name} {arcana_id // len(ARCANA_NAMES) + 1}"
+        arcana_rows.append((arcana_id, name))
+
+    # Every level gets at least one persona where possible, so low-level
+    # players always have something to summon
+    persona_rows = []
+    for persona_id in range(1, personas + 1):
+        level = persona_id if persona_id <= 99 and personas >= 99 else rng.randint(1, 99)
+        persona_rows.append((persona_id, f"Persona {persona_id}", level, rng.randint(1, arcanas)))
+
+    player_rows = [
+        (player_id, f"player{player_id}", rng.randint(1, 99), stock_limit)
+        for player_id in range(1, players + 1)
+    ]
+
+    # Stocks are drawn independently; several players may own the same persona
+    per_player = min(int(stock_limit * stock_fill), personas)
+    ownership = [
+        (player_id, persona_id)
+        for player_id in range(1, players + 1)
+        for persona_id in rng.sample(range(1, personas + 1), per_player)
+    ]
+
+    with transaction(db_name) as conn:
+        conn.execute("DELETE FROM player_stock")
+        conn.execute("DELETE FROM personas")
+        conn.execute("DELETE FROM players")
+        conn.execute("DELETE FROM arcanas")
+        conn.executemany("INSERT INTO arcanas (id, name) VALUES (?, ?)", arcana_rows)
+        conn.executemany("INSERT INTO personas (id, name, level, arcana_id) VALUES (?, ?, ?, ?)", persona_rows)
+        conn.executemany("INSERT INTO players (id, name, level, stock_limit) VALUES (?, ?, ?, ?)", player_rows)
+        conn.executemany("INSERT INTO player_stock (player_id, persona_id) VALUES (?, ?)", ownership)
+    get_connection(db_name).execute("ANALYZE")
+    invalidate_compendium(db_name)
+
+    return {
+        "personas": personas,
+        "arcanas": arcanas,
+        "players": players,
+        "stock_limit": stock_limit,
+        "stock_per_player": per_player,
+        "seed": seed,
+    }
+
+
+def add_arguments(parser):
+    """Add the generator's scale options to an argparse parser."""
+    parser.add_argument("--personas", type=int, default=500, help="personas in the compendium")
+    parser.add_argument("--arcanas", type=int, default=22, help="number of arcanas")
+    parser.add_argument("--players", type=int, default=10, help="number of players")
+    parser.add_argument("--stock-fill", type=float, default=0.5, help="fraction of each stock to fill (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+
+
+def generate_from_args(db_name, args):
+    """Run generate() with options parsed by add_arguments()."""
+    return generate(db_name, personas=args.personas, arcanas=args.arcanas, players=args.players,
+                    stock_fill=args.stock_fill, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Velvet Room database.")
+    parser.add_argument("db_name", nargs="?", default=DEFAULT_DB, help="database file to (re)fill")
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(generate_from_args(args.db_name, args))
@@ -0,0 +1,159 @@
+# lib/server.py
+
+import asyncio
+import json
+import shlex
+import sqlite3
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from batch import USAGE, BatchSession
+from models.database import DEFAULT_DB, close_all
+from models.journal import close_journals, get_journal
+
+GREETING = {"ok": True, "result": "Welcome to The Velvet Room! Log in with: login <player>"}
+
+
+class VelvetRoomServer:
+    def __init__(self, db_name=DEFAULT_DB):
+        """
+        Serve the Velvet Room menu actions to many players over a line protocol.
+
+        Every session sends 'login <player>' first, then the batch commands
+        without the player argument ('summon x3', 'fuse 1 2', 'stock', ...).
+        Each command gets one JSON line back.
+
+        All database work runs on a single writer thread, so sessions never
+        compete for SQLite locks and share one connection, compendium index
+        and player cache.
+
+        :param db_name: Name of the database file (default 'velvetRoom.db').
+        """
+        self.db_name = db_name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="velvet-db")
+        self.session = None
+        self.sessions = 0
+
+    async def _run_db(self, function, *args):
+        """Private helper to run a function on the writer thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def start(self):
+        """Open the shared batch session on the writer thread."""
+        self.session = await self._run_db(BatchSession, self.db_name)
+
+    async def flush_journal(self):
+        """Group-commit the journal whenever its oldest event has waited long enough."""
+        journal = get_journal(self.db_name)
+        if journal is None:
+            return
+        while True:
+            await asyncio.sleep(journal.max_delay)
+            await self._run_db(journal.flush_if_due)
+
+    async def handle_client(self, reader, writer):
+        """Run one player's session until they quit or disconnect."""
+        self.sessions += 1
+        player_name = None
+
+        async def send(record):
+            writer.write((json.dumps(record) + "\n").encode())
+            await writer.drain()
+
+        line = None
+        try:
+            await send(GREETING)
+            while True:
+                line = None
+                try:
+                    raw = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError) as e:
+                    # A line longer than the stream limit; the reader has dropped it
+                    await send({"command": None, "ok": False, "error": f"Line too long: {e}"})
+                    continue
+                if not raw:
+                    break
+                line = raw.decode(errors="replace").strip()
+                if not line:
+                    continue
+
+                try:
+                    command, *rest = shlex.split(line)
+                except ValueError as e:
+                    await send({"command": line, "ok": False, "error": str(e)})
+                    continue
+
+                if command == "quit":
+                    await send({"command": line, "ok": True, "result": "Goodbye! We look forward to your next visit."})
+                    break
+                if command == "login":
+                    if len(rest) != 1:
+                        await send({"command": line, "ok": False, "error": "Usage: login <player>"})
+                        continue
+                    try:
+                        player = await self._run_db(self.session.get_player, rest[0])
+                    except (ValueError, sqlite3.Error) as e:
+                        await send({"command": line, "ok": False, "error": str(e)})
+                        continue
+                    player_name = player.name
+                    await send({"command": line, "ok": True, "result": {"player": player.name, "id": player.player_id}})
+                    continue
+                if player_name is None:
+                    await send({"command": line, "ok": False, "error": "Log in first with: login <player>"})
+                    continue
+                if command not in USAGE:
+                    await send({"command": line, "ok": False, "error": f"Unknown command '{command}'."})
+                    continue
+
+                batch_line = shlex.join([command, player_name, *rest])
+                record = await self._run_db(self.session.run_command, batch_line)
+                record["command"] = line
+                await send(record)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            # A bug rather than a bad command: log it, and tell the client if it is still there
+            print(f"Session {player_name or '(not logged in)'} failed on {line!r}:", file=sys.stderr)
+            traceback.print_exc()
+            try:
+                await send({"command": line, "ok": False, "error": f"Internal error: {e}"})
+            except ConnectionError:
+                pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve(self, host=None, port=None, unix_path=None):
+        """Listen on a TCP host/port or a Unix socket path until cancelled."""
+        await self.start()
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"The Velvet Room is open on {addresses}", file=sys.stderr)
+        flusher = asyncio.create_task(self.flush_journal())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            await self._run_db(close_journals)
+            await self._run_db(close_all)
+            self.executor.shutdown(wait=True)
+
+
+def parse_address(address):
+    """Split 'host:port' (or just 'port') into a (host, port) pair."""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def run_server(address=None, unix_path=None, db_name=DEFAULT_DB):
+    """Run the server in the foreground until interrupted."""
+    host, port = parse_address(address) if address else (None, None)
+    try:
+        asyncio.run(VelvetRoomServer(db_name).serve(host, port, unix_path))
+    except KeyboardInterrupt:
+        print("The Velvet Room is closed.", file=sys.stderr)
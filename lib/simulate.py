@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# lib/simulate.py
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from models import rules
+from models.compendium import Compendium
+from models.compendium_file import MappedCompendium
+from models.database import DEFAULT_DB
+from models.fusion_chart import FusionChart
+
+# Rule constants that can be overridden from the command line, by option name
+TUNABLE = {
+    "summon_gain": "SUMMON_LEVEL_GAIN",
+    "fusion_gain": "FUSION_LEVEL_GAIN",
+    "summon_band": "SUMMON_LEVEL_BAND",
+    "fusion_band": "FUSION_LEVEL_BAND",
+}
+
+# Set up once per worker process by _init_worker()
+_compendium = None
+_chart = None
+
+
+def _init_worker(db_name, compendium_file, overrides):
+    """Private helper that loads the compendium and applies rule overrides in a worker."""
+    global _compendium, _chart
+    for name, value in overrides.items():
+        setattr(rules, name, value)
+    _compendium = MappedCompendium(compendium_file) if compendium_file else Compendium.load(db_name)
+    _chart = FusionChart(_compendium)
+
+
+def simulate_player(compendium, chart, steps, stock_limit, rng, checkpoint):
+    """
+    Play one player from level 1 for a number of steps, using the game's rules.
+
+    Every step summons while the stock has room. Once it is full, the step
+    fuses a random pair of personas that can be fused. If no pair can be
+    fused, or the fusion has no candidate, the fusion fails and a random
+    persona is released to make room.
+
+    :return: A dict with the level at every checkpoint, the final stock
+             size, the step the level cap was reached (or None) and the
+             summon and fusion counts.
+    """
+    level = rules.MIN_LEVEL
+    stock = {}  # persona id -> Persona
+    result = {
+        "levels": [],
+        "max_level_step": None,
+        "summons": 0,
+        "empty_summons": 0,
+        "fusions": 0,
+        "fusions_no_pair": 0,
+        "fusions_no_candidate": 0,
+        "fill_sum": 0.0,
+    }
+    for step in range(1, steps + 1):
+        if rules.is_stock_full(len(stock), stock_limit):
+            result["fusions"] += 1
+            pairs = [pair for pair in combinations(stock.values(), 2) if rules.can_fuse(*pair)]
+            new_persona = None
+            if pairs:
+                persona_1, persona_2 = rng.choice(pairs)
+                new_persona = chart.pick(persona_1.arcana_id, persona_2.arcana_id, level,
+                                         exclude_ids=stock, rng=rng)
+                if new_persona is None:
+                    result["fusions_no_candidate"] += 1
+            else:
+                result["fusions_no_pair"] += 1
+
+            if new_persona is None:
+                del stock[rng.choice(list(stock))]
+            else:
+                del stock[persona_1.id]
+                del stock[persona_2.id]
+                stock[new_persona.id] = new_persona
+                level = rules.gain_levels(level, rules.FUSION_LEVEL_GAIN)
+        else:
+            result["summons"] += 1
+            persona = compendium.pick(*rules.summon_band(level), exclude_ids=stock, rng=rng)
+            if persona is None:
+                result["empty_summons"] += 1
+            else:
+                stock[persona.id] = persona
+            level = rules.gain_levels(level, rules.SUMMON_LEVEL_GAIN)
+
+        result["fill_sum"] += len(stock) / stock_limit
+        if step % checkpoint == 0 or step == steps:
+            result["levels"].append(level)
+        if level == rules.MAX_LEVEL and result["max_level_step"] is None:
+            result["max_level_step"] = step
+    result["stock"] = len(stock)
+    return result
+
+
+def run_chunk(seed, players, steps, stock_limit, checkpoint):
+    """Simulate a chunk of players in a worker and return their aggregated histograms."""
+    rng = random.Random(seed)
+    totals = Counter()
+    level_histograms = None
+    stock_histogram = Counter()
+    max_level_steps = Counter()
+    for _ in range(players):
+        result = simulate_player(_compendium, _chart, steps, stock_limit, rng, checkpoint)
+        if level_histograms is None:
+            level_histograms = [Counter() for _ in result["levels"]]
+        for histogram, level in zip(level_histograms, result["levels"]):
+            histogram[level] += 1
+        stock_histogram[result["stock"]] += 1
+        max_level_steps[result["max_level_step"]] += 1
+        for key in ("summons", "empty_summons", "fusions", "fusions_no_pair", "fusions_no_candidate", "fill_sum"):
+            totals[key] += result[key]
+    return totals, level_histograms or [], stock_histogram, max_level_steps
+
+
+def percentiles(histogram, points=(10, 50, 90)):
+    """Return the mean and the given percentiles of a value -> count histogram."""
+    total = sum(histogram.values())
+    summary = {"mean": sum(value * count for value, count in histogram.items()) / total if total else None}
+    values = sorted(histogram.items())
+    for point in points:
+        wanted, seen = total * point / 100, 0
+        for value, count in values:
+            seen += count
+            if seen >= wanted:
+                summary[f"p{point}"] = value
+                break
+    return summary
+
+
+def simulate(db_name=DEFAULT_DB, compendium_file=None, players=10000, steps=200, stock_limit=rules.DEFAULT_STOCK_LIMIT,
+             checkpoint=10, workers=None, chunk_size=500, seed=0, overrides=None):
+    """
+    Simulate many players across a process pool and return the distributions.
+
+    :param db_name: Database to read the compendium from (default 'velvetRoom.db').
+    :param compendium_file: Compendium file to map instead of reading the database (str).
+    :param players: Number of player trajectories (int).
+    :param steps: Actions (summon or fusion) per player (int).
+    :param stock_limit: Stock limit of every simulated player (int).
+    :param checkpoint: Record the level distribution every this many steps (int).
+    :param workers: Worker processes (default: one per CPU).
+    :param chunk_size: Players per task sent to a worker (int).
+    :param seed: Random seed (int). Results do not depend on the number of workers.
+    :param overrides: Rule constants to change, e.g. {"FUSION_LEVEL_GAIN": 4}.
+    :return: A JSON-friendly dict.
+    """
+    overrides = overrides or {}
+    chunks = [min(chunk_size, players - start) for start in range(0, players, chunk_size)]
+    totals = Counter()
+    level_histograms = []
+    stock_histogram = Counter()
+    max_level_steps = Counter()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db_name, compendium_file, overrides)) as pool:
+        futures = [
+            pool.submit(run_chunk, seed * 1_000_003 + index, count, steps, stock_limit, checkpoint)
+            for index, count in enumerate(chunks)
+        ]
+        for future in futures:
+            chunk_totals, chunk_levels, chunk_stock, chunk_max = future.result()
+            totals.update(chunk_totals)
+            if not level_histograms:
+                level_histograms = [Counter() for _ in chunk_levels]
+            for histogram, chunk_histogram in zip(level_histograms, chunk_levels):
+                histogram.update(chunk_histogram)
+            stock_histogram.update(chunk_stock)
+            max_level_steps.update(chunk_max)
+
+    checkpoints = [min(step, steps) for step in range(checkpoint, steps + checkpoint, checkpoint)]
+    never_maxed = max_level_steps.pop(None, 0)
+    failures = totals["fusions_no_pair"] + totals["fusions_no_candidate"]
+    return {
+        "meta": {
+            "players": players,
+            "steps": steps,
+            "stock_limit": stock_limit,
+            "seed": seed,
+            "rules": {**{constant: getattr(rules, constant) for constant in TUNABLE.values()}, **overrides},
+            "seconds": time.perf_counter() - started,
+        },
+        "level_by_step": {
+            str(step): percentiles(histogram) for step, histogram in zip(checkpoints, level_histograms)
+        },
+        "final_level": {str(level): count for level, count in sorted(level_histograms[-1].items())}
+        if level_histograms else {},
+        "steps_to_max_level": dict(percentiles(max_level_steps), reached=players - never_maxed),
+        "stock_fill": {
+            "mean_fill": totals["fill_sum"] / (players * steps) if players and steps else None,
+            "final_stock": {str(size): count for size, count in sorted(stock_histogram.items())},
+        },
+        "summons": {
+            "attempts": totals["summons"],
+            "empty": totals["empty_summons"],
+            "empty_rate": totals["empty_summons"] / totals["summons"] if totals["summons"] else None,
+        },
+        "fusions": {
+            "attempts": totals["fusions"],
+            "failures": failures,
+            "failure_rate": failures / totals["fusions"] if totals["fusions"] else None,
+            "no_fusable_pair": totals["fusions_no_pair"],
+            "no_candidate": totals["fusions_no_candidate"],
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate player progression with the Velvet Room rules.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database to read the compendium from (default: %(default)s)")
+    parser.add_argument("--compendium", metavar="FILE", help="compendium file to map instead of the database")
+    parser.add_argument("--players", type=int, default=10000, help="player trajectories to simulate")
+    parser.add_argument("--steps", type=int, default=200, help="actions per player")
+    parser.add_argument("--stock-limit", type=int, default=rules.DEFAULT_STOCK_LIMIT, help="stock limit per player")
+    parser.add_argument("--checkpoint", type=int, default=10, help="record levels every N steps")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=500, help="players per worker task")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    for option, constant in TUNABLE.items():
+        parser.add_argument(f"--{option.replace('_', '-')}", type=int,
+                            help=f"override {constant} (default {getattr(rules, constant)})")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    overrides = {constant: getattr(args, option) for option, constant in TUNABLE.items()
+                 if getattr(args, option) is not None}
+    report = simulate(args.db, args.compendium, args.players, args.steps, args.stock_limit, args.checkpoint,
+                      args.workers, args.chunk_size, args.seed, overrides)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+    print(f"Simulated {args.players} player(s) in {report['meta']['seconds']:.1f} s.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import pytest
+
+from cli import parse_args
+
+
+class TestParseArgs:
+    @pytest.mark.parametrize("argv", [
+        ["--wal", "--memory"],
+        ["--shards", "2", "--memory"],
+        ["--shards", "2", "--journal", "events.log"],
+        ["--shards", "0"],
+    ])
+    def test_rejects_modes_that_cannot_work_together(self, argv, capsys):
+        with pytest.raises(SystemExit):
+            parse_args(argv)
+        assert "error:" in capsys.readouterr().err
+
+    def test_accepts_wal_on_a_database_file(self):
+        args = parse_args(["--wal", "--shards", "2"])
+        assert args.wal and args.shards == 2
@@ -0,0 +1,44 @@
+import pytest
+
+from models.compendium import Compendium, get_compendium, invalidate_compendium, set_loader
+from models.compendium_file import MappedCompendium, use_compendium_file, write_compendium_file
+
+
+@pytest.fixture
+def compendium_path(db_name, tmp_path):
+    path = str(tmp_path / "compendium.bin")
+    write_compendium_file(Compendium.load(db_name), path)
+    yield path
+    set_loader(db_name, None)
+
+
+class TestMappedCompendium:
+    def test_matches_the_tables(self, db_name, compendium_path):
+        loaded, mapped = Compendium.load(db_name), MappedCompendium(compendium_path)
+        try:
+            assert dict(mapped.personas.items()) == loaded.personas
+            assert mapped.arcanas == loaded.arcanas
+            for arcana_id in loaded.arcana_ids():
+                assert list(mapped.band(arcana_id, 10, 40)) == loaded.band(arcana_id, 10, 40)
+        finally:
+            mapped.close()
+
+    def test_a_catalog_change_unmaps_the_previous_file(self, db_name, compendium_path):
+        use_compendium_file(compendium_path, db_name)
+        first = get_compendium(db_name)
+        assert first.get(1) is not None
+
+        invalidate_compendium(db_name)
+        second = get_compendium(db_name)
+        assert second is not first
+        assert first._mmap.closed
+        assert second.get(1).id == 1
+
+        set_loader(db_name, None)
+        assert second._mmap.closed
+
+    def test_a_copied_compendium_stays_readable_after_close(self, compendium_path):
+        mapped = MappedCompendium(compendium_path)
+        mapped.remove(1)
+        mapped.close()
+        assert mapped.get(1) is None and mapped.get(2).id == 2
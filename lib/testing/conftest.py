@@ -0,0 +1,62 @@
+import os
+import sys
+
+# The tests import the models the way the scripts in lib/ do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import seed
+from models.database import close_all, get_connection
+from models.journal import close_journals
+from models.rules import can_fuse
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    """A freshly seeded database: 300 personas over 22 arcanas and 5 players with half-full stocks."""
+    name = str(tmp_path / "velvet.db")
+    seed.generate(name, personas=300, players=5, seed=1)
+    yield name
+    close_journals()
+    close_all()
+
+
+@pytest.fixture
+def empty_db_name(tmp_path):
+    """A seeded compendium without any players."""
+    name = str(tmp_path / "velvet.db")
+    seed.generate(name, personas=300, players=0, seed=1)
+    yield name
+    close_journals()
+    close_all()
+
+
+def recount(db_name):
+    """Return the aggregate tables and the same figures counted from scratch, as two dicts."""
+    conn = get_connection(db_name)
+    aggregates = {
+        "stock": dict(conn.execute("SELECT player_id, personas FROM stock_counts WHERE personas > 0")),
+        "arcana": dict(conn.execute("SELECT arcana_id, personas FROM arcana_counts WHERE personas > 0")),
+        "level": dict(conn.execute("SELECT level, players FROM level_counts WHERE players > 0")),
+    }
+    counted = {
+        "stock": dict(conn.execute("SELECT player_id, COUNT(*) FROM player_stock GROUP BY player_id")),
+        "arcana": dict(conn.execute("""
+            SELECT IFNULL(personas.arcana_id, 0), COUNT(*)
+            FROM player_stock JOIN personas ON personas.id = player_stock.persona_id
+            GROUP BY 1
+        """)),
+        "level": dict(conn.execute("SELECT level, COUNT(*) FROM players GROUP BY level")),
+    }
+    return aggregates, counted
+
+
+def fusable_pair(player):
+    """Return the ids of two personas in the player's stock that can be fused, or None."""
+    personas = player.stock.snapshot.personas()
+    for index, first in enumerate(personas):
+        for second in personas[index + 1:]:
+            if can_fuse(first, second):
+                return first.id, second.id
+    return None
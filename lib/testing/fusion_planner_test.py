@@ -0,0 +1,64 @@
+import pytest
+
+from models import fusion_planner
+from models.compendium import Compendium
+from models.fusion_planner import FusionPlanner
+from models.rules import MAX_LEVEL, fusion_band, summon_band
+
+
+@pytest.fixture
+def compendium():
+    # Three personas per level, one of each of three arcanas
+    rows = [
+        (level * 3 + arcana_id, f"Persona {level}-{arcana_id}", level, arcana_id)
+        for level in range(1, MAX_LEVEL + 1)
+        for arcana_id in (1, 2, 3)
+    ]
+    return Compendium(rows, [(1, "Fool"), (2, "Magician"), (3, "Priestess")])
+
+
+def follow(steps, player_level, target):
+    """Check that a plan is a valid route to target and return the level it ends at."""
+    level = player_level
+    for step in steps:
+        assert step.level >= level
+        assert 0 < step.chance <= 1
+        level = step.level
+    last = steps[-1]
+    assert last.result.id == target.id
+    band = summon_band(last.level) if last.kind == "summon" else fusion_band(last.level)
+    assert band[0] <= target.level <= band[1]
+    return level
+
+
+class TestFusionPlanner:
+    def test_target_in_stock_needs_no_steps(self, compendium):
+        target = compendium.get(30)
+        assert FusionPlanner(compendium).plan([target], 10, target) == []
+
+    def test_target_in_summon_band_is_one_summon(self, compendium):
+        target = compendium.find("Persona 11-2")
+        steps = FusionPlanner(compendium).plan([], 10, target)
+        assert [step.kind for step in steps] == ["summon"]
+        assert steps[0].chance == pytest.approx(1 / 21)
+
+    def test_far_target_is_reached_by_levelling_up(self, compendium):
+        target = compendium.find("Persona 40-1")
+        stock = [compendium.find("Persona 5-2"), compendium.find("Persona 5-3")]
+        steps = FusionPlanner(compendium).plan(stock, 5, target)
+        assert steps
+        follow(steps, 5, target)
+        assert any(step.kind == "fuse" for step in steps)
+
+    def test_lower_levels_cannot_be_reached(self, compendium):
+        target = compendium.find("Persona 2-1")
+        assert FusionPlanner(compendium).plan([], 50, target) is None
+
+    def test_plan_memo_is_bounded(self, compendium, monkeypatch):
+        monkeypatch.setattr(fusion_planner, "PLAN_CACHE_SIZE", 3)
+        planner = FusionPlanner(compendium)
+        target = compendium.find("Persona 20-1")
+        for level in range(10, 18):
+            planner.plan([], level, target)
+        assert len(planner._plans) == 3
+        assert [key[0] for key in planner._plans] == [15, 16, 17]
@@ -0,0 +1,119 @@
+import io
+import json
+import os
+
+from batch import BatchSession
+from conftest import recount
+from models.database import get_connection
+from models.journal import close_journals, enable_journal, get_journal
+from models.player import Player
+
+
+def stocks(db_name):
+    """Return every (player_id, persona_id) ownership row, sorted."""
+    return get_connection(db_name).execute("SELECT player_id, persona_id FROM player_stock ORDER BY 1, 2").fetchall()
+
+
+def levels(db_name):
+    """Return every (player_id, level) row, sorted."""
+    return get_connection(db_name).execute("SELECT id, level FROM players ORDER BY id").fetchall()
+
+
+def play_a_little(db_name):
+    """Create two players, journal a few summons, a release and level changes, and return them."""
+    players = []
+    for name in ("yu", "yosuke"):
+        player = Player.get_or_create_player(name, db_name)
+        player.update_player_level(20)
+        player.summon_personas(3)
+        player.summon_persona()
+        player.release_personas(player.stock.snapshot.personas()[:1])
+        players.append(player)
+    return players
+
+
+class TestJournal:
+    def test_events_reach_the_tables_on_flush(self, empty_db_name, tmp_path):
+        journal = enable_journal(str(tmp_path / "events.log"), empty_db_name, batch_size=10_000, max_delay=60)
+        players = play_a_little(empty_db_name)
+        assert journal.applied_seq() < journal.last_seq
+        assert stocks(empty_db_name) == []
+        journal.flush()
+        assert journal.applied_seq() == journal.last_seq
+        assert stocks(empty_db_name) == sorted(
+            (player.player_id, persona.id) for player in players for persona in player.stock.snapshot.personas()
+        )
+        assert len(stocks(empty_db_name)) == 6
+        assert levels(empty_db_name) == [(player.player_id, player.get_player_level()) for player in players]
+        aggregates, counted = recount(empty_db_name)
+        assert aggregates == counted
+
+    def test_torn_tail_is_cut_off_and_ignored(self, empty_db_name, tmp_path):
+        path = str(tmp_path / "events.log")
+        enable_journal(path, empty_db_name)
+        play_a_little(empty_db_name)
+        close_journals()
+        expected_stocks, expected_levels = stocks(empty_db_name), levels(empty_db_name)
+        intact_size = os.path.getsize(path)
+        last_seq = json.loads(open(path, "rb").read().splitlines()[-1])["seq"]
+
+        # A crash in the middle of appending the next group
+        with open(path, "ab") as journal_file:
+            journal_file.write(b'{"seq": %d, "type": "stock_add", "player_id": 1, "pers' % (last_seq + 1))
+
+        journal = enable_journal(path, empty_db_name)
+        assert os.path.getsize(path) == intact_size
+        assert journal.last_seq == last_seq
+        assert stocks(empty_db_name) == expected_stocks
+        assert levels(empty_db_name) == expected_levels
+
+    def test_events_fsynced_but_not_applied_are_replayed(self, empty_db_name, tmp_path):
+        path = str(tmp_path / "events.log")
+        enable_journal(path, empty_db_name)
+        play_a_little(empty_db_name)
+        close_journals()
+        player_id = get_connection(empty_db_name).execute("SELECT id FROM players WHERE name = 'yu'").fetchone()[0]
+        owned = {persona_id for owner, persona_id in stocks(empty_db_name) if owner == player_id}
+        persona_id = next(persona_id for persona_id in range(1, 301) if persona_id not in owned)
+        last_seq = json.loads(open(path, "rb").read().splitlines()[-1])["seq"]
+
+        # A crash after the group's fsync, before it was applied to the tables
+        with open(path, "ab") as journal_file:
+            for seq, event in enumerate((
+                {"type": "stock_add", "player_id": player_id, "persona_id": persona_id},
+                {"type": "level", "player_id": player_id, "level": 42},
+            ), start=last_seq + 1):
+                journal_file.write((json.dumps({"seq": seq, **event}) + "\n").encode())
+
+        journal = enable_journal(path, empty_db_name)
+        assert journal.applied_seq() == last_seq + 2
+        assert (player_id, persona_id) in stocks(empty_db_name)
+        assert dict(levels(empty_db_name))[player_id] == 42
+        aggregates, counted = recount(empty_db_name)
+        assert aggregates == counted
+
+    def test_rebuild_restores_the_state_from_the_journal_alone(self, empty_db_name, tmp_path):
+        path = str(tmp_path / "events.log")
+        enable_journal(path, empty_db_name)
+        play_a_little(empty_db_name)
+        get_journal(empty_db_name).flush()
+        expected_stocks, expected_levels = stocks(empty_db_name), levels(empty_db_name)
+
+        conn = get_connection(empty_db_name)
+        conn.execute("DELETE FROM player_stock")
+        conn.execute("UPDATE players SET level = 99")
+        get_journal(empty_db_name).rebuild()
+
+        assert stocks(empty_db_name) == expected_stocks
+        assert levels(empty_db_name) == expected_levels
+        aggregates, counted = recount(empty_db_name)
+        assert aggregates == counted
+
+    def test_batch_over_stdin_commits_each_command_before_reading_on(self, empty_db_name, tmp_path):
+        journal = enable_journal(str(tmp_path / "events.log"), empty_db_name, batch_size=10_000, max_delay=60)
+        session = BatchSession(empty_db_name)
+
+        session.run(["summon yu"], out=io.StringIO())
+        assert journal.applied_seq() < journal.last_seq  # Not due yet
+        session.run(["summon yu"], out=io.StringIO(), wait_for_input=True)
+        assert journal.applied_seq() == journal.last_seq
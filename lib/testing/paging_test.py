@@ -0,0 +1,102 @@
+import pytest
+
+from models.compendium import get_compendium
+from models.database import transaction
+from models.paging import Page, page_bounds
+from models.stock_snapshot import StockSnapshot
+
+
+def walk_forward(fetch):
+    """Collect every page from the first, following last_key."""
+    pages = [fetch(after=None, before=None)]
+    while pages[-1].has_next:
+        pages.append(fetch(after=pages[-1].last_key, before=None))
+    return pages
+
+
+def walk_back(fetch, last_page):
+    """Collect every page from last_page back to the first, following first_key."""
+    pages = [last_page]
+    while pages[-1].has_previous:
+        pages.append(fetch(after=None, before=pages[-1].first_key))
+    return pages[::-1]
+
+
+class TestPageBounds:
+    @pytest.mark.parametrize("size, start, stop, limit, expected", [
+        (0, None, None, 5, (0, 0)),
+        (3, None, None, 5, (0, 3)),
+        (10, None, None, 5, (0, 5)),
+        (10, 5, None, 5, (5, 10)),
+        (10, 10, None, 5, (10, 10)),
+        (12, 10, None, 5, (10, 12)),
+        (10, None, 5, 5, (0, 5)),
+        (10, None, 3, 5, (0, 3)),
+        (10, None, 0, 5, (0, 0)),
+    ])
+    def test_bounds(self, size, start, stop, limit, expected):
+        assert page_bounds(size, start=start, stop=stop, limit=limit) == expected
+
+    def test_empty_page_has_no_keys(self):
+        page = Page([], key=lambda item: item)
+        assert page.first_key is None and page.last_key is None
+        assert list(page.numbered()) == []
+
+
+class TestStockPaging:
+    @pytest.fixture
+    def snapshot(self, db_name):
+        # Give player 1 exactly 25 personas: two full pages of 10 and one of 5
+        with transaction(db_name) as conn:
+            conn.execute("DELETE FROM player_stock WHERE player_id = 1")
+            conn.executemany("INSERT INTO player_stock (player_id, persona_id) VALUES (1, ?)",
+                             [(persona_id,) for persona_id in range(100, 125)])
+        return StockSnapshot(db_name, player_id=1)
+
+    def test_forward_and_back_cover_the_listing_once(self, snapshot):
+        def fetch(after, before):
+            return snapshot.page(after=after, before=before, limit=10)
+
+        forward = walk_forward(fetch)
+        assert [len(page) for page in forward] == [10, 10, 5]
+        assert [page.number for page in forward] == [1, 11, 21]
+        ids = [persona.id for page in forward for persona, _ in page]
+        assert ids == list(range(100, 125))
+        assert not forward[0].has_previous and not forward[-1].has_next
+
+        back = walk_back(fetch, forward[-1])
+        assert [[persona.id for persona, _ in page] for page in back] == \
+               [[persona.id for persona, _ in page] for page in forward]
+
+    def test_numbers_match_numbered_selection(self, snapshot):
+        page = snapshot.page(after=109, limit=10)
+        for number, (persona, _) in page.numbered():
+            assert snapshot.get_by_number(number).id == persona.id
+
+    def test_exactly_full_last_page_has_no_next(self, snapshot):
+        page = snapshot.page(after=114, limit=10)
+        assert len(page) == 10 and not page.has_next
+
+    def test_pages_stay_put_when_earlier_rows_go(self, snapshot):
+        second = snapshot.page(after=109, limit=10)
+        snapshot.remove(100)
+        assert [persona.id for persona, _ in snapshot.page(after=109, limit=10)] == \
+               [persona.id for persona, _ in second]
+
+
+class TestCompendiumPaging:
+    def test_arcana_pages_match_the_full_listing(self, db_name):
+        compendium = get_compendium(db_name)
+        for arcana_id in compendium.arcana_ids():
+            def fetch(after, before):
+                return compendium.page_in_arcana(arcana_id, after=after, before=before, limit=4)
+
+            listing = [(persona.level, persona.id) for persona in compendium.in_arcana(arcana_id)]
+            forward = walk_forward(fetch)
+            assert [page.key(persona) for page in forward for persona in page] == listing
+            back = walk_back(fetch, forward[-1])
+            assert [page.key(persona) for page in back for persona in page] == listing
+
+    def test_unknown_arcana_is_one_empty_page(self, db_name):
+        page = get_compendium(db_name).page_in_arcana(999)
+        assert len(page) == 0 and not page.has_next and not page.has_previous
@@ -0,0 +1,81 @@
+import random
+import sqlite3
+
+from conftest import fusable_pair
+from models.database import get_connection, transaction
+from models.player import Player
+from models.rules import SUMMON_LEVEL_GAIN
+
+
+def stored_level(db_name, player_id):
+    return get_connection(db_name).execute("SELECT level FROM players WHERE id = ?", (player_id,)).fetchone()[0]
+
+
+def stored_stock(db_name, player_id):
+    return [persona_id for persona_id, in get_connection(db_name).execute(
+        "SELECT persona_id FROM player_stock WHERE player_id = ? ORDER BY persona_id", (player_id,)
+    )]
+
+
+class TestPlayer:
+    def test_level_is_written_through(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        player.update_player_level(33)
+        assert player.get_player_level() == 33
+        assert stored_level(db_name, 1) == 33
+
+    def test_commits_from_another_connection_are_picked_up(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        player.get_player_level()
+        with sqlite3.connect(db_name) as other:
+            other.execute("UPDATE players SET level = 77 WHERE id = 1")
+        assert player.get_player_level() == 77
+
+    def test_multi_summon_stops_at_the_stock_limit(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        player.update_player_level(40)
+        room = player.stock_limit - len(stored_stock(db_name, 1))
+
+        summoned = player.summon_personas(room + 10)
+        assert len(summoned) == room
+        assert len({persona.id for persona in summoned}) == room
+        assert stored_stock(db_name, 1) == sorted(persona.id for persona in player.stock.snapshot.personas())
+        # Levels are gained for the personas that joined, not the ones asked for
+        assert player.get_player_level() == 40 + SUMMON_LEVEL_GAIN * room
+        assert stored_level(db_name, 1) == player.get_player_level()
+
+    def test_multi_summon_on_a_full_stock_gains_nothing(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        player.update_player_level(40)
+        player.summon_personas(player.stock_limit)
+        level = player.get_player_level()
+
+        assert player.summon_personas(50) == []
+        assert player.get_player_level() == level
+
+    def test_failed_fusion_changes_nothing(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        stock = stored_stock(db_name, 1)
+        level = player.get_player_level()
+        assert player.fuse_personas(-1, -2) is None
+        assert stored_stock(db_name, 1) == stock
+        assert stored_level(db_name, 1) == level
+
+    def test_fusion_prints_only_its_messages(self, db_name, capsys):
+        # Batch mode and the server return whatever a command prints
+        random.seed(3)
+        player = Player.get_player_by_id(1, db_name)
+        player.update_player_level(50)
+        player.summon_personas(2)
+        pair = fusable_pair(player)
+        assert pair is not None
+        capsys.readouterr()
+
+        assert player.fuse_personas(*pair) is not None
+        assert "object at" not in capsys.readouterr().out
+
+    def test_new_players_start_at_the_minimum_level(self, db_name):
+        with transaction(db_name):
+            player = Player.get_or_create_player("newcomer", db_name)
+        assert player.get_player_level() == 1
+        assert Player.get_or_create_player("newcomer", db_name).player_id == player.player_id
@@ -0,0 +1,93 @@
+import sqlite3
+
+from conftest import recount
+from models.database import close_all, get_connection
+from models.schema import SCHEMA_VERSION, get_schema_version, migrate
+
+
+def make_baseline_db(path):
+    """Create a database shaped like the untracked original schema, with ownership on personas."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE arcanas (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+        CREATE TABLE players (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+            level INTEGER NOT NULL DEFAULT 1, stock_limit INTEGER NOT NULL DEFAULT 8
+        );
+        CREATE TABLE personas (
+            id INTEGER PRIMARY KEY, name TEXT NOT NULL, level INTEGER NOT NULL,
+            arcana_id INTEGER REFERENCES arcanas (id), player_id INTEGER REFERENCES players (id)
+        );
+        INSERT INTO arcanas VALUES (1, 'Fool'), (2, 'Magician');
+        INSERT INTO players VALUES (1, 'yu', 5, 8), (2, 'yosuke', 3, 8);
+        INSERT INTO personas VALUES
+            (1, 'Izanagi', 1, 1, 1), (2, 'Jack Frost', 8, 2, 1),
+            (3, 'Pixie', 2, 2, 2), (4, 'Orpheus', 1, 1, NULL), (5, 'Nameless', 4, NULL, 2);
+    """)
+    conn.close()
+
+
+def indexes(db_name):
+    """Return the names of the indexes created by the migrations."""
+    return {name for name, in get_connection(db_name).execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+    )}
+
+
+class TestMigrate:
+    def test_upgrades_a_baseline_database_to_the_latest_version(self, tmp_path):
+        path = str(tmp_path / "baseline.db")
+        make_baseline_db(path)
+        try:
+            assert get_schema_version(path) == 0
+            assert migrate(path) == SCHEMA_VERSION
+
+            conn = get_connection(path)
+            assert get_schema_version(path) == SCHEMA_VERSION
+            assert sorted(conn.execute("SELECT player_id, persona_id FROM player_stock")) == [
+                (1, 1), (1, 2), (2, 3), (2, 5),
+            ]
+            # Ownership only lives in player_stock from version 5 on
+            assert conn.execute("SELECT COUNT(*) FROM personas WHERE player_id IS NOT NULL").fetchone()[0] == 0
+            assert {"idx_player_stock_persona", "idx_personas_level_arcana", "idx_players_name"} <= indexes(path)
+            assert conn.execute("SELECT applied_seq FROM journal_state").fetchone()[0] == 0
+
+            aggregates, counted = recount(path)
+            assert aggregates == counted
+            assert aggregates["arcana"] == {0: 1, 1: 1, 2: 2}
+        finally:
+            close_all()
+
+    def test_creates_the_tables_in_a_new_database(self, tmp_path):
+        path = str(tmp_path / "new.db")
+        try:
+            assert migrate(path) == SCHEMA_VERSION
+            tables = {name for name, in get_connection(path).execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )}
+            assert {"arcanas", "players", "personas", "player_stock"} <= tables
+        finally:
+            close_all()
+
+    def test_is_idempotent(self, tmp_path):
+        path = str(tmp_path / "baseline.db")
+        make_baseline_db(path)
+        try:
+            migrate(path)
+            before = get_connection(path).execute("SELECT * FROM player_stock ORDER BY 1, 2").fetchall()
+            assert migrate(path) == SCHEMA_VERSION
+            assert get_connection(path).execute("SELECT * FROM player_stock ORDER BY 1, 2").fetchall() == before
+        finally:
+            close_all()
+
+    def test_steps_one_version_at_a_time(self, tmp_path):
+        path = str(tmp_path / "baseline.db")
+        make_baseline_db(path)
+        try:
+            for version in range(1, SCHEMA_VERSION + 1):
+                assert migrate(path, target=version) == version
+                assert get_schema_version(path) == version
+            aggregates, counted = recount(path)
+            assert aggregates == counted
+        finally:
+            close_all()
@@ -0,0 +1,35 @@
+import seed
+from models.database import close_all, get_connection
+
+
+def contents(db_name):
+    """Return every persona and player row, sorted."""
+    conn = get_connection(db_name)
+    return (conn.execute("SELECT * FROM personas ORDER BY id").fetchall(),
+            conn.execute("SELECT * FROM players ORDER BY id").fetchall())
+
+
+class TestGenerate:
+    def test_fills_the_requested_scale(self, db_name):
+        conn = get_connection(db_name)
+        assert conn.execute("SELECT COUNT(*) FROM personas").fetchone()[0] == 300
+        assert conn.execute("SELECT COUNT(*) FROM arcanas").fetchone()[0] == 22
+        assert conn.execute("SELECT COUNT(*) FROM players").fetchone()[0] == 5
+        # Every level has a persona, so every player can summon
+        assert conn.execute("SELECT COUNT(DISTINCT level) FROM personas").fetchone()[0] == 99
+        stocks = dict(conn.execute("SELECT player_id, COUNT(*) FROM player_stock GROUP BY player_id"))
+        assert stocks == {player_id: 4 for player_id in range(1, 6)}
+
+    def test_same_seed_same_database(self, tmp_path):
+        first, second = str(tmp_path / "first.db"), str(tmp_path / "second.db")
+        try:
+            seed.generate(first, personas=100, players=3, seed=7)
+            seed.generate(second, personas=100, players=3, seed=7)
+            assert contents(first) == contents(second)
+        finally:
+            close_all()
+
+    def test_regenerating_replaces_the_contents(self, db_name):
+        seed.generate(db_name, personas=50, players=2, seed=2)
+        personas, players = contents(db_name)
+        assert len(personas) == 50 and len(players) == 2
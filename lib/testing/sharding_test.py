@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from conftest import recount
+from models import stats
+from models.compendium import get_compendium
+from models.database import get_connection
+from models.player import Player
+from models.sharding import (catalog_of, check_shard_count, enable_sharding, recorded_shard_count, shard_for_name,
+                             shard_for_player, shards_of)
+
+
+@pytest.fixture
+def shards(empty_db_name):
+    return enable_sharding(3, empty_db_name)
+
+
+class TestSharding:
+    def test_players_are_found_by_name_and_id_on_their_shard(self, empty_db_name, shards):
+        players = [Player.get_or_create_player(f"player{index}", empty_db_name) for index in range(12)]
+        assert len({player.player_id for player in players}) == 12
+        assert len({player.db_name for player in players}) > 1
+
+        for player in players:
+            assert player.db_name == shard_for_name(empty_db_name, player.name)
+            assert player.db_name == shard_for_player(empty_db_name, player.player_id)
+            assert Player.get_player_by_id(player.player_id, empty_db_name).name == player.name
+            assert Player.get_or_create_player(player.name, empty_db_name).player_id == player.player_id
+            row = get_connection(player.db_name).execute(
+                "SELECT name FROM players WHERE id = ?", (player.player_id,)
+            ).fetchone()
+            assert row == (player.name,)
+        # Nothing lands in the catalog file
+        assert get_connection(empty_db_name).execute("SELECT COUNT(*) FROM players").fetchone()[0] == 0
+
+    def test_shards_share_the_read_only_catalog(self, empty_db_name, shards):
+        for shard in shards:
+            assert catalog_of(shard) == empty_db_name
+            assert get_compendium(shard) is get_compendium(empty_db_name)
+            with pytest.raises(sqlite3.OperationalError):
+                get_connection(shard).execute("UPDATE catalog.personas SET level = 1")
+
+    def test_aggregates_add_up_across_shards(self, empty_db_name, shards):
+        for index in range(9):
+            player = Player.get_or_create_player(f"player{index}", empty_db_name)
+            player.update_player_level(10 + index)
+            player.summon_personas(3)
+        player.release_personas(player.stock.snapshot.personas()[:1])
+
+        players = owned = 0
+        for shard in shards_of(empty_db_name):
+            aggregates, counted = recount(shard)
+            assert aggregates == counted
+            players += sum(counted["level"].values())
+            owned += sum(counted["stock"].values())
+        assert stats.totals(empty_db_name) == (players, owned)
+        assert sum(personas for _, _, personas in stats.arcana_distribution(empty_db_name)) == owned
+
+        board = stats.leaderboard(limit=4, db_name=empty_db_name)
+        assert [level for _, _, level, _ in board] == [21, 20, 19, 18]
+        assert [rank for rank, _, _, _ in board] == [1, 2, 3, 4]
+        assert stats.player_rank(18, empty_db_name) == 4
+        assert stats.stock_count(player.player_id, empty_db_name) == len(player.stock.snapshot)
+
+    def test_enabling_again_keeps_the_catalog(self, empty_db_name, shards):
+        player_id = Player.get_or_create_player("yu", empty_db_name).player_id
+        assert enable_sharding(3, empty_db_name) == shards
+        assert get_connection(empty_db_name).execute("SELECT COUNT(*) FROM personas").fetchone()[0] == 300
+        assert Player.get_or_create_player("yu", empty_db_name).player_id == player_id
+
+    def test_another_count_is_refused(self, empty_db_name, shards):
+        assert recorded_shard_count(empty_db_name) == 3
+        with pytest.raises(ValueError, match="--shards 3"):
+            enable_sharding(2, empty_db_name)
+        with pytest.raises(ValueError):
+            check_shard_count(None, empty_db_name)
+        check_shard_count(3, empty_db_name)
+
+    def test_shards_made_before_the_count_was_recorded_are_counted(self, empty_db_name, shards):
+        get_connection(empty_db_name).execute("DELETE FROM shard_config")
+        assert recorded_shard_count(empty_db_name) == 3
+        with pytest.raises(ValueError):
+            enable_sharding(4, empty_db_name)
+
+    def test_an_unsharded_catalog_records_nothing(self, empty_db_name):
+        assert recorded_shard_count(empty_db_name) is None
+        check_shard_count(None, empty_db_name)
@@ -0,0 +1,80 @@
+import random
+
+from conftest import fusable_pair, recount
+from models import stats
+from models.compendium import invalidate_compendium
+from models.database import get_connection, transaction
+from models.player import Player
+
+
+class TestAggregates:
+    def test_seeded_aggregates_match_a_recount(self, db_name):
+        aggregates, counted = recount(db_name)
+        assert aggregates == counted
+
+    def test_summon_fuse_and_release_keep_aggregates_exact(self, db_name):
+        random.seed(3)
+        player = Player.get_player_by_id(1, db_name)
+        player.update_player_level(50)
+
+        player.release_personas(player.stock.snapshot.personas()[:1])
+        assert player.summon_persona() is not None
+        assert player.summon_personas(2)
+        pair = fusable_pair(player)
+        assert pair is not None
+        assert player.fuse_personas(*pair) is not None
+        aggregates, counted = recount(db_name)
+        assert aggregates == counted
+
+        player.release_where(below_level=100)
+        assert len(player.stock.snapshot) == 0
+        aggregates, counted = recount(db_name)
+        assert aggregates == counted
+        assert player.player_id not in aggregates["stock"]
+
+    def test_rolled_back_work_leaves_aggregates_untouched(self, db_name):
+        before = recount(db_name)[0]
+        player = Player.get_player_by_id(2, db_name)
+        try:
+            with transaction(db_name):
+                player.summon_personas(2)
+                player.update_player_level(77)
+                raise RuntimeError("abort the unit of work")
+        except RuntimeError:
+            pass
+        assert recount(db_name)[0] == before
+
+    def test_deleting_an_owned_persona_updates_the_aggregates(self, db_name):
+        persona_id = get_connection(db_name).execute("SELECT persona_id FROM player_stock LIMIT 1").fetchone()[0]
+        with transaction(db_name) as conn:
+            conn.execute("DELETE FROM personas WHERE id = ?", (persona_id,))
+        invalidate_compendium(db_name)
+        aggregates, counted = recount(db_name)
+        assert aggregates == counted
+
+
+class TestStats:
+    def test_totals_and_stock_count(self, db_name):
+        players, owned = stats.totals(db_name)
+        conn = get_connection(db_name)
+        assert players == conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+        assert owned == conn.execute("SELECT COUNT(*) FROM player_stock").fetchone()[0]
+        assert stats.stock_count(1, db_name) == len(Player.get_player_by_id(1, db_name).stock.snapshot)
+        assert stats.stock_count(999, db_name) == 0
+
+    def test_leaderboard_is_ordered_with_shared_ranks(self, db_name):
+        Player.get_player_by_id(1, db_name).update_player_level(99)
+        Player.get_player_by_id(2, db_name).update_player_level(99)
+        board = stats.leaderboard(limit=5, db_name=db_name)
+
+        assert [row[2] for row in board] == sorted((row[2] for row in board), reverse=True)
+        assert board[0][:3] == (1, "player1", 99)
+        assert board[1][:3] == (1, "player2", 99)
+        assert board[2][0] == 3
+        for rank, _, level, _ in board:
+            assert stats.player_rank(level, db_name) == rank
+
+    def test_arcana_distribution_sums_to_the_owned_total(self, db_name):
+        distribution = stats.arcana_distribution(db_name)
+        assert sum(personas for _, _, personas in distribution) == stats.totals(db_name)[1]
+        assert [row[2] for row in distribution] == sorted((row[2] for row in distribution), reverse=True)
@@ -0,0 +1,90 @@
+import sqlite3
+
+import bench
+from models.database import get_connection, transaction
+from models.player import Player
+from models.stock_snapshot import StockSnapshot
+
+
+def table_stock(db_name, player_id):
+    """Return the persona ids a player owns according to the table."""
+    return [persona_id for persona_id, in get_connection(db_name).execute(
+        "SELECT persona_id FROM player_stock WHERE player_id = ? ORDER BY persona_id", (player_id,)
+    )]
+
+
+class TestStockSnapshot:
+    def test_reads_the_stock_in_id_order_with_catalog_columns(self, db_name):
+        snapshot = StockSnapshot(db_name, player_id=1)
+        assert [persona.id for persona in snapshot.personas()] == table_stock(db_name, 1)
+        persona, arcana_name = next(iter(snapshot))
+        row = get_connection(db_name).execute(
+            "SELECT personas.name, personas.level, arcanas.name FROM personas "
+            "JOIN arcanas ON arcanas.id = personas.arcana_id WHERE personas.id = ?", (persona.id,)
+        ).fetchone()
+        assert (persona.name, persona.level, arcana_name) == row
+        assert persona.player_id == 1
+
+    def test_numbers_follow_the_listing(self, db_name):
+        snapshot = StockSnapshot(db_name, player_id=1)
+        for number, persona in enumerate(snapshot.personas(), start=1):
+            assert snapshot.get_by_number(number).id == persona.id
+        assert snapshot.get_by_number(0) is None
+        assert snapshot.get_by_number(len(snapshot) + 1) is None
+
+    def test_model_writes_update_every_snapshot_of_the_stock(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        other_copy = StockSnapshot(db_name, player_id=1)
+        other_copy.personas()  # Loaded before the writes
+
+        player.update_player_level(40)
+        assert player.summon_persona() is not None
+        player.stock.remove_persona_from_stock(player.stock.snapshot.personas()[0])
+
+        expected = table_stock(db_name, 1)
+        assert [persona.id for persona in player.stock.snapshot.personas()] == expected
+        assert [persona.id for persona in other_copy.personas()] == expected
+
+    def test_commits_from_another_connection_are_picked_up(self, db_name):
+        snapshot = StockSnapshot(db_name, player_id=1)
+        owned = set(snapshot.ids())
+        persona_id = next(persona_id for persona_id in range(1, 301) if persona_id not in owned)
+
+        with sqlite3.connect(db_name) as other:
+            other.execute("INSERT INTO player_stock (player_id, persona_id) VALUES (1, ?)", (persona_id,))
+
+        assert persona_id in snapshot.ids()
+        assert snapshot.get_by_id(persona_id) is not None
+
+    def test_own_connection_writes_need_invalidate(self, db_name):
+        snapshot = StockSnapshot(db_name, player_id=1)
+        before = snapshot.ids()
+        with transaction(db_name) as conn:
+            conn.execute("DELETE FROM player_stock WHERE player_id = 1")
+
+        # data_version() only notices other connections' commits
+        assert snapshot.ids() == before
+        snapshot.invalidate()
+        assert snapshot.ids() == set()
+
+    def test_a_rolled_back_write_is_forgotten(self, db_name):
+        player = Player.get_player_by_id(1, db_name)
+        before = player.stock.snapshot.ids()
+        try:
+            with transaction(db_name):
+                for persona in player.stock.snapshot.personas():
+                    player.stock.remove_persona_from_stock(persona)
+                assert player.stock.snapshot.ids() == set()
+                raise RuntimeError("abort the unit of work")
+        except RuntimeError:
+            pass
+        assert player.stock.snapshot.ids() == before
+
+
+class TestBench:
+    def test_every_timed_operation_does_its_work(self, db_name):
+        # Each setup resets the bench player; the checks raise if an operation
+        # is timed on a stale stock and returns nothing
+        for name, (setup, operation, check) in bench.build_operations(db_name).items():
+            result = bench.time_operation(setup, operation, iterations=3, warmup=1, check=check)
+            assert result["iterations"] == 3, name
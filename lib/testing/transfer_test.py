@@ -0,0 +1,53 @@
+import io
+
+import pytest
+
+import transfer
+from conftest import recount
+from models.database import get_connection
+
+
+def export(db_name, table, file_format):
+    out = io.StringIO()
+    transfer.export_rows(db_name, table, out, file_format)
+    return out.getvalue()
+
+
+def ownership(db_name):
+    return get_connection(db_name).execute("SELECT player_id, persona_id FROM player_stock ORDER BY 1, 2").fetchall()
+
+
+class TestTransfer:
+    @pytest.mark.parametrize("file_format", transfer.FORMATS)
+    def test_ownership_round_trips(self, db_name, file_format):
+        exported = export(db_name, "ownership", file_format)
+        rows = list(transfer.read_rows(io.StringIO(exported), "ownership", file_format))
+        before = ownership(db_name)
+
+        assert transfer.import_rows(db_name, "ownership", rows, replace=True) == len(before)
+        assert ownership(db_name) == before
+
+    @pytest.mark.parametrize("file_format", transfer.FORMATS)
+    def test_personas_round_trip_into_an_empty_table(self, db_name, file_format):
+        before = get_connection(db_name).execute("SELECT id, name, level, arcana_id FROM personas ORDER BY id").fetchall()
+        rows = list(transfer.read_rows(io.StringIO(export(db_name, "personas", file_format)), "personas", file_format))
+
+        assert transfer.import_rows(db_name, "personas", rows, replace=True, chunk_size=7) == len(before)
+        assert get_connection(db_name).execute(
+            "SELECT id, name, level, arcana_id FROM personas ORDER BY id"
+        ).fetchall() == before
+
+    def test_replacing_players_clears_their_stocks(self, db_name):
+        rows = transfer.read_rows(io.StringIO("name,level,stock_limit\nzed,3,10\n"), "players", "csv")
+        assert transfer.import_rows(db_name, "players", rows, replace=True) == 1
+
+        conn = get_connection(db_name)
+        assert conn.execute("SELECT name, level, stock_limit FROM players").fetchall() == [("zed", 3, 10)]
+        assert conn.execute("SELECT COUNT(*) FROM player_stock").fetchone()[0] == 0
+        aggregates, counted = recount(db_name)
+        assert aggregates == counted
+
+    def test_bad_rows_name_their_line(self):
+        rows = transfer.read_rows(io.StringIO("name,level,stock_limit\nzed,high,10\n"), "players", "csv")
+        with pytest.raises(ValueError, match="Line 2"):
+            list(rows)
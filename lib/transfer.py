@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# lib/transfer.py
+
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from itertools import islice
+
+from models.compendium import invalidate_compendium
+from models.database import DEFAULT_DB, get_connection, transaction
+from models.schema import migrate
+
+# Rows written per executemany() call. Import memory is bounded by one chunk,
+# whatever the size of the file.
+CHUNK_SIZE = 10000
+
+FORMATS = ("csv", "jsonl")
+
+
+def _optional_int(value):
+    """Private helper to read an int column that may be empty."""
+    return None if value in (None, "") else int(value)
+
+
+# For each table: the exported columns with their types, the query that
+# streams them out in a stable order, the statements every imported row goes
+# through (each with a function turning the row into its parameters), and
+# the statements that empty the table for --replace.
+TABLES = {
+    "arcanas": {
+        "columns": (("id", int), ("name", str)),
+        "export": "SELECT id, name FROM arcanas ORDER BY id",
+        "import": [(
+            "INSERT INTO arcanas (id, name) VALUES (?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name",
+            tuple,
+        )],
+        "replace": ("DELETE FROM arcanas",),
+    },
+    "personas": {
+        "columns": (("id", int), ("name", str), ("level", int), ("arcana_id", _optional_int)),
+        "export": "SELECT id, name, level, arcana_id FROM personas ORDER BY id",
+        # An upsert rather than INSERT OR REPLACE, so re-importing the
+        # compendium keeps the personas' owners
+        "import": [(
+            "INSERT INTO personas (id, name, level, arcana_id) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name, level = excluded.level, "
+            "arcana_id = excluded.arcana_id",
+            tuple,
+        )],
+        # Deleting a persona also takes it out of every stock (trigger stock_persona_delete)
+        "replace": ("DELETE FROM personas",),
+    },
+    "players": {
+        "columns": (("name", str), ("level", int), ("stock_limit", int)),
+        "export": "SELECT name, level, stock_limit FROM players ORDER BY id",
+        # Players are matched by name, since ids differ between databases
+        "import": [
+            ("INSERT INTO players (name, level, stock_limit) SELECT ?, ?, ? "
+             "WHERE NOT EXISTS (SELECT 1 FROM players WHERE name = ?)",
+             lambda row: (*row, row[0])),
+            ("UPDATE players SET level = ?, stock_limit = ? WHERE name = ?",
+             lambda row: (row[1], row[2], row[0])),
+        ],
+        # Stocks go with their players, so no player_stock row is left without an owner
+        "replace": ("DELETE FROM player_stock", "DELETE FROM stock_counts", "DELETE FROM players"),
+    },
+    "ownership": {
+        "columns": (("player", str), ("persona_id", int)),
+        "export": """
+            SELECT players.name, player_stock.persona_id
+            FROM player_stock
+            JOIN players ON players.id = player_stock.player_id
+            ORDER BY player_stock.player_id, player_stock.persona_id
+        """,
+        "import": [
+            ("INSERT INTO players (name) SELECT ? "
+             "WHERE NOT EXISTS (SELECT 1 FROM players WHERE name = ?)",
+             lambda row: (row[0], row[0])),
+            ("INSERT OR IGNORE INTO player_stock (player_id, persona_id) SELECT id, ? FROM players WHERE name = ?",
+             lambda row: (row[1], row[0])),
+        ],
+        "replace": ("DELETE FROM player_stock",),
+    },
+}
+
+
+def detect_format(path, file_format=None):
+    """Return the file format, from file_format or else the path's extension."""
+    if file_format:
+        return file_format
+    if path.endswith(".csv"):
+        return "csv"
+    if path.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of '{path}', pass --format ({' or '.join(FORMATS)}).")
+
+
+def read_rows(lines, table, file_format):
+    """
+    Yield the rows of an import file one at a time, as typed tuples.
+
+    :param lines: An open text file (or any iterable of lines).
+    :param table: Name of the table the rows are for (str).
+    :param file_format: 'csv' (with a header line) or 'jsonl' (one object per line).
+    """
+    columns = TABLES[table]["columns"]
+    names = [name for name, _ in columns]
+    if file_format == "csv":
+        records = csv.DictReader(lines)
+        missing = set(names) - set(records.fieldnames or ())
+        if missing:
+            raise ValueError(f"The CSV header is missing column(s): {', '.join(sorted(missing))}.")
+        numbered = enumerate(records, start=2)
+    else:
+        numbered = ((number, json.loads(line)) for number, line in enumerate(lines, start=1) if line.strip())
+
+    for line_number, record in numbered:
+        try:
+            yield tuple(convert(record[name]) for name, convert in columns)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Line {line_number}: bad {table} row {record!r} ({e}).") from None
+
+
+def import_rows(db_name, table, rows, replace=False, chunk_size=CHUNK_SIZE):
+    """
+    Load rows into a table in one transaction, chunk by chunk.
+
+    :param db_name: Name of the database file (str).
+    :param table: One of the TABLES names (str).
+    :param rows: Iterable of row tuples, e.g. from read_rows(). It is only
+                 consumed chunk_size rows at a time.
+    :param replace: Empty the table first (bool). For ownership that empties
+                    every stock; for players it empties their stocks too.
+    :param chunk_size: Rows per executemany() call (int).
+    :return: The number of rows imported (int).
+    """
+    spec = TABLES[table]
+    rows = iter(rows)
+    count = 0
+    with transaction(db_name) as conn:
+        if replace:
+            for sql in spec["replace"]:
+                conn.execute(sql)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            for sql, parameters in spec["import"]:
+                conn.executemany(sql, map(parameters, chunk))
+            count += len(chunk)
+    if table in ("arcanas", "personas"):
+        invalidate_compendium(db_name)
+    return count
+
+
+def export_rows(db_name, table, out, file_format):
+    """
+    Write a table to out, streaming rows from the cursor.
+
+    :return: The number of rows exported (int).
+    """
+    spec = TABLES[table]
+    names = [name for name, _ in spec["columns"]]
+    cursor = get_connection(db_name).cursor()
+    cursor.arraysize = CHUNK_SIZE
+    cursor.execute(spec["export"])
+
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(names)
+        while rows := cursor.fetchmany():
+            writer.writerows(rows)
+            count += len(rows)
+    else:
+        while rows := cursor.fetchmany():
+            out.writelines(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+
+def import_file(db_name, table, path, file_format=None, replace=False, chunk_size=CHUNK_SIZE):
+    """Import a CSV or JSON Lines file ('-' for stdin) into a table and return the row count."""
+    file_format = detect_format(path, file_format)
+    migrate(db_name)
+    if path == "-":
+        return import_rows(db_name, table, read_rows(sys.stdin, table, file_format), replace, chunk_size)
+    with open(path, newline="") as source:
+        return import_rows(db_name, table, read_rows(source, table, file_format), replace, chunk_size)
+
+
+def export_file(db_name, table, path, file_format=None):
+    """Export a table to a CSV or JSON Lines file ('-' for stdout) and return the row count."""
+    file_format = detect_format(path, file_format)
+    if path == "-":
+        return export_rows(db_name, table, sys.stdout, file_format)
+    with open(path, "w", newline="") as target:
+        return export_rows(db_name, table, target, file_format)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export Velvet Room tables as CSV or JSON Lines.")
+    parser.add_argument("direction", choices=("import", "export"))
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="file to read or write, '-' for stdin/stdout")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database file (default: %(default)s)")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: from the extension)")
+    parser.add_argument("--replace", action="store_true",
+                        help="on import, empty the table first (ownership and players also clear every stock)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per batch on import")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.direction == "import":
+            count = import_file(args.db, args.table, args.path, args.format, args.replace, args.chunk_size)
+            print(f"Imported {count} {args.table} row(s).", file=sys.stderr)
+        else:
+            count = export_file(args.db, args.table, args.path, args.format)
+            print(f"Exported {count} {args.table} row(s).", file=sys.stderr)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()